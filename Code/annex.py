@@ -13,8 +13,12 @@ import numpy as np; np.seterr(all='raise')
 import sys
 import time
 import re
+import random
+import math
+import zlib
 
-from functools import partial
+from functools import partial, wraps
+from contextlib import contextmanager
 from calendar import monthrange
 from dateutil.relativedelta import relativedelta
 from collections import OrderedDict
@@ -460,6 +464,20 @@ def getInputInt(text='', default=False):
 
     return result
 
+def getInputFloat(text='', default=False):
+    """reads input float value from user"""
+    value = raw_input(text)
+    try:
+        result= float(value)
+    except ValueError:
+        if default is not False:
+            print "No value or value error. Return default value %s" % default
+            result = default
+        else:
+            raise ValueError("No value or value error")
+
+    return result
+
 def getInputComment(text='Please input comment for current simulation: ', default='w/o comment' ):
     """reads comment text from user input"""
     value = raw_input(text)
@@ -474,6 +492,108 @@ def getOnlyDigits(obj):
     new_obj = obj.values()
     return  getOnlyDigitsList(new_obj)
 
+antithetic = False  # random shocks of current iteration are mirrored (antithetic variates, see setAntithetic)
+
+def setAntithetic(value):
+    """Switches mirroring of random shocks (prices, weather, failures) for current iteration"""
+    global antithetic
+    antithetic = value
+
+importance_sampling = False  # random values of current iteration are tilted toward adverse outcomes (see setImportanceSampling)
+log_likelihood_ratios = {}  # log likelihood ratios of tilted draws of current iteration, dict[name of random value] = value
+
+def setImportanceSampling(value):
+    """Switches tilting of random values toward adverse outcomes (importance sampling) for current iteration,
+    likelihood ratios of its tilted draws are collected to new dict (see getLikelihoodRatio)"""
+    global importance_sampling
+    importance_sampling = value
+    setLikelihoodRatios({})
+
+def setLikelihoodRatios(ratios):
+    """Sets dict @ratios where log likelihood ratios of following tilted draws are collected
+    (vectorized engine switches dicts of iterations of block)"""
+    global log_likelihood_ratios
+    log_likelihood_ratios = ratios
+
+def addLogLikelihoodRatio(name, value, replace=False):
+    """Adds log likelihood ratio (original / tilted density) @value of tilted draw of random value @name,
+    with @replace ratio of previous draw of @name is replaced (config value read again overrides previous reading)"""
+    if replace:
+        log_likelihood_ratios[name] = value
+    else:
+        log_likelihood_ratios[name] = log_likelihood_ratios.get(name, 0.0) + value
+
+def getLikelihoodRatio(ratios=None):
+    """return  likelihood ratio (weight) of iteration - product of ratios of its tilted draws
+    collected in @ratios (by default in current dict)"""
+    if ratios is None:
+        ratios = log_likelihood_ratios
+    return math.exp(sum(ratios.values()))
+
+random_streams = None  # states of random streams of current iteration, dict[name] = (numpy state, random state), None - one global stream
+random_streams_seed = None  # seed of iteration from which seeds of its streams are derived
+
+def setRandomStreams(seed):
+    """Starts random streams of iteration with @seed (see randomStream), None - all draws continue global random numbers"""
+    global random_streams, random_streams_seed
+    random_streams = {} if seed is not None else None
+    random_streams_seed = seed
+
+def hashSeed(seed, number):
+    """return  32bit seed derived from @seed and @number, for one @seed different numbers always give different seeds
+    (bijective hash), so derived seeds do not depend on machine or order of running and do not collide"""
+    x = (seed * 0x9E3779B1 + number) & 0xFFFFFFFF
+    x = ((x ^ (x >> 16)) * 0x85EBCA6B) & 0xFFFFFFFF
+    x = ((x ^ (x >> 13)) * 0xC2B2AE35) & 0xFFFFFFFF
+    return x ^ (x >> 16)
+
+@contextmanager
+def randomStream(name):
+    """Draws inside context (numpy.random and random) continue stream @name of current iteration seeded by iteration seed
+    and @name, so components (configs, weather, plants, failures, prices) have own random numbers and more or less draws
+    of one component do not shift random numbers of others (common random numbers of scenarios)"""
+    if random_streams is None:
+        yield
+        return
+    outer_states = np.random.get_state(), random.getstate()
+    if name in random_streams:
+        np.random.set_state(random_streams[name][0])
+        random.setstate(random_streams[name][1])
+    else:
+        seed = hashSeed(random_streams_seed, zlib.crc32(name) & 0xFFFFFFFF)
+        np.random.seed(seed)
+        random.seed(seed)
+    try:
+        yield
+    finally:
+        random_streams[name] = np.random.get_state(), random.getstate()
+        np.random.set_state(outer_states[0])
+        random.setstate(outer_states[1])
+
+def randomStreamed(name):
+    """Decorator - draws of function continue random stream @name (see randomStream)"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with randomStream(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def normalShock(loc=0.0, scale=1.0, size=None):
+    """Normal random value(s) as numpy.random.normal, mirrored around @loc in antithetic iteration"""
+    value = np.random.normal(loc, scale, size)
+    if antithetic:
+        return 2 * loc - value
+    return value
+
+def expovariateShock(lambd):
+    """Exponential random value as random.expovariate, in antithetic iteration from complementary uniform"""
+    u = random.random()
+    if antithetic:
+        return -math.log(max(u, 1e-300)) / lambd
+    return -math.log(1.0 - u) / lambd
+
 def getOnlyDigitsList(obj):
     """filters and gets only digit list values"""
     return  filter(lambda x :isinstance(x, Number), obj)
@@ -7,7 +7,7 @@ import matplotlib.dates as mdates
 
 from collections import OrderedDict
 from database import Database
-from constants import report_directory, BINS, CORRELLATION_FIELDS
+from constants import report_directory, BINS, CORRELLATION_FIELDS, SENSITIVITY_CONFIDENCE
 from annex import addYearlyPrefix, getResolutionStartEnd
 from itertools import izip_longest
 
@@ -261,6 +261,69 @@ def plotCorrelationTornadoChart(field_dic, simulation_id, yearly=False, country=
     pylab.show()
 
 
+def plotSobolIndicesChart(simulation_no, sensitivity, country=None):
+    """Plots bar charts of first order and total order Sobol indices of inputs with bootstrap CI,
+    one chart for each field of @sensitivity (see Simulation.addSensitivityStatsToSimulation)"""
+    names = [name.split('.')[-1] for name in sensitivity['inputs']]
+    cols, rows = getNumberColsRows(len(sensitivity['indices']))
+    fig, axeslist = pylab.subplots(ncols=cols, nrows=rows)
+    positions = numpy.arange(len(names))
+    height = 0.4
+
+    for ind, field in izip_longest(range(cols * rows), sensitivity['indices']):
+        obj = axeslist.ravel()[ind]
+        if field is None:
+            obj.set_axis_off()
+            continue
+        result = sensitivity['indices'][field]
+        for shift, order, color in [(height / 2, 'first_order', 'g'), (-height / 2, 'total_order', 'b')]:
+            values = numpy.array(result[order], dtype=float)
+            ci = numpy.array(result[order + '_ci'], dtype=float).reshape(-1, 2)
+            errors = numpy.abs(ci - values[:, None]).T  # distances of CI bounds from estimate
+            obj.barh(positions + shift, values, height, xerr=errors, align='center', color=color, ecolor='k',
+                     label=order.replace('_', ' '))
+        obj.set_yticks(positions)
+        obj.set_yticklabels(names)
+        obj.set_title("%s (%s base rows)" % (field, result['base_rows']))
+        obj.set_xlim(-0.1, 1.1)
+        obj.grid(True)
+        obj.legend(loc='lower right', fontsize='small')
+
+    fig.suptitle("%r - Simulation %s - Sobol sensitivity indices with %.0f%% CI" % (country, simulation_no, 100 * SENSITIVITY_CONFIDENCE), fontsize=14)
+    fig.subplots_adjust(left=0.15, wspace=0.6)
+    pylab.show()
+
+def plotSweepTornadoChart(simulation_no, sweep, country=None):
+    """Plots tornado charts of one-at-a-time sweep (see simulations.runAndSaveSweep) - for each field of @sweep bars from
+    mean of baseline to means with low and high value of parameters with their CI, parameters sorted by swing"""
+    cols, rows = getNumberColsRows(len(sweep['swings']))
+    fig, axeslist = pylab.subplots(ncols=cols, nrows=rows)
+
+    for ind, field in izip_longest(range(cols * rows), sweep['swings']):
+        obj = axeslist.ravel()[ind]
+        if field is None:
+            obj.set_axis_off()
+            continue
+        result = sweep['swings'][field]
+        base = result['base']
+        order = sorted(range(len(sweep['parameters'])), key=lambda i: abs(numpy.nan_to_num(result['swings'][i]['swing'])))
+        positions = numpy.arange(len(order))
+        for key, color in [('low', 'r'), ('high', 'g')]:
+            values = numpy.array([result['swings'][i][key] for i in order], dtype=float) - base
+            errors = numpy.array([result['swings'][i][key + '_ci'] for i in order], dtype=float)
+            obj.barh(positions, values, left=base, xerr=errors, align='center', color=color, ecolor='k',
+                     label="%s value" % key)
+        obj.axvline(base, color='k')
+        obj.set_yticks(positions)
+        obj.set_yticklabels(["%s [%s, %s]" % ((sweep['parameters'][i].split('.')[-1],) + tuple(sweep['values'][i])) for i in order])
+        obj.set_title(field)
+        obj.grid(True)
+        obj.legend(loc='lower right', fontsize='small')
+
+    fig.suptitle("%r - Simulation %s - One-at-a-time sweep (%s paired iterations)" % (country, simulation_no, sweep['iterations']), fontsize=14)
+    fig.subplots_adjust(left=0.2, wspace=0.8)
+    pylab.show()
+
 def getNumberColsRows(fig_count):
     if fig_count in range(0, 5):
         cols, rows = 2, 2
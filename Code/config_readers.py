@@ -8,14 +8,17 @@ import ConfigParser
 import numpy
 
 from math import exp
-from annex import addXMonths, addXYears, getReportDates, getConfigs, floatRange, getListDates, cached_property
-from config_yaml_reader import parse_yaml, get_config_value
+from annex import addXMonths, addXYears, getReportDates, getConfigs, floatRange, getListDates, cached_property, randomStreamed
+from config_yaml_reader import parse_yaml, get_config_value, get_country_values, get_random_config_value_mean
 from constants import TESTMODE
+from profiling import timed
 
 
 class MainConfig():
     """Module for reading configs from main config file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, _filename='main_config.ini'):
         """Reads main config file"""
 
@@ -104,6 +107,8 @@ class MainConfig():
 class SubsidyModuleConfigReader():
     """Module for reading Subsidy configs from file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, last_day_construction, _filename='sm_config.ini'):
         """Reads module config file"""
         _config = parse_yaml(_filename, country) #loads config to memory
@@ -123,10 +128,17 @@ class SubsidyModuleConfigReader():
     def getConfigsValues(self):
         return self.configs
 
+    def getExpectedMWhFIT(self, country, _filename='sm_config.ini'):
+        """return  expected value of random FIT"""
+        _config = get_country_values(_filename, country, silent=True)
+        return get_random_config_value_mean(get_config_value(_config, 'SUBSIDY.MWhFIT'))
+
 
 class TechnologyModuleConfigReader():
     """Module for reading Technology configs from file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, _filename='tm_config.ini'):
 
         _config = parse_yaml(_filename, country)  #loads config to memory
@@ -208,6 +220,8 @@ class TechnologyModuleConfigReader():
 class EconomicModuleConfigReader():
     """Module for reading Economic configs from file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, _filename='ecm_config.ini'):
         """Reads module config file."""
 
@@ -273,6 +287,8 @@ class EconomicModuleConfigReader():
 class EnergyModuleConfigReader():
     """Module for reading Energy configs from file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, _filename='em_config.ini'):
         _config = parse_yaml(_filename, country)
 
@@ -311,6 +327,15 @@ class EnergyModuleConfigReader():
         """Returns average daily producion of electricty per kW on given date"""
         return self.inputs[str(month)][2]
 
+    def getExpectedAvgProductionCorrection(self, country, _filename='em_config.ini'):
+        """return  expected value of product of random corrections of avg production (see randomizeAvgProductionCorrections),
+        corrections are drawn independently"""
+        _config = get_country_values(_filename, country, silent=True)
+        result = 1.0
+        for path in ['uncertainty_of_data', 'transposition_model_uncertainty', 'uncertainty_of_long_term_irradiation']:
+            result *= 1 + get_random_config_value_mean(get_config_value(_config, 'IRRADIATION_UNCERTAINTY.' + path))
+        return result
+
     def randomizeAvgProductionCorrections(self, country, _filename='em_config.ini'):
         """Randomizes parameters used in generation of avg production."""
         _config = parse_yaml(_filename, country)
@@ -326,6 +351,7 @@ class EnergyModuleConfigReader():
 class RiskModuleConfigReader():
     """Module for reading Risk configs from file"""
 
+    @timed('config')
     def __init__(self, country, _filename='rm_config.ini'):
         _config = parse_yaml(_filename, country)
 
@@ -344,6 +370,8 @@ class RiskModuleConfigReader():
 class EnviromentModuleConfigReader():
     """Module for reading Risk configs from file"""
 
+    @timed('config')
+    @randomStreamed('configs')
     def __init__(self, country, _filename='enm_config.ini'):
         _config = parse_yaml(_filename, country)
 
@@ -3,21 +3,225 @@ import numpy
 import os
 import datetime
 import yaml
-from constants import TESTMODE
+import zlib
+import annex
+from profiling import timed
+from collections import defaultdict
+from scipy.stats import norm
+from scipy.special import gamma
+from constants import TESTMODE, QMC_VALUES, QMC_DRAWS, QMC_REPLICATES, IMPORTANCE_SAMPLING_SHIFTS, SENSITIVITY_INPUTS, \
+    VECTORIZED_BLOCK_SIZE
+from sobol import SobolSequence
+
+
+QUANTILE_EPS = 1e-12  # drawn quantiles are kept in (QUANTILE_EPS, 1 - QUANTILE_EPS) when tilted
+
+files_cache = {}  # parsed yaml files of current process, dict[name] = (modification time, content)
+sampling = None  # sampling of random config values of current iteration, None - independent random draws
+sobol_sequence = None  # Sobol sequence of current process (see SobolSampling)
+config_overrides = {}  # raw values replacing values of config files in current process (see setConfigOverrides)
+
+
+class LatinHypercubeSampling():
+    """Stratified sampling of random config values over all iterations of simulation.
+    Each random value (path in config file and number of its draw in iteration) has its own column of
+    @iterations_number uniform values - one from each of equal strata in random order,
+    iteration takes value from its row. Columns depend only on @master_seed and name of value, so they are
+    the same in all workers and shards and are generated only when used."""
+
+    def __init__(self, master_seed, iterations_number):
+        self.master_seed = master_seed
+        self.iterations_number = iterations_number
+        self.columns = {}  # dict[key] = column of uniform values
+        self.iteration_no = None
+        self.draws = defaultdict(int)  # number of draws of each value in current iteration
+
+    def setIteration(self, iteration_no):
+        """Starts draws of iteration @iteration_no (1..iterations_number)"""
+        self.iteration_no = iteration_no
+        self.draws.clear()
+
+    def getUniform(self, name):
+        """return  uniform (0, 1) value of current iteration for next draw of value @name"""
+        key = "%s#%s" % (name, self.draws[name])
+        self.draws[name] += 1
+        if key not in self.columns:
+            random_state = numpy.random.RandomState([self.master_seed & 0xFFFFFFFF, zlib.crc32(key) & 0xFFFFFFFF])
+            strata = random_state.permutation(self.iterations_number)
+            self.columns[key] = (strata + random_state.uniform(size=self.iterations_number)) / self.iterations_number
+        return self.columns[key][self.iteration_no - 1]
+
+
+class SobolSampling(LatinHypercubeSampling):
+    """Randomized quasi-Monte Carlo sampling of main random config values (QMC_VALUES).
+    First QMC_DRAWS draws of each of QMC_VALUES in iteration are dimensions of Sobol sequence, iterations are split to
+    QMC_REPLICATES contiguous replicates, each replicate takes points of independently scrambled sequence
+    (error of QMC estimate is estimated from spread of replicates, see rm.calcReplicatesStatistics).
+    Other random values (and further draws) are drawn randomly. Best with replicates of 2^m iterations."""
+
+    def __init__(self, master_seed, iterations_number, replicates=QMC_REPLICATES):
+        LatinHypercubeSampling.__init__(self, master_seed, iterations_number)
+        self.replicates = min(replicates, iterations_number)
+        self.replicate_size = -(-iterations_number // self.replicates)  # ceil
+
+    def getReplicate(self, iteration_no):
+        """return  number of replicate (0..replicates-1) of iteration @iteration_no"""
+        return (iteration_no - 1) // self.replicate_size
+
+    def getUniform(self, name):
+        """return  uniform (0, 1) value of current iteration for next draw of value @name,
+        None if value is not driven by Sobol sequence (it is drawn randomly)"""
+        global sobol_sequence
+        draw_no = self.draws[name]
+        self.draws[name] += 1
+        if name not in QMC_VALUES or draw_no >= QMC_DRAWS:
+            return None
+        dimension = QMC_VALUES.index(name) * QMC_DRAWS + draw_no
+        if dimension not in self.columns:
+            if sobol_sequence is None:
+                sobol_sequence = SobolSequence(len(QMC_VALUES) * QMC_DRAWS)
+            column = []
+            for replicate in range(self.replicates):
+                size = min(self.replicate_size, self.iterations_number - replicate * self.replicate_size)
+                random_state = numpy.random.RandomState([self.master_seed & 0xFFFFFFFF, replicate, dimension])
+                column.append(sobol_sequence.getPoints(dimension, size, random_state))
+            self.columns[dimension] = numpy.concatenate(column)
+        return self.columns[dimension][self.iteration_no - 1]
+
+
+class SaltelliSampling(LatinHypercubeSampling):
+    """Sample matrices of Saltelli scheme for Sobol sensitivity indices of SENSITIVITY_INPUTS (see rm.calcSobolIndices).
+    Each base row is evaluated in matrix A, B and matrices AB_i (A with values of input i from B), iterations are in groups
+    of VECTORIZED_BLOCK_SIZE base rows in the same matrix (see get_saltelli_position), so one block of vectorized engine
+    is one matrix. First QMC_DRAWS draws of input in iteration are taken from its columns of A or B (all draws of input are
+    swapped together), other values are drawn randomly. A and B are points of one scrambled Sobol sequence."""
+
+    def __init__(self, master_seed, iterations_number):
+        LatinHypercubeSampling.__init__(self, master_seed, iterations_number)
+        self.base_rows = iterations_number // (len(SENSITIVITY_INPUTS) + 2)
+        self.sequence = None
+
+    def getUniform(self, name):
+        """return  uniform (0, 1) value of current iteration for next draw of value @name,
+        None if value is not input of sensitivity analysis (it is drawn randomly)"""
+        draw_no = self.draws[name]
+        self.draws[name] += 1
+        if name not in SENSITIVITY_INPUTS or draw_no >= QMC_DRAWS:
+            return None
+        row, matrix = get_saltelli_position(self.iteration_no)
+        input_no = SENSITIVITY_INPUTS.index(name)
+        from_b = matrix == 1 or matrix == input_no + 2
+        dimension = (input_no + len(SENSITIVITY_INPUTS) * from_b) * QMC_DRAWS + draw_no
+        if dimension not in self.columns:
+            if self.sequence is None:
+                self.sequence = SobolSequence(2 * len(SENSITIVITY_INPUTS) * QMC_DRAWS)
+            random_state = numpy.random.RandomState([self.master_seed & 0xFFFFFFFF, dimension])
+            self.columns[dimension] = self.sequence.getPoints(dimension, self.base_rows, random_state)
+        return self.columns[dimension][row]
+
+
+def get_saltelli_position(iteration_no, inputs_number=len(SENSITIVITY_INPUTS), block_size=VECTORIZED_BLOCK_SIZE):
+    """return  (base row, matrix) of iteration @iteration_no in Saltelli design, matrix 0 - A, 1 - B, 2 + i - AB_i,
+    iteration_no - 1 = (group of base rows * (@inputs_number + 2) + matrix) * @block_size + row in group"""
+    group_no, row = divmod(iteration_no - 1, block_size)
+    group, matrix = divmod(group_no, inputs_number + 2)
+    return group * block_size + row, matrix
+
+
+def get_saltelli_seed_iteration(iteration_no, inputs_number=len(SENSITIVITY_INPUTS), block_size=VECTORIZED_BLOCK_SIZE):
+    """return  number of iteration whose seed (weather, prices, failures) is used by @iteration_no in Saltelli design -
+    iterations of AB matrices use seeds of iterations of A with the same base row, random numbers are one more input"""
+    group_no, row = divmod(iteration_no - 1, block_size)
+    group, matrix = divmod(group_no, inputs_number + 2)
+    if matrix == 1:
+        return iteration_no
+    return group * (inputs_number + 2) * block_size + row + 1
+
+
+SAMPLINGS = {'lhs': LatinHypercubeSampling, 'sobol': SobolSampling, 'saltelli': SaltelliSampling}  # sampling modes of config values (besides 'random')
+
+
+def setSampling(mode, master_seed=None, iterations_number=None, iteration_no=None):
+    """Sets sampling of random config values for iteration @iteration_no of simulation,
+    @mode - 'random' (independent draws), 'lhs' (see LatinHypercubeSampling), 'sobol' (see SobolSampling)
+    or 'saltelli' (see SaltelliSampling)"""
+    global sampling
+    if mode == 'random':
+        sampling = None
+        return
+    elif mode not in SAMPLINGS:
+        raise ValueError("Unknown sampling mode %r" % mode)
+    if sampling is None or (type(sampling), sampling.master_seed, sampling.iterations_number) != \
+            (SAMPLINGS[mode], master_seed, iterations_number):
+        sampling = SAMPLINGS[mode](master_seed, iterations_number)  # columns are reused by next iterations
+    sampling.setIteration(iteration_no)
+
+
+def setConfigOverrides(overrides):
+    """Sets raw values which replace values of config files in current process (all countries),
+    @overrides - dict[name] = raw value, name is config file and path to value,
+    example: {'ecm_config.ini.DEBT.interest_rate': 4, 'sm_config.ini.SUBSIDY.MWhFIT': '70, normal, 1, 0.1'}
+    random value replaced by one number is pinned (see apply_overrides) - other values keep their draws"""
+    global config_overrides
+    config_overrides = dict(overrides)
+
+
+def get_override_name(path, country):
+    """return  full name of config override (config file and path) from @path of value in config of @country,
+    example: DEBT.interest_rate -> ecm_config.ini.DEBT.interest_rate, full names are returned unchanged"""
+    names = []
+    for name in sorted(os.listdir(os.path.join(os.path.dirname(__file__), 'configs'))):
+        if path.startswith(name + '.'):
+            return path
+        data = read_file(name)
+        section = update_dict(data['DEFAULT'], data.get(country, {}))
+        for part in path.split('.'):
+            section = section.get(part) if isinstance(section, dict) else None
+        if section is not None:
+            names.append(name + '.' + path)
+    if len(names) != 1:
+        raise ValueError("Config value %r is not found or is ambiguous (%s)" % (path, ", ".join(names)))
+    return names[0]
+
+
+def apply_overrides(data, name):
+    """Replaces values of config file @name in @data (dict of one country) by values of config_overrides,
+    random value replaced by one number is pinned - 'number @ original value', original value is still drawn and
+    the number is returned (see parse_list_and_get_random), so random numbers of other values are common with run without override"""
+    for key, value in config_overrides.items():
+        if not key.startswith(name + '.'):
+            continue
+        path = key[len(name) + 1:].split('.')
+        section = data
+        for part in path[:-1]:
+            section = section.get(part) if isinstance(section, dict) else None
+        if not isinstance(section, dict) or path[-1] not in section:
+            raise ValueError("Incorrect path of config override %r" % key)
+        if ',' in str(section[path[-1]]) and ',' not in str(value):
+            section[path[-1]] = "%s @ %s" % (value, section[path[-1]])
+        else:
+            section[path[-1]] = value
 
 
 def read_file(name):
     """
     Reads yaml file, return converted dict
+    file is parsed only one time per process while it is not modified
     """
     config_file = os.path.join(os.path.dirname(__file__), 'configs', name)
+    mtime = os.path.getmtime(config_file)
+    cached = files_cache.get(name)
+    if cached is not None and cached[0] == mtime:
+        return deepcopy(cached[1])
+
     try:
         content = yaml.load(open(config_file))
     except Exception as e:
         print "Error while parsing YAML file '%s'. Please check it's content!" % name
         raise
     else:
-        return content
+        files_cache[name] = (mtime, content)
+        return deepcopy(content)
 
 
 def update_dict(orig_dict, new_dict):
@@ -37,6 +241,7 @@ def update_dict(orig_dict, new_dict):
     return orig_dict
 
 
+@timed('config')
 def get_country_values(name, country, silent):
     """
     get country config from file @name using key @country
@@ -45,15 +250,57 @@ def get_country_values(name, country, silent):
     data = read_file(name)
     default_data = data['DEFAULT']
     if country in data:
-        country_data = data[country]
-        return update_dict(default_data, country_data)
-
+        default_data = update_dict(default_data, data[country])
+    apply_overrides(default_data, name)
     return default_data
 
 
-def parse_list_and_get_random(values, value_type=int):
+def distribution_cdf(distribution_type, parameters, value):
+    """return  quantile (0..1) of @value in distribution with @parameters (without average multiplier)"""
+    if distribution_type == 'normal':
+        return norm.cdf(value, loc=parameters[0], scale=parameters[1])
+    elif distribution_type == 'linear':
+        low, high = parameters
+        return (value - low) / (high - low)
+    elif distribution_type == 'weibull':
+        return -numpy.expm1(-value ** parameters[0])
+    elif distribution_type == 'triangular':
+        left_min, right_max, mode_peak = parameters
+        if value < mode_peak:
+            return (value - left_min) ** 2 / ((right_max - left_min) * (mode_peak - left_min))
+        return 1 - (right_max - value) ** 2 / ((right_max - left_min) * (right_max - mode_peak))
+
+
+def distribution_ppf(distribution_type, parameters, u):
+    """return  value of distribution with @parameters (without average multiplier) at quantile @u (0..1)"""
+    if distribution_type == 'normal':
+        return norm.ppf(u, loc=parameters[0], scale=parameters[1])
+    elif distribution_type == 'linear':
+        low, high = parameters
+        return low + u * (high - low)
+    elif distribution_type == 'weibull':
+        return (-numpy.log1p(-u)) ** (1 / parameters[0])
+    elif distribution_type == 'triangular':
+        left_min, right_max, mode_peak = parameters
+        if u < (mode_peak - left_min) / (right_max - left_min):
+            return left_min + numpy.sqrt(u * (right_max - left_min) * (mode_peak - left_min))
+        return right_max - numpy.sqrt((1 - u) * (right_max - left_min) * (right_max - mode_peak))
+
+
+def tilt_quantile(u, shift):
+    """return  quantile @u with normal score moved by @shift (importance sampling, see IMPORTANCE_SAMPLING_SHIFTS)
+    and log likelihood ratio of original and tilted distribution of returned quantile"""
+    z = norm.ppf(min(max(u, QUANTILE_EPS), 1 - QUANTILE_EPS)) + shift
+    return min(max(norm.cdf(z), QUANTILE_EPS), 1 - QUANTILE_EPS), shift * shift / 2 - shift * z
+
+
+def parse_list_and_get_random(values, value_type=int, name=None):
     """
     Parses input
+    @name - name of value (file and path) for sampling, without name value is drawn independently
+    pinned value 'number @ values' (see apply_overrides) - values are drawn as usual and the number is returned
+    in antithetic iteration (see annex.setAntithetic) drawn value is replaced by value at complementary quantile
+    with importance sampling (see annex.setImportanceSampling) quantile of values in IMPORTANCE_SAMPLING_SHIFTS is tilted
     if one value - return it
     if three or more
       first val - average
@@ -67,6 +314,11 @@ def parse_list_and_get_random(values, value_type=int):
          1000, weibull, 10  -- lambda -first and k - last
          1000, triangular, 0.8, 1.5, 1.1  - min, max, peak
     """
+    if '@' in values:
+        pinned_value, values = values.split('@')
+        parse_list_and_get_random(values, value_type, name)  # keeps random numbers of next values
+        return value_type(float(pinned_value))
+
     list_values = values.split(',')
     len_values = len(list_values)
 
@@ -74,41 +326,82 @@ def parse_list_and_get_random(values, value_type=int):
         return value_type(list_values[0])
     else:  # probabilistic distribution
         average, distribution_type = float(list_values[0]), list_values[1].strip()
-        distribution_parameters = list_values[2:]
+        distribution_parameters = map(float, list_values[2:])
         if distribution_type == 'normal':
             assert len(distribution_parameters) == 2, "Parameters should be 2 - mean and stdev"
-            mean, stdev = float(distribution_parameters[0]), float(distribution_parameters[1])
-            value = numpy.random.normal(loc=mean, scale=stdev)
         elif distribution_type == 'linear':
             assert len(distribution_parameters) == 2, "Parameters should be 2 - min and max"
-            low, high = distribution_parameters
-            value = numpy.random.uniform(low=low, high=high)
         elif distribution_type == 'weibull':
             assert len(distribution_parameters) == 1, "Parameters should be 1 - k"
-            k_shape = float(distribution_parameters[0])
-            value = numpy.random.weibull(a=k_shape)
         elif distribution_type == 'triangular':
             assert len(distribution_parameters) == 3, "Parameters should be 2 - min, max, peak"
-            left_min, right_max, mode_peak = map(float, distribution_parameters)
-            value = numpy.random.triangular(left=left_min, mode=mode_peak, right=right_max)
         else:
             raise ValueError("Unknown distribution type %r" % distribution_type)
 
+        u = sampling.getUniform(name) if sampling is not None and name is not None else None  # sampled quantile
+        if u is None:
+            if distribution_type == 'normal':
+                mean, stdev = distribution_parameters
+                value = numpy.random.normal(loc=mean, scale=stdev)
+            elif distribution_type == 'linear':
+                low, high = distribution_parameters
+                value = numpy.random.uniform(low=low, high=high)
+            elif distribution_type == 'weibull':
+                value = numpy.random.weibull(a=distribution_parameters[0])
+            else:
+                left_min, right_max, mode_peak = distribution_parameters
+                value = numpy.random.triangular(left=left_min, mode=mode_peak, right=right_max)
+            if annex.antithetic:  # mirrored iteration - the same draw at complementary quantile
+                u = 1 - distribution_cdf(distribution_type, distribution_parameters, value)
+        if annex.importance_sampling and name in IMPORTANCE_SAMPLING_SHIFTS:
+            if u is None:
+                u = distribution_cdf(distribution_type, distribution_parameters, value)
+            u, log_ratio = tilt_quantile(u, IMPORTANCE_SAMPLING_SHIFTS[name])
+            annex.addLogLikelihoodRatio(name, log_ratio, replace=True)
+        if u is not None:
+            value = distribution_ppf(distribution_type, distribution_parameters, u)
+
         if TESTMODE:
             value = 1
 
         return value_type(average * value)
 
 
-def get_random_config_value(value, value_type='guess'):
+def get_random_config_value_mean(value):
+    """
+    return  expected value of not parsed (raw) config value - average multiplied by mean of its distribution
+    (see parse_list_and_get_random), not random and pinned values are returned as float
+    """
+    if '@' in str(value):
+        return float(str(value).split('@')[0])
+    list_values = str(value).split(',')
+    if len(list_values) == 1:
+        return float(list_values[0])
+    average, distribution_type = float(list_values[0]), list_values[1].strip()
+    distribution_parameters = map(float, list_values[2:])
+    if distribution_type == 'normal':
+        mean = distribution_parameters[0]
+    elif distribution_type == 'linear':
+        mean = sum(distribution_parameters) / 2
+    elif distribution_type == 'weibull':
+        mean = gamma(1 + 1 / distribution_parameters[0])
+    elif distribution_type == 'triangular':
+        mean = sum(distribution_parameters) / 3
+    else:
+        raise ValueError("Unknown distribution type %r" % distribution_type)
+    return average * mean
+
+
+def get_random_config_value(value, value_type='guess', name=None):
     """
     get random value for from,to
     or return original value
+    @name - name of value for sampling (see parse_list_and_get_random)
     """
 
     if value_type == 'guess':
         clean_value = value.replace('normal', '').replace('linear', '').\
-            replace('weibull', '').replace('triangular', '')
+            replace('weibull', '').replace('triangular', '').replace('@', ',')
         if '.' in clean_value:
             if clean_value.replace(' ', '').replace('.', '').replace(',', '').replace('-', '').isdigit():
                 value_type = float
@@ -120,25 +413,26 @@ def get_random_config_value(value, value_type='guess'):
     if value_type == str:
         return value
     elif value_type in (int, float):
-        return parse_list_and_get_random(value, value_type=value_type)
+        return parse_list_and_get_random(value, value_type=value_type, name=name)
 
 
-def parse(dic):
+def parse(dic, path=''):
     """
     parse config dict , convert all values to our format
+    @path - name of config file and path to @dic in it (name of random values for sampling)
     """
     result = deepcopy(dic)
     for key, value in dic.items():
         if isinstance(value, (str, int, float)):
-            result[key] = get_random_config_value(str(value))
+            result[key] = get_random_config_value(str(value), name="%s.%s" % (path, key))
         else:
-            result[key] = parse(value)
+            result[key] = parse(value, "%s.%s" % (path, key))
     return result
 
 
 def parse_yaml(name, country, silent=False):
     config_dict = get_country_values(name, country, silent)
-    parsed_config_dict = parse(config_dict)
+    parsed_config_dict = parse(config_dict, name)
     return parsed_config_dict
 
 
@@ -181,6 +475,18 @@ def get_config_value(dic, path, type_format=None):
     return apply_format(result, type_format)
 
 
+def get_random_config_values(dic, path, size, type_format=None, name=None):
+    """
+    Draw @size independent values of the not parsed (raw) config value at @path,
+    the same way parse_yaml would draw it on every reading of config file
+    @name - name of config file, with name values are sampled (when sampling is set) as draws of one iteration
+    """
+    raw_value = str(get_config_value(dic, path))
+    if name is not None:
+        name = "%s.%s" % (name, path)
+    return [apply_format(get_random_config_value(raw_value, name=name), type_format) for _ in xrange(size)]
+
+
 if __name__ == '__main__':
     config = parse_yaml('em_config.ini', 'ITALY')
     print get_config_value(config, 'INPUTS', dict)
\ No newline at end of file
@@ -71,8 +71,151 @@ IRR_REPORT_FIELDS = ['irr_project_y', 'irr_owners_y', 'irr_project_before_tax_y'
 NPV_REPORT_FIELD = 'npv_project_y'
 
 TEP_REPORT_FIELDS = ["total_energy_produced", "system_not_working", "electricity_production_2ndyear", "total_power"]
+RESULTS_NPV_FIELDS = ['npv_project', 'npv_owners', 'npv_project_y', 'npv_owners_y']
+CONTROL_VARIATE_FIELDS = ['weather_shock', 'price_shock', 'fit_shock']  # random shocks of iteration with known mean, used as control variates
+CONTROL_VARIATE_MEANS = [0.0, 0.0, 0.0]  # known means of CONTROL_VARIATE_FIELDS
+RESULTS_FIELDS = IRR_REPORT_FIELDS + TEP_REPORT_FIELDS + RESULTS_NPV_FIELDS + CONTROL_VARIATE_FIELDS  # columns of shared results buffer, one row per iteration
 
 REPORT_DEFAULT_NUMBER_ITERATIONS = 1000
+VECTORIZED_BLOCK_SIZE = 50  # number of iterations calculated together by vectorized engine
+STAGE_CACHE_PATH = '~/data/mirr_stage_cache'  # results of stages of vectorized engine (weather, prices, plants, production)
+stage_cache_directory = os.path.expanduser(os.path.normpath(STAGE_CACHE_PATH))
+STAGE_CACHE_MAX_SIZE = 4096  # MB, least recently used stages are deleted when cache is bigger
+STAGE_CACHE_MODULES = ['vectorized_engine', 'config_readers', 'config_yaml_reader', 'em', 'tm_equipment', 'annex', 'constants']  # source of stages, its change invalidates cache
+
+WORKERS_NUMBER = None  # number of processes in pool of workers, None - 3 * number of CPUs
+ITERATIONS_CHUNK_SIZE = None  # number of iterations sent to worker at once, None - chosen by number of iterations and workers
+WORKER_MAX_TASKS = 100  # worker is replaced with new process after so many tasks (chunks)
+WORKER_MAX_MEMORY = 2048  # MB, if worker used more memory - pool is replaced with new workers before next run
+RESULTS_BUFFER_MIN_ROWS = 10000  # min number of rows (iterations) of shared results buffer of pool of workers
+MASTER_SEED_MAX = 2**31 - 1  # max of random master seed of simulation
+
+ITERATIONS_WRITE_BATCH_SIZE = 50  # number of iterations lines inserted to db at once
+ITERATIONS_WRITE_FLUSH_INTERVAL = 10  # seconds, buffered iterations lines are written at least so often
+ITERATIONS_WRITE_CONCERN = 1  # acknowledgement of iterations inserts (w): 0 - none, 1 - acknowledged, 'majority'
+ITERATIONS_WRITE_QUEUE_SIZE = 1000  # max number of iterations lines waiting for background writer, results loop waits when queue is full
+ITERATIONS_WRITE_RETRIES = 5  # repeated inserts of iterations lines after transient db errors (lost connection, timeout)
+ITERATIONS_WRITE_RETRY_DELAY = 0.5  # seconds before first repeated insert, doubled for next ones
+
+METRICS_PATH = '~/data/mirr_metrics'  # snapshot of metrics of running simulation (metrics.json, metrics.prom) for monitoring
+metrics_directory = os.path.expanduser(os.path.normpath(METRICS_PATH))
+METRICS_FORMATS = ['json', 'prometheus']  # snapshot files written while simulation runs
+METRICS_PRINT_INTERVAL = 1  # seconds between updates of progress line
+METRICS_SNAPSHOT_INTERVAL = 10  # seconds between writes of snapshot files
+METRICS_RATE_WINDOW = 60  # seconds, recent iterations/sec and ETA are calculated from progress in this window
+METRICS_STALL_TIMEOUT = 600  # seconds without finished iteration after which run is reported as stalled
+
+PROFILE_PATH = '~/data/mirr_profiles'  # merged cProfile stats of sampled iterations of simulations (simulation_N.prof)
+profile_directory = os.path.expanduser(os.path.normpath(PROFILE_PATH))
+PROFILE_PRINT_FUNCTIONS = 25  # number of functions with most cumulative time printed from cProfile stats
+
+ITERATION_MONTHLY_FIELDS = ['revenue', 'revenue_electricity', 'revenue_subsidy', 'cost', 'insurance_cost', 'operational_cost',  # monthly rows of iterations lines
+    'development_cost', 'repair_costs_modules', 'repair_costs_inverters', 'ebitda', 'ebit', 'ebt', 'interest_paid', 'depreciation',
+    'tax', 'net_earning', 'investment', 'fixed_asset', 'asset', 'inventory', 'operating_receivable', 'short_term_investment',
+    'asset_bank_account', 'paid_in_capital', 'current_asset', 'unallocated_earning', 'retained_earning',
+    'financial_operating_obligation', 'long_term_loan', 'short_term_loan', 'long_term_operating_liability',
+    'short_term_debt_suppliers', 'liability', 'equity', 'control', 'report_header', 'fcf_project', 'fcf_project_before_tax',
+    'fcf_owners', 'sun_insolation', 'electricity_production', 'electricity_production_per_kW', 'electricity_prices',
+    'non_working_days', 'pv_owners', 'pv_project']
+ITERATION_YEARLY_FIELDS = [field + '_y' for field in ITERATION_MONTHLY_FIELDS]  # yearly rows of iterations lines
+ITERATION_DETAIL_FIELDS = ['project_days', 'insolations_daily', 'electricity_production_daily', 'equipment_description']  # daily series and equipment
+PERSISTENCE_PROFILES = {  # fields of iterations lines not saved to db by persistence profile of simulation
+    'full': [],
+    'monthly': ITERATION_DETAIL_FIELDS,
+    'yearly': ITERATION_DETAIL_FIELDS + ITERATION_MONTHLY_FIELDS,
+    'scalars': ITERATION_DETAIL_FIELDS + ITERATION_MONTHLY_FIELDS + ITERATION_YEARLY_FIELDS,  # irr, npv, tep, configs (sampled inputs)
+}  # 'full_sampled' - 'full' for each PERSISTENCE_SAMPLE_STEP-th iteration (1, 1 + step ...), 'scalars' for others
+PERSISTENCE_SAMPLE_STEP = 100
+PERSISTENCE_DEFAULT = 'full'
+
+STATS_SKETCH_COMPRESSION = 200  # accuracy of quantile sketch of streaming stats (number of centroids)
+STATS_PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99]  # percentiles saved to simulation stats
+STATS_VAR_LEVELS = [0.05, 0.01]  # levels of lower tail for VaR and CVaR of simulation stats
+STATS_VALUES_MAX_ITERATIONS = 100000  # simulations with more iterations do not keep values in memory, stats are streamed
+STATS_SKETCH_POINTS = 1000  # number of quantiles saved instead of values (for charts) when stats are streamed
+
+CONVERGENCE_WAVE_SIZE = 200  # number of iterations run between checks of convergence
+CONVERGENCE_MAX_ITERATIONS = 20000  # hard cap of iterations for simulation running until convergence
+CONVERGENCE_QUANTILES = [0.05, 0.5, 0.95]  # quantiles of IRR_REPORT_FIELDS tracked for convergence (besides mean)
+CONVERGENCE_Z = 1.96  # z value of confidence interval (95%)
+CONVERGENCE_TOLERANCES = {  # max half-width of confidence interval of each tracked metric, per IRR_REPORT_FIELDS field
+    'irr_project_y': 0.001,
+    'irr_owners_y': 0.002,
+    'irr_project_before_tax_y': 0.001,
+    'simple_payback_time': 0.1,
+}
+
+PAIRED_DIFFERENCE_FIELDS = ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y']  # compared between scenarios of batch
+
+QMC_VALUES = [  # random config values (config file and path) driven by Sobol sequence in 'sobol' sampling, others are drawn randomly
+    'main_config.ini.DELAYS.permit_procurement_duration',
+    'main_config.ini.DELAYS.construction_duration',
+    'sm_config.ini.SUBSIDY.MWhFIT',
+    'em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_long_term_irradiation',
+    'em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_data',
+    'em_config.ini.IRRADIATION_UNCERTAINTY.transposition_model_uncertainty',
+    'tm_config.ini.SYSTEM.modelling_error',
+    'tm_config.ini.SYSTEM.albedo_error',
+    'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y',
+]
+QMC_DRAWS = 4  # number of draws of each QMC_VALUES value in iteration which get own Sobol dimension (config is read more times)
+QMC_REPLICATES = 8  # number of independently scrambled Sobol sequences, iterations are split to them for QMC error estimate
+
+SENSITIVITY_INPUTS = QMC_VALUES  # random config values - inputs of Sobol sensitivity indices in 'saltelli' sampling, others are drawn randomly
+SENSITIVITY_FIELDS = ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y']  # results with Sobol sensitivity indices
+SENSITIVITY_BOOTSTRAP = 500  # number of bootstrap resamples of base rows for CI of Sobol indices
+SENSITIVITY_CONFIDENCE = 0.95  # confidence level of bootstrap CI of Sobol indices
+SWEEP_FIELDS = ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y']  # results with swings of one-at-a-time sweep
+PORTFOLIO_PLANT_FIELDS = ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y', 'total_energy_produced']  # results of each plant saved in iterations of portfolio
+SWEEP_ITERATIONS = 100  # iterations of each low/high run of sweep, paired with the same iterations of baseline (common random numbers)
+
+IMPORTANCE_SAMPLING_SHIFTS = OrderedDict([  # random config values tilted toward adverse outcomes in importance sampling - shift of normal score of drawn quantile (negative - lower values)
+    ('main_config.ini.DELAYS.permit_procurement_duration', 0.1),  # shifts are near mean normal scores of values in lowest percents of IRR,
+    ('main_config.ini.DELAYS.construction_duration', 0.1),  # bigger shifts of weak drivers of IRR only spread weights
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_long_term_irradiation', -0.2),
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_data', -0.2),
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.transposition_model_uncertainty', -0.2),
+    ('ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y', -1.5),
+])
+IMPORTANCE_SAMPLING_FAILURE_RATES = {'inverter': 1.1, 'transformer': 1.1}  # multiplier of failure rate (1 / MTBDE) of equipment types (see tm_equipment.EQ) in importance sampling
+IMPORTANCE_SAMPLING_FIELDS = ['irr_project_y', 'irr_owners_y']  # IRR_REPORT_FIELDS with weighted tail stats of importance sampling
+IMPORTANCE_SAMPLING_HURDLES = [0.0, 0.02, 0.04]  # IRR hurdles for estimates of probability P(IRR < hurdle)
+IMPORTANCE_SAMPLING_PERCENTILES = [1, 5, 10]  # low percentiles of IRR estimated by importance sampling
+
+SURROGATE_INPUTS = [  # inputs of surrogate model - (config value - config file and path, saved field of iteration, saved value / config value)
+    ('main_config.ini.DELAYS.permit_procurement_duration', 'main_configs.real_permit_procurement_duration', 1),
+    ('main_config.ini.DELAYS.construction_duration', 'main_configs.real_construction_duration', 1),
+    ('sm_config.ini.SUBSIDY.MWhFIT', 'sm_configs.MWhFIT', 1),
+    ('sm_config.ini.SUBSIDY.subsidy_delay', 'sm_configs.subsidy_delay', 1),
+    ('sm_config.ini.SUBSIDY.subsidy_duration', 'sm_configs.subsidy_duration', 1),
+    ('ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y', 'price_drift', 1),
+    ('ecm_config.ini.TAXES.tax_rate', 'ecm_configs.tax_rate', 0.01),
+    ('ecm_config.ini.DEBT.debt_share', 'ecm_configs.debt_share', 0.01),
+    ('ecm_config.ini.DEBT.interest_rate', 'ecm_configs.debt_rate', 0.01),
+    ('ecm_config.ini.COSTS.administrativeCosts', 'ecm_configs.administrativeCosts', 1),
+    ('ecm_config.ini.COSTS.administrativeCostsGrowth_rate', 'ecm_configs.administrativeCostsGrowth_rate', 0.01),
+    ('ecm_config.ini.COSTS.insuranceFeeEquipment', 'ecm_configs.insuranceFeeEquipment', 0.01),
+    ('ecm_config.ini.COSTS.developmentCostDuringPermitProcurement', 'ecm_configs.developmentCostDuringPermitProcurement', 1),
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_long_term_irradiation', 'em_configs.long_term_irradiation_uncertainty', 1),
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.uncertainty_of_data', 'em_configs.data_uncertainty', 1),
+    ('em_config.ini.IRRADIATION_UNCERTAINTY.transposition_model_uncertainty', 'em_configs.transposition_model_uncertainty', 1),
+    ('tm_config.ini.SYSTEM.modelling_error', 'tm_configs.modelling_error', 1),
+    ('tm_config.ini.SOLAR_MODULE.PV_degradation_rate', 'tm_configs.degradation_yearly', 0.01),
+    ('tm_config.ini.SOLAR_MODULE.price', 'tm_configs.module_price', 1),
+    ('tm_config.ini.INVERTER.price', 'tm_configs.inverter_price', 1),
+    ('tm_config.ini.INVERTER.power_losses', 'tm_configs.inverter_power_losses', 0.01),
+    ('tm_config.ini.GRID.price', 'tm_configs.grid_price', 1),
+    ('tm_config.ini.ADDITIONAL_PRICE.documentation_price', 'tm_configs.documentation_price', 1),
+    ('tm_config.ini.ADDITIONAL_PRICE.other_investment_costs', 'tm_configs.other_investment_costs', 1),
+]
+SURROGATE_FIELDS = ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y']  # results predicted by surrogate model
+SURROGATE_DEGREES = [1, 2]  # total degrees of polynomial chaos (Hermite polynomials of standardized inputs) tried when fitting
+SURROGATE_RIDGES = [1e-4, 1e-2, 1]  # ridge penalties of coefficients (relative to number of iterations) tried when fitting
+SURROGATE_MIN_STD = 1e-9  # inputs with smaller relative std are constant in simulation, settings of them are out of domain
+SURROGATE_VALIDATION_SHARE = 0.2  # share of iterations held out for R2 of surrogate model
+SURROGATE_SAMPLE_SIZE = 2000  # saved rows of inputs, predictions are made over them (other inputs keep their distribution)
+SURROGATE_RESIDUAL_POINTS = 200  # saved quantiles of residuals, added to predictions (effect of weather, prices and failures)
+SURROGATE_FALLBACK_ITERATIONS = 200  # iterations run with vectorized engine when settings are out of domain of surrogate model
 
 CORRELLATION_FIELDS = OrderedDict() # IRR ONE SHOULD HAVE NAME =IRR and be FIRST ONE
 CORRELLATION_FIELDS["permit_procurement_duration"] = "main_configs.real_permit_procurement_duration"
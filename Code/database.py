@@ -1,9 +1,15 @@
 import sys
+import time
+import threading
+import Queue
 import numpy
 import pymongo
 from collections import defaultdict
+from pymongo.write_concern import WriteConcern
 from annex import addYearlyPrefix, convertDictDates
-from constants import CORRELLATION_FIELDS
+from constants import CORRELLATION_FIELDS, ITERATIONS_WRITE_BATCH_SIZE, ITERATIONS_WRITE_FLUSH_INTERVAL, \
+    ITERATIONS_WRITE_CONCERN, ITERATIONS_WRITE_QUEUE_SIZE, ITERATIONS_WRITE_RETRIES, ITERATIONS_WRITE_RETRY_DELAY, \
+    RESULTS_NPV_FIELDS
 
 try:
     connection = pymongo.MongoClient()
@@ -11,30 +17,192 @@ except pymongo.errors.ConnectionFailure as exc:
     raise ValueError("Please run MONGO SERVER: %s" % exc)
 
 
+def reconnect():
+    """Opens new connection to db for current process (used in workers of pool,
+    connection opened before fork should not be used in child processes)"""
+    global connection
+    connection = pymongo.MongoClient()
+    Database.indexes_added = False
+
+
+class BufferedWriter():
+    """Collects documents and inserts them to db collection with bulk inserts"""
+
+    def __init__(self, collection, batch_size, flush_interval, write_concern, retries=ITERATIONS_WRITE_RETRIES,
+                 retry_delay=ITERATIONS_WRITE_RETRY_DELAY):
+        """@batch_size - number of documents inserted at once
+        @flush_interval - seconds, buffer is flushed if last flush was earlier
+        @write_concern - acknowledgement level (w) of inserts: 0 - unacknowledged, 1 - acknowledged, 'majority' ...
+        @retries - number of repeated inserts after transient error (lost connection, timeout),
+        @retry_delay - seconds before first repeated insert, doubled for next ones"""
+        self.collection = collection.with_options(write_concern=WriteConcern(w=write_concern))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.buffer = []
+        self.last_flush = time.time()
+        self.inserted = 0  # number of documents written to db
+        self.writes = 0  # number of bulk inserts
+        self.write_time = 0.0  # seconds of all bulk inserts (with retries)
+        self.max_write_time = 0.0
+        self.retried = 0  # number of repeated inserts
+
+    def insert(self, doc):
+        """Adds @doc to buffer, writes buffer to db if it is full or flush interval passed"""
+        self.buffer.append(doc)
+        if len(self.buffer) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered documents to db"""
+        if self.buffer:
+            start_time = time.time()
+            self.insertMany(self.buffer)
+            write_time = time.time() - start_time
+            self.writes += 1
+            self.write_time += write_time
+            self.max_write_time = max(self.max_write_time, write_time)
+            self.inserted += len(self.buffer)
+            self.buffer = []
+        self.last_flush = time.time()
+
+    def getStats(self):
+        """return  dict with numbers and durations of writes (for metrics of run)"""
+        return {'inserted': self.inserted, 'writes': self.writes, 'write_time': self.write_time,
+                'max_write_time': self.max_write_time, 'retries': self.retried, 'queued': len(self.buffer)}
+
+    def insertMany(self, docs):
+        """Inserts @docs, repeats insert after transient errors, documents inserted before error get
+        duplicate key errors in repeated insert (their _id is set by first insert) - they are skipped"""
+        for attempt in range(self.retries + 1):
+            try:
+                self.collection.insert_many(docs, ordered=False)
+                return
+            except pymongo.errors.BulkWriteError as exc:
+                if attempt == 0 or any(error['code'] != 11000 for error in exc.details['writeErrors']):
+                    raise
+                return  # rest of documents is inserted
+            except pymongo.errors.ConnectionFailure:  # also AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+
+class AsyncWriter():
+    """Writes documents with BufferedWriter in background thread, insert only puts document to bounded queue,
+    so producer (results loop of simulation) does not wait for db - only when queue is full (backpressure).
+    Error of writing is raised by next insert or flush (not written iterations can be run by resuming simulation)."""
+
+    FLUSH = object()  # queue item - write buffer to db
+    STOP = object()  # queue item - write buffer and stop thread
+
+    def __init__(self, writer, queue_size=ITERATIONS_WRITE_QUEUE_SIZE):
+        """@writer - BufferedWriter used by thread, @queue_size - max number of documents waiting for thread"""
+        self.writer = writer
+        self.queue = Queue.Queue(queue_size)
+        self.thread = None  # started with first document (after workers are forked)
+        self.error = None
+
+    @property
+    def inserted(self):
+        """return  number of documents written to db"""
+        return self.writer.inserted
+
+    def getStats(self):
+        """return  stats of writes (see BufferedWriter.getStats), 'queued' includes documents waiting in queue"""
+        stats = dict(self.writer.getStats())
+        stats['queued'] += self.queue.qsize()
+        return stats
+
+    def insert(self, doc):
+        """Adds @doc to queue of writer thread, waits if queue is full"""
+        self.checkError()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="AsyncWriter")
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(doc)
+
+    def flush(self):
+        """Waits until all queued documents are written to db (drain)"""
+        if self.thread is not None:
+            self.queue.put(self.FLUSH)
+            self.queue.join()
+        self.checkError()
+
+    def close(self):
+        """Writes all queued documents and stops writer thread (new thread is started by next insert)"""
+        if self.thread is not None:
+            self.queue.put(self.STOP)
+            self.thread.join()
+            self.thread = None
+        self.checkError()
+
+    def checkError(self):
+        """Raises error of writer thread"""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        """Loop of writer thread - writes queued documents, buffer is flushed also when queue is idle for flush interval"""
+        while True:
+            try:
+                doc, queued = self.queue.get(timeout=self.writer.flush_interval), True
+            except Queue.Empty:
+                doc, queued = self.FLUSH, False
+            try:
+                if self.error is not None:  # documents are dropped until error is raised to producer
+                    self.writer.buffer = []
+                elif doc is self.FLUSH or doc is self.STOP:
+                    self.writer.flush()
+                else:
+                    self.writer.insert(doc)
+            except Exception as exc:
+                self.error = exc
+                self.writer.buffer = []
+            if queued:
+                self.queue.task_done()  # after writing - flush waits for it
+            if doc is self.STOP:
+                return
+
+
 class Database():
-    def __init__(self):
-        """Class for connection to MongoDatabase"""
-        self.db = self.getConnection()  #get connection to DB
+    indexes_added = False  # indexes are created only one time per connection
+
+    def __init__(self, host=None):
+        """Class for connection to MongoDatabase
+        @host - mongo host (or uri) of other database, for example with shard of simulation, by default local database"""
+        self.db = self.getConnection(host)  #get connection to DB
         self.simulation_numbers = self.db['simulation_numbers']  #table simulation_numbers
         self.simulations = self.db['simulations']                #table simulations
         self.iterations = self.db['iterations']                  #table iterations
         self.weater_data = self.db['weater_data']                #table weather data
         self.electricity_prices = self.db['electricity_prices']  #table electrictity prices
+        self.surrogates = self.db['surrogates']                  #table surrogate models of simulations
         self.addIndexes()  # indexes for speed
 
-    def getConnection(self):
+    def getConnection(self, host=None):
         """get connection to db"""
+        if host is not None:
+            return pymongo.MongoClient(host)['MirrDatabase']
         return connection['MirrDatabase']
 
     def addIndexes(self):
         """add indexed to database"""
+        if Database.indexes_added:
+            return
         self.iterations.create_index("iteration"),
         self.iterations.create_index("simulation"),
         self.simulations.ensure_index("simulation")
+        Database.indexes_added = True
 
     def deleteSimulation(self, simulation_no ):
         """Deletes selected simulation with @simulation_no"""
         self.simulations.remove({"simulation": simulation_no})  #removes data with simulation no from table with simulations
+        self.surrogates.remove({"simulation": simulation_no})
         self.iterations.remove({"simulation": simulation_no})  #removes data with simulation no from table with iterations
         print "Succesfully deleted simulation %s" % simulation_no
         if simulation_no == self.getLastSimulationNo():
@@ -44,10 +212,53 @@ class Database():
         """Safe inserts simulation line to DB"""
         self.simulations.insert(record, safe=True)
 
+    def updateSimulation(self, record):
+        """Safe updates simulation line in DB"""
+        self.simulations.update({'simulation': record['simulation']}, record, safe=True)
+
+    def getSimulationRecord(self, simulation_no):
+        """return  simulation line from DB"""
+        record = self.simulations.find_one({'simulation': simulation_no})
+        if record is None:
+            raise ValueError('No simulation %r in database' % simulation_no)
+        return record
+
+    def getIterationsNumbers(self, simulation_no):
+        """return  numbers of saved iterations of @simulation_no"""
+        return [doc['iteration'] for doc in self.iterations.find({'simulation': simulation_no}, {'iteration': 1})]
+
+    def getIterationsResults(self, simulation_no):
+        """return  list with irr and tep values (field results) of all saved iterations of @simulation_no"""
+        docs = self.iterations.find({'simulation': simulation_no}, {'results': 1}).sort('iteration')
+        return [doc['results'] for doc in docs]
+
+    def getIterationsControlVariates(self, simulation_no):
+        """return  list with control variates (see CONTROL_VARIATE_FIELDS) of all saved iterations of @simulation_no,
+        None for iterations saved without them"""
+        docs = self.iterations.find({'simulation': simulation_no}, {'control_variates': 1}).sort('iteration')
+        return [doc.get('control_variates') for doc in docs]
+
+    def getIterationsNpvs(self, simulation_no):
+        """return  list with npv values (see RESULTS_NPV_FIELDS) of all saved iterations of @simulation_no sorted by iteration,
+        values are None for iterations saved without them"""
+        docs = self.iterations.find({'simulation': simulation_no}, dict.fromkeys(RESULTS_NPV_FIELDS, 1)).sort('iteration')
+        return [[doc.get(field) for field in RESULTS_NPV_FIELDS] for doc in docs]
+
+    def getIterationsFieldsValues(self, simulation_no, fields):
+        """return  dict[iteration_no] = list of values of @fields of saved iteration of @simulation_no,
+        fields can be nested, for example sm_configs.MWhFIT"""
+        docs = self.iterations.find({'simulation': simulation_no}, dict.fromkeys(fields + ['iteration'], 1))
+        return dict((doc['iteration'], [getNestedValue(doc, field) for field in fields]) for doc in docs)
+
     def insertIteration(self,  line):
         """Safe inserts iterations line to DB"""
         self.iterations.insert(line, safe=True)
 
+    def getIterationsWriter(self):
+        """return  background writer for iterations lines (see AsyncWriter)"""
+        return AsyncWriter(BufferedWriter(self.iterations, ITERATIONS_WRITE_BATCH_SIZE, ITERATIONS_WRITE_FLUSH_INTERVAL,
+                                          ITERATIONS_WRITE_CONCERN))
+
     def getLastSimulationNo(self):
         """Get last simulation number"""
         return self.simulation_numbers.find_one('seq')['seq']
@@ -61,6 +272,11 @@ class Database():
         """return  1 field from db collection simulations limited by @simulation_no"""
         return self.simulations.find_one({'simulation': simulation_no}, {field: 1}).get(field, "no-result or error")
 
+    def hasIterationField(self, simulation_no, iteration_no, field):
+        """return  True if @field of iteration @iteration_no of @simulation_no is saved (fields depend on persistence profile)"""
+        query = {'simulation': simulation_no, 'iteration': iteration_no, field: {'$exists': True}}
+        return self.iterations.find_one(query, {'_id': 1}) is not None
+
     def getIterationField(self, simulation_no, iteration_no, field):
         """return  1 field from db collection simulations limited by @simulation_no and @iteration_no"""
         query = {'simulation': simulation_no, 'iteration': iteration_no}
@@ -224,6 +440,22 @@ class Database():
 
         return correllation_dict, number_values_used
 
+    def updateSimulationField(self, simulation_no, field, value):
+        """Sets @field of simulation record to @value"""
+        self.simulations.update({'simulation': simulation_no,}, {"$set": {field: value}}, safe=True)
+
+    def saveSurrogate(self, record):
+        """Saves surrogate model of simulation (see surrogate.SurrogateModel.getState), replaces previous one"""
+        self.surrogates.remove({'simulation': record['simulation']})
+        self.surrogates.insert(record, safe=True)
+
+    def getSurrogateRecord(self, simulation_no):
+        """return  surrogate model record of @simulation_no"""
+        record = self.surrogates.find_one({'simulation': simulation_no})
+        if record is None:
+            raise ValueError('No surrogate model of simulation %r in database' % simulation_no)
+        return record
+
     def updateSimulationComment(self, simulation_no, comment):
         """Updates comment in simulation"""
         self.simulations.update({'simulation': simulation_no,}, {"$set":{'comment': comment}}, multi=True, safe=True)
@@ -325,3 +557,11 @@ class Database():
 
         return result
 
+
+def getNestedValue(doc, field):
+    """return  value of nested @field (path with dots) of @doc, None if there is no such field"""
+    for key in field.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
@@ -14,11 +14,12 @@ from em import EnergyModule
 from sm import SubsidyModule
 from annex import getDaysNoInMonth, yearsBetween1Jan, monthsBetween, lastDayMonth, get_list_dates, cached_property, \
     setupPrintProgress, isFirstDayMonth, lastDayPrevMonth, numberDaysInMonth, OrderedDefaultdict, \
-    lastDayNextMonth, PMT, isLastDayYear, convertDictDates
+    lastDayNextMonth, PMT, isLastDayYear, convertDictDates, normalShock, randomStreamed
 from config_readers import MainConfig, EconomicModuleConfigReader
 from base_class import BaseClassConfig
 from collections import OrderedDict
 from database import Database
+from profiling import timed
 
 
 class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
@@ -56,6 +57,8 @@ class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
             print_progress(simulation_no)  # print progress bar with simulation_no
         print_progress(stop=True)
 
+    @timed('prices')
+    @randomStreamed('prices')
     def generateOneSimulation(self, simulation_no):
         """Main method for generating prices and preparing them to posting to database"""
         self.randomizePriceGenerationParameters(self.country)
@@ -67,15 +70,16 @@ class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
             days_dict[date_str] = price
 
         stats = calcStatistics(prices)
-        simulation_result = {"simulation_no": simulation_no, "data": days_dict, "stats": stats}
+        simulation_result = {"simulation_no": simulation_no, "data": days_dict, "stats": stats, "shock": self.price_shock}
         return simulation_result
 
     def calcPriceLogDeltaNoJump(self, prev_price_log, theta_log):
         """Calculates delta price (dp) based on @prev_price without a price jump"""
         #delta_Z = np.random.normal(loc=0, scale=0.9)  #random value distribution
-        delta_Z = np.random.normal(loc=0, scale= 1)
+        delta_Z = normalShock(loc=0, scale= 1)  # mirrored in antithetic iteration
 
         delta_price_log = self.lambda_log * (theta_log - prev_price_log) + delta_Z * self.sigma_log
+        self.noise_log = (1 - self.lambda_log) * self.noise_log + delta_Z * self.sigma_log  # part of price_log made by shocks
         return  delta_price_log
 
     def calcPriceWholePeriod(self, start_price):
@@ -84,10 +88,15 @@ class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
         y = self.makeInterannualVariabilityY()
         theta_log = self.theta_log
         prev_price_log = log(start_price)
+        self.noise_log = 0
+        noise_log_sum = 0
+        business_days = 0
 
         for i, date in enumerate(self.period):
             if date.weekday() < 5:
                 price_log = prev_price_log + self.calcPriceLogDeltaNoJump(prev_price_log, theta_log)
+                noise_log_sum += self.noise_log
+                business_days += 1
 
             theta_log += log1p(y/260)
             prev_price_log = price_log
@@ -95,6 +104,7 @@ class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
             if isLastDayYear(date):  # recalculate y each new year
                 y = self.makeInterannualVariabilityY()
 
+        self.price_shock = noise_log_sum / max(business_days, 1)  # average deviation of log price by shocks, expected value 0
         return result
 
     def calcPriceWholePeriodMRJD(self, start_price):
@@ -217,7 +227,15 @@ class ElectricityMarketPriceSimulation(EconomicModuleConfigReader):
 
     def makeInterannualVariabilityY(self):
         """Interannual variability of y."""
-        return self.y * (np.random.normal(self.y_annual_mean, self.y_annual_std))
+        return self.y * (normalShock(self.y_annual_mean, self.y_annual_std))
+
+
+def generateElectricityPrices(country, period):
+    """return  generated electricity prices of @country - dict[date] = price for dates of @period,
+    random shock of prices (control variate) and drift y of prices"""
+    price_simulation = ElectricityMarketPriceSimulation(country, period, 1)
+    simulation = price_simulation.generateOneSimulation(1)
+    return convertDictDates(simulation['data']), simulation['shock'], price_simulation.y  # y is drawn again by price simulation
 
 
 class EconomicModule(BaseClassConfig, EconomicModuleConfigReader):
@@ -256,14 +274,17 @@ class EconomicModule(BaseClassConfig, EconomicModuleConfigReader):
     @cached_property
     def electricity_prices(self):
         """This is cached attribute, it is calculated only one time per session
-        reads random time sequence of electricity market prices from database."""
-        simulations_no = 1
-        period = self.all_project_dates
-        price_simulation = ElectricityMarketPriceSimulation(self.country, period, simulations_no)
-        data = price_simulation.generateOneSimulation(1)['data']  # generated electricity prices
-        result = convertDictDates(data)
+        generates random time sequence of electricity market prices (see setElectricityPrices for shared prices)."""
+        result, self.price_shock, self.price_drift = generateElectricityPrices(self.country, self.all_project_dates)  # shock - control variate (see Report.calcControlVariates)
         return result
 
+    def setElectricityPrices(self, prices, price_shock, price_drift):
+        """Sets electricity prices shared with other plants of the country (see simulations.PortfolioIteration)
+        instead of generating them, @prices - dict[date] = price covering all project dates"""
+        self.electricity_prices = OrderedDict((date, prices[date]) for date in self.all_project_dates)
+        self.price_shock = price_shock
+        self.price_drift = price_drift
+
     def getElectricityProductionLifetime(self):
         """Returns all values dict [date]=electricity production for that date."""
         return  self.electricity_production
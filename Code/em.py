@@ -6,9 +6,10 @@ from base_class import BaseClassConfig
 from config_readers import EnergyModuleConfigReader
 from constants import TESTMODE
 from collections import OrderedDict
-from annex import cached_property, setupPrintProgress, yearsBetween1Jan, convertDictDates
+from annex import cached_property, setupPrintProgress, yearsBetween1Jan, convertDictDates, randomStreamed
 from database import  Database
-from numpy.random import normal as gauss
+from profiling import timed
+from annex import normalShock as gauss  # normal random shocks, mirrored in antithetic iterations
 
 class EnergyModule(BaseClassConfig, EnergyModuleConfigReader):
     """module for holding info about weather and insolations"""
@@ -24,7 +25,9 @@ class EnergyModule(BaseClassConfig, EnergyModuleConfigReader):
         simulations_no = 1
         period = self.all_project_dates
         weather_simulation = WeatherSimulation(self.country, period, simulations_no)
-        data = weather_simulation.generateOneSimulation(1)['data']  # generated weather data
+        simulation = weather_simulation.generateOneSimulation(1)
+        data = simulation['data']  # generated weather data
+        self.weather_shock = simulation['shock']  # control variate (see Report.calcControlVariates)
         result = convertDictDates(data)
         return result
 
@@ -86,6 +89,8 @@ class WeatherSimulation(EnergyModuleConfigReader):
             print_progress(simulation_no)  # print progress bar with simulation_no
         print_progress(stop=True)
 
+    @timed('weather')
+    @randomStreamed('weather')
     def generateOneSimulation(self, simulation_no):
         """generate simulation one by one
         return  dict with [date]=(insolation, temperature)
@@ -98,9 +103,17 @@ class WeatherSimulation(EnergyModuleConfigReader):
         for date in self.period:
             insolation, temperature, avg_production_day_per_kW = self.generateWeatherData(date)
             days_dict[date.strftime("%Y-%m-%d")] = (insolation, temperature, avg_production_day_per_kW)
-        simulation_result = {"simulation_no": simulation_no, "data": days_dict}
+        simulation_result = {"simulation_no": simulation_no, "data": days_dict, "shock": self.calcWeatherShock()}
         return simulation_result
 
+    def calcWeatherShock(self):
+        """return  average relative deviation of corrections of avg production (random uncertainties) over all days
+        of period from their expected value, its expected value is 0 (uncertainties are independent)"""
+        correction = (1 + self.data_uncertainty) * (1 + self.transposition_model_uncertainty) * (1 + self.long_term_irradiation_uncertainty)
+        yearly_correction = sum((1 + self.interannual_variability[date.year]) * (1 + self.dust_uncertainty[date.year]) *
+                                (1 + self.snow_uncertainty[date.year]) for date in self.period) / len(self.period)
+        return correction * yearly_correction / self.getExpectedAvgProductionCorrection(self.country) - 1
+
     def writeWeatherDataDb(self, data, silent=True):
         """Saving into db dict"""
         data['country'] = self.country
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+"""Live metrics of run of iterations in pool of workers - throughput, ETA, utilization of workers, durations of stages
+of tasks and latency of db writes. Workers only count finished iterations (shared counter) and return durations with
+results of tasks, RunMetrics in main process aggregates them, prints progress line and periodically writes snapshot
+files (JSON and Prometheus text format) to metrics_directory, which can be read by monitoring while simulation runs."""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque, defaultdict
+
+from annex import mkdir_p
+from constants import metrics_directory, METRICS_PRINT_INTERVAL, METRICS_SNAPSHOT_INTERVAL, METRICS_RATE_WINDOW, \
+    METRICS_STALL_TIMEOUT, METRICS_FORMATS
+
+
+class RunMetrics():
+    """Aggregator of metrics of one run (see simulations.Simulation.runIterations), reporter thread prints progress
+    and writes snapshots until stop"""
+
+    def __init__(self, progress_counter, iterations_number, workers_number, writers=(), simulations=(),
+                 directory=metrics_directory, formats=METRICS_FORMATS):
+        """@progress_counter - shared counter of iterations finished by workers
+        @iterations_number - number of iterations of run, @workers_number - number of processes in pool
+        @writers - iterations writers of simulations of run (see database.AsyncWriter), @simulations - their numbers
+        @formats - snapshot files written - 'json' (metrics.json) and/or 'prometheus' (metrics.prom)"""
+        self.progress_counter = progress_counter
+        self.iterations_number = iterations_number
+        self.workers_number = workers_number
+        self.writers = list(writers)
+        self.simulations = list(simulations)
+        self.directory = directory
+        self.formats = formats
+        self.lock = threading.Lock()  # results loop adds tasks while reporter thread reads them
+        self.stage_times = defaultdict(float)  # stage of tasks -> seconds summed over finished tasks
+        self.busy_time = 0.0  # seconds of calculation of finished tasks in workers
+        self.tasks = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Resets progress counter and starts reporter thread"""
+        self.progress_counter.value = 0
+        self.start_time = self.last_change_time = time.time()
+        self.last_completed = 0
+        self.samples = deque([(self.start_time, 0)])  # (time, completed iterations) for recent rate
+        self.last_snapshot = 0
+        self.printProgress()
+        self.thread = threading.Thread(target=self.run, name="RunMetrics")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops reporter thread, prints last progress and writes final snapshot"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.printProgress()
+        sys.stdout.write('\n')  # go to newline because of progress printer
+        self.writeSnapshot(finished=True)
+
+    def addTask(self, timing):
+        """Adds @timing of task finished by worker - dict[stage] = seconds, 'total' - whole task"""
+        with self.lock:
+            self.tasks += 1
+            for stage, seconds in timing.items():
+                if stage == 'total':
+                    self.busy_time += seconds
+                else:
+                    self.stage_times[stage] += seconds
+
+    def run(self):
+        """Loop of reporter thread"""
+        while not self.stopped.wait(METRICS_PRINT_INTERVAL):
+            self.printProgress()
+            if time.time() - self.last_snapshot >= METRICS_SNAPSHOT_INTERVAL:
+                self.writeSnapshot()
+
+    def getCompleted(self):
+        """return  number of finished iterations, updates time of last progress and samples of recent rate"""
+        completed = self.progress_counter.value
+        now = time.time()
+        if completed != self.last_completed:
+            self.last_completed, self.last_change_time = completed, now
+        self.samples.append((now, completed))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= METRICS_RATE_WINDOW:
+            self.samples.popleft()
+        return completed
+
+    def getSnapshot(self, finished=False):
+        """return  dict with current metrics of run"""
+        completed = self.getCompleted()
+        now = time.time()
+        elapsed = now - self.start_time
+        window_time, window_completed = self.samples[0]
+        rate = (completed - window_completed) / (now - window_time) if now > window_time else 0.0  # recent iterations/sec
+        remaining = self.iterations_number - completed
+        with self.lock:
+            busy_time, tasks, stage_times = self.busy_time, self.tasks, dict(self.stage_times)
+        since_progress = now - self.last_change_time
+        if finished:
+            status = 'finished'
+        elif since_progress >= METRICS_STALL_TIMEOUT:
+            status = 'stalled'
+        else:
+            status = 'running'
+        return {
+            'simulations': self.simulations,
+            'pid': os.getpid(),
+            'status': status,
+            'timestamp': now,
+            'elapsed_seconds': elapsed,
+            'iterations_total': self.iterations_number,
+            'iterations_completed': completed,
+            'tasks_completed': tasks,
+            'iterations_per_second': completed / elapsed if elapsed else 0.0,
+            'iterations_per_second_recent': rate,
+            'eta_seconds': remaining / rate if rate else None,
+            'seconds_since_progress': since_progress,
+            'workers': self.workers_number,
+            'worker_utilization': busy_time / (self.workers_number * elapsed) if elapsed else 0.0,  # of finished tasks
+            'stage_seconds': stage_times,
+            'db_write': getWritersStats(self.writers),
+        }
+
+    def printProgress(self):
+        """Prints one line with progress, speed and ETA of run (only main process prints)"""
+        snapshot = self.getSnapshot()
+        completed, eta = snapshot['iterations_completed'], snapshot['eta_seconds']
+        sys.stdout.write("\r{0}/{1} -- {2:.2f}% -- {3:.1f} it/s -- ETA {4} ".format(
+            completed, self.iterations_number, 100 * completed / float(self.iterations_number),
+            snapshot['iterations_per_second_recent'], formatSeconds(eta) if eta is not None else '?'))
+        sys.stdout.flush()
+
+    def writeSnapshot(self, finished=False):
+        """Writes snapshot files of current metrics, errors of writing do not stop simulation"""
+        self.last_snapshot = time.time()
+        snapshot = self.getSnapshot(finished)
+        try:
+            mkdir_p(self.directory)
+            if 'json' in self.formats:
+                writeAtomically(os.path.join(self.directory, 'metrics.json'), json.dumps(snapshot, indent=2, sort_keys=True))
+            if 'prometheus' in self.formats:
+                writeAtomically(os.path.join(self.directory, 'metrics.prom'), formatPrometheus(snapshot))
+        except (IOError, OSError) as exc:
+            sys.stderr.write("Metrics snapshot was not written: %s\n" % exc)
+        return snapshot
+
+
+def getWritersStats(writers):
+    """return  dict with latency of db writes (seconds per bulk insert) and number of queued lines of @writers"""
+    stats = [writer.getStats() for writer in writers]
+    writes = sum(s['writes'] for s in stats)
+    return {
+        'writes': writes,
+        'inserted': sum(s['inserted'] for s in stats),
+        'queued': sum(s['queued'] for s in stats),
+        'retries': sum(s['retries'] for s in stats),
+        'latency_mean_seconds': sum(s['write_time'] for s in stats) / writes if writes else None,
+        'latency_max_seconds': max([s['max_write_time'] for s in stats] or [0.0]),
+    }
+
+def formatPrometheus(snapshot):
+    """return  @snapshot in Prometheus text exposition format (for textfile collector of node exporter)"""
+    labels = '{simulations="%s"}' % ','.join(str(simulation_no) for simulation_no in snapshot['simulations'])
+    values = [
+        ('mirr_iterations_total', 'gauge', snapshot['iterations_total']),
+        ('mirr_iterations_completed', 'gauge', snapshot['iterations_completed']),
+        ('mirr_iterations_per_second', 'gauge', snapshot['iterations_per_second_recent']),
+        ('mirr_eta_seconds', 'gauge', snapshot['eta_seconds']),
+        ('mirr_elapsed_seconds', 'gauge', snapshot['elapsed_seconds']),
+        ('mirr_seconds_since_progress', 'gauge', snapshot['seconds_since_progress']),
+        ('mirr_stalled', 'gauge', int(snapshot['status'] == 'stalled')),
+        ('mirr_finished', 'gauge', int(snapshot['status'] == 'finished')),
+        ('mirr_workers', 'gauge', snapshot['workers']),
+        ('mirr_worker_utilization', 'gauge', snapshot['worker_utilization']),
+        ('mirr_db_writes_total', 'counter', snapshot['db_write']['writes']),
+        ('mirr_db_write_retries_total', 'counter', snapshot['db_write']['retries']),
+        ('mirr_db_write_queued', 'gauge', snapshot['db_write']['queued']),
+        ('mirr_db_write_latency_seconds', 'gauge', snapshot['db_write']['latency_mean_seconds']),
+        ('mirr_db_write_latency_max_seconds', 'gauge', snapshot['db_write']['latency_max_seconds']),
+        ('mirr_snapshot_timestamp_seconds', 'gauge', snapshot['timestamp']),
+    ]
+    lines = []
+    for name, kind, value in values:
+        if value is not None:  # unknown ETA or latency
+            lines += ['# TYPE %s %s' % (name, kind), '%s%s %r' % (name, labels, float(value))]
+    lines.append('# TYPE mirr_stage_seconds_total counter')
+    for stage, seconds in sorted(snapshot['stage_seconds'].items()):
+        lines.append('mirr_stage_seconds_total%s,stage="%s"} %r' % (labels[:-1], stage, float(seconds)))
+    return '\n'.join(lines) + '\n'
+
+def writeAtomically(path, text):
+    """Writes @text to file @path through temporary file, so readers never see partly written file"""
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.rename(temp_path, path)
+
+def readSnapshot(directory=metrics_directory):
+    """return  last JSON snapshot of metrics of run or None"""
+    try:
+        with open(os.path.join(directory, 'metrics.json')) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+def formatSeconds(seconds):
+    """return  @seconds as H:MM:SS"""
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -5,20 +5,29 @@
 
 import sys
 import os
+import time
+import pstats
 import traceback
+import yaml
 from collections import OrderedDict
 from random import randint, choice
 
-from annex import getInputDate, getInputInt, memoize, getInputComment, \
+from annex import getInputDate, getInputInt, getInputFloat, memoize, getInputComment, \
     print_separator, uniquifyFilename, convert2excel
 from database import Database
 from ecm import ElectricityMarketPriceSimulation
 from em import WeatherSimulation
 from config_readers import MainConfig
-from simulations import runAndSaveSimulation
-from charts import plotRevenueCostsChart, plotCorrelationTornadoChart, plotIRRScatterChart, plotStepChart
+from simulations import runAndSaveSimulation, resumeSimulation, runAndSaveSimulationUntilConvergence, mergeSimulations, \
+    comparePairedSimulations, runAndSaveScenarios, runAndSaveSweep, runAndSavePortfolio
+from metrics import readSnapshot, formatSeconds
+from profiling import setProfiling
+from surrogate import fitSurrogate, predictResults, parseSettings
+from charts import plotRevenueCostsChart, plotCorrelationTornadoChart, plotIRRScatterChart, plotStepChart, plotSobolIndicesChart, \
+    plotSweepTornadoChart
 from report_output import ReportOutput
-from constants import CORRELLATION_IRR_FIELD, CORRELLATION_NPV_FIELD, REPORT_DEFAULT_NUMBER_ITERATIONS, report_directory
+from constants import CORRELLATION_IRR_FIELD, CORRELLATION_NPV_FIELD, REPORT_DEFAULT_NUMBER_ITERATIONS, report_directory, \
+    CONVERGENCE_TOLERANCES, CONVERGENCE_MAX_ITERATIONS, MASTER_SEED_MAX, PERSISTENCE_DEFAULT, PROFILE_PRINT_FUNCTIONS
 from rm import analyseSimulationResults, plotSaveStochasticValuesSimulation, plotGeneratedWeather, plotGeneratedElectricity, \
     getWeatherDataFromDb, saveWeatherData, exportElectricityPrices
 
@@ -43,6 +52,26 @@ commands['17'] = 'outputGeneratedWeatherData'  #Graph of daily aily insolation a
 commands['18'] = 'exportGeneratedElectricityPrices'  #Graph of daily aily insolation and temperature
 commands['19'] = 'exportIrrProjectYStats'
 commands['20'] = 'runBatchOfSimulations'
+commands['21'] = 'runVectorizedSimulation'
+commands['22'] = 'resumeSimulation'
+commands['resume'] = 'resumeSimulation'
+commands['23'] = 'runSimulationUntilConvergence'
+commands['24'] = 'mergeShards'
+commands['merge'] = 'mergeShards'
+commands['25'] = 'fitSurrogate'
+commands['fit-surrogate'] = 'fitSurrogate'
+commands['26'] = 'predictSurrogate'
+commands['predict'] = 'predictSurrogate'
+commands['27'] = 'showSensitivityIndices'
+commands['sensitivity'] = 'showSensitivityIndices'
+commands['28'] = 'runSweep'
+commands['sweep'] = 'runSweep'
+commands['29'] = 'runPortfolio'
+commands['portfolio'] = 'runPortfolio'
+commands['30'] = 'showRunMetrics'
+commands['metrics'] = 'showRunMetrics'
+commands['31'] = 'showProfile'
+commands['profile'] = 'showProfile'
 commands['0'] = 'stop'
 commands['h'] = 'help'
 commands['help'] = 'help'
@@ -51,8 +80,31 @@ commands['help'] = 'help'
 class Interface():
     """Class for Main menu for all operations"""
 
-    def __init__(self):
+    def __init__(self, shard=None, master_seed=None, sampling='random', antithetic=False, importance_sampling=False,
+                 fine_iterations_number=None, stage_cache=False, persistence=PERSISTENCE_DEFAULT, profiling=None):
+        """@shard - (i, N) simulations calculate only i-th of N parts of iterations (see parseOptions)
+        @master_seed - seed of simulations, required for shards
+        @sampling - sampling of random config values of simulations - 'random', 'lhs' (latin hypercube), 'sobol' (QMC)
+        or 'saltelli' (sample matrices for Sobol sensitivity indices)
+        @antithetic - simulations run iterations in antithetic pairs
+        @importance_sampling - simulations tilt random values toward adverse outcomes for IRR tail stats
+        @fine_iterations_number - vectorized simulations are multilevel, only first @fine_iterations_number iterations
+        run daily model, all iterations run monthly coarse model
+        @stage_cache - vectorized simulations load unchanged weather, prices and production from stage cache (with --seed)
+        @persistence - profile of fields of iterations saved by simulations - full, monthly, yearly, scalars or full_sampled
+        (vectorized simulations save at most yearly)
+        @profiling - None, 0.0 - simulations measure stages of iterations, fraction - and profile fraction of iterations
+        by cProfile (see profiling.setProfiling)"""
         self.db = Database()
+        self.shard = shard
+        self.master_seed = master_seed
+        self.sampling = sampling
+        self.antithetic = antithetic
+        self.importance_sampling = importance_sampling
+        self.fine_iterations_number = fine_iterations_number
+        self.stage_cache = stage_cache
+        self.persistence = persistence
+        setProfiling(profiling)
         # self.main_config = MainConfig()  #link to main config
 
     def runSimulation(self, country=None, iterations_no=None, comment=None):
@@ -64,7 +116,216 @@ class Interface():
         if comment is None:
             comment = getInputComment()  # get user comment
 
-        runAndSaveSimulation(country, iterations_no, comment)  # run the simulation
+        runAndSaveSimulation(country, iterations_no, comment, master_seed=self.master_seed, shard=self.shard, sampling=self.sampling, antithetic=self.antithetic, importance_sampling=self.importance_sampling,
+                             persistence=self.persistence)  # run the simulation
+
+    def runVectorizedSimulation(self, country=None, iterations_no=None, comment=None):
+        """Running simulation with vectorized engine (iterations calculated in blocks) and saving results"""
+        country = self.getInputCountry(country)
+
+        if iterations_no is None:
+            iterations_no = self.getNumberIterations(default=REPORT_DEFAULT_NUMBER_ITERATIONS)  #ask user how many iterations
+        if comment is None:
+            comment = getInputComment()  # get user comment
+
+        runAndSaveSimulation(country, iterations_no, comment, vectorized=True, master_seed=self.master_seed, shard=self.shard, sampling=self.sampling, antithetic=self.antithetic, importance_sampling=self.importance_sampling,
+                             fine_iterations_number=self.fine_iterations_number, stage_cache=self.stage_cache,
+                             persistence=self.persistence)  # run the simulation
+
+    def mergeShards(self, *sources):
+        """Merges shards of simulation to new simulation, @sources - simulation numbers of shards in local db
+        or host:port/simulation_no for shards in other databases, example: merge 12 node2:27017/5 node3:27017/8"""
+        if not sources:
+            sources = raw_input("Please input shards (simulation_no or host:port/simulation_no) separated by spaces: ").split()
+        shards = []
+        for source in sources:
+            host, _, simulation_no = str(source).rpartition('/')
+            shards.append((host or None, int(simulation_no)))
+        comment = getInputComment()
+        simulation_no = mergeSimulations(shards, comment)
+        print "Shards merged to simulation %s" % simulation_no
+
+    def resumeSimulation(self, simulation_no=None):
+        """Runs missing iterations of interrupted simulation and saves results"""
+        if simulation_no is None:
+            simulation_no = self.getInputSimulation("resuming ")
+        resumeSimulation(simulation_no)
+
+    def fitSurrogate(self, simulation_no=None):
+        """Fits surrogate model (fast emulator of IRR and NPV) to iterations of simulation and saves it to db"""
+        if simulation_no is None:
+            simulation_no = self.getInputSimulation("fitting surrogate model ")
+        model = fitSurrogate(simulation_no)
+        print "Surrogate model of simulation %s fitted on %s iterations, inputs: %s" % (simulation_no, model.iterations, ", ".join(model.names))
+        for field, r2 in model.validation.items():
+            print "  %s R2 on held out iterations: %.3f" % (field, r2)
+
+    def predictSurrogate(self, simulation_no=None, *settings):
+        """Prints distribution of IRR and NPV for config values set to @settings (name=value in units of config files,
+        example: predict 12 SUBSIDY.MWhFIT=70 TAXES.tax_rate=30), predicted by surrogate model of simulation,
+        settings out of domain of the model are calculated by new iterations"""
+        if simulation_no is None:
+            simulation_no = self.getInputSimulation("prediction ")
+        if not settings:
+            settings = raw_input("Please input settings (name=value) separated by spaces: ").split()
+        results, source, seconds = predictResults(simulation_no, parseSettings(settings))
+        print "Predicted by %s in %.3f s" % (source, seconds)
+        for field, result in results.items():
+            if not result['iterations']:
+                continue
+            percentiles = result['percentiles']
+            print "  %s: mean %.4f std %.4f p5 %.4f p50 %.4f p95 %.4f P(<0) %.3f" % (
+                field, result['mean'], result['std'], percentiles['p5'], percentiles['p50'], percentiles['p95'],
+                result['probability_negative'])
+
+    def showSensitivityIndices(self, simulation_no=None):
+        """Prints and charts Sobol sensitivity indices of simulation run with --sampling saltelli,
+        example: python mirr.py 21 1 5500 --sampling saltelli, then: sensitivity 12"""
+        if simulation_no is None:
+            simulation_no = self.getInputSimulation("sensitivity indices ")
+        record = self.db.getSimulationRecord(simulation_no)
+        sensitivity = record.get('sensitivity')
+        if sensitivity is None:
+            print "Simulation %s has no sensitivity indices - run simulation with --sampling saltelli" % simulation_no
+            return
+        for field, result in sensitivity['indices'].items():
+            print "%s (%s base rows):" % (field, result['base_rows'])
+            for name, first, first_ci, total, total_ci in zip(sensitivity['inputs'], result['first_order'], result['first_order_ci'],
+                                                             result['total_order'], result['total_order_ci']):
+                print "  %-75s S1 %6.3f [%6.3f, %6.3f]  ST %6.3f [%6.3f, %6.3f]" % (name, first, first_ci[0], first_ci[1],
+                                                                                total, total_ci[0], total_ci[1])
+        plotSobolIndicesChart(simulation_no, sensitivity, record['country'])
+
+    def runSweep(self, spec_file=None):
+        """Runs one-at-a-time sweep of parameters from YAML file @spec_file (see simulations.runAndSaveSweep), prints swing
+        tables and charts tornado of IRR and NPV, example: sweep sweep.yaml
+        Without @spec_file runs example sweep below."""
+        spec = {
+            'country': 'SLOVENIA',
+            'iterations': 1000,  # baseline
+            'sweep_iterations': 100,  # each low and high value, paired with the same iterations of baseline
+            'parameters': {  # path: [low, high]
+                'DEBT.interest_rate': [2, 6],
+                'TAXES.tax_rate': [10, 30],
+                'SUBSIDY.MWhFIT': [60, 80],
+                'ELECTRICITY_MARKET_PRICE_SIMULATION.y': [0.01, 0.05],
+            },
+        }
+        if spec_file is not None:
+            with open(spec_file) as f:
+                spec = yaml.load(f)
+
+        simulation_no = runAndSaveSweep(spec, master_seed=self.master_seed, persistence=self.persistence)
+        record = self.db.getSimulationRecord(simulation_no)
+        sweep = record['sweep']
+        for field, result in sweep['swings'].items():
+            print "%s: baseline %.6f (simulation %s), %s paired iterations" % (field, result['base'], simulation_no, sweep['iterations'])
+            order = sorted(range(len(sweep['parameters'])), key=lambda i: -abs(result['swings'][i]['swing']))
+            for i in order:
+                swing = result['swings'][i]
+                print "  %-65s %8s %8s  low %10.6f +/- %.6f  high %10.6f +/- %.6f  swing %10.6f +/- %.6f" % (
+                    sweep['parameters'][i], sweep['values'][i][0], sweep['values'][i][1], swing['low'], swing['low_ci'],
+                    swing['high'], swing['high_ci'], swing['swing'], swing['swing_ci'])
+        plotSweepTornadoChart(simulation_no, sweep, record['country'])
+
+    def runPortfolio(self, spec_file=None):
+        """Runs portfolio simulation of plants from YAML file @spec_file (see simulations.runAndSavePortfolio), plants of one
+        country share price paths, prints IRR and NPV of portfolio and of each plant, example: portfolio portfolio.yaml
+        Without @spec_file runs example portfolio below."""
+        spec = {
+            'iterations': 1000,
+            'plants': [
+                {'country': 'SLOVENIA'},
+                {'country': 'SLOVENIA', 'overrides': {'SUBSIDY.MWhFIT': 70, 'TAXES.tax_rate': 30}},
+                {'country': 'FRANCE'},
+            ],
+        }
+        if spec_file is not None:
+            with open(spec_file) as f:
+                spec = yaml.load(f)
+
+        simulation_no = runAndSavePortfolio(spec, master_seed=self.master_seed, antithetic=self.antithetic, persistence=self.persistence)
+        record = self.db.getSimulationRecord(simulation_no)
+        print "Simulation %s - %s" % (simulation_no, record['comment'])
+        irr_stats = dict((stats['field'], stats) for stats in record['irr_stats'])
+        npv_stats = dict((stats['field'], stats) for stats in record.get('npv_stats', []))
+        for field in ['irr_project_y', 'irr_owners_y', 'npv_project_y', 'npv_owners_y']:
+            stats = irr_stats.get(field) or npv_stats.get(field)
+            if stats is not None:
+                print "  portfolio %s: mean %.6f std %.6f" % (field, stats['mean'], stats['std'])
+        for (country, overrides), plant_stats in zip(record['portfolio']['plants'], record['portfolio']['plant_stats']):
+            print "  plant %s %s: %s" % (country, ", ".join("%s=%s" % (name, value) for name, value in overrides),
+                                        ", ".join("%s %.6f" % (field, stats['mean']) for field, stats in plant_stats.items()))
+
+    def showRunMetrics(self):
+        """Prints last snapshot of metrics of running (or last finished) simulation (see metrics.RunMetrics),
+        the same snapshot is in metrics.json and metrics.prom in metrics_directory for monitoring"""
+        snapshot = readSnapshot()
+        if snapshot is None:
+            print "No metrics snapshot - no simulation was run yet"
+            return
+        eta = snapshot['eta_seconds']
+        print "Simulations %s (process %s): %s, snapshot %s ago" % (", ".join(map(str, snapshot['simulations'])), snapshot['pid'],
+                                                                 snapshot['status'], formatSeconds(time.time() - snapshot['timestamp']))
+        print "  iterations %s/%s, %.2f it/s (recent %.2f it/s), elapsed %s, ETA %s, last progress %s ago" % (
+            snapshot['iterations_completed'], snapshot['iterations_total'], snapshot['iterations_per_second'],
+            snapshot['iterations_per_second_recent'], formatSeconds(snapshot['elapsed_seconds']),
+            formatSeconds(eta) if eta is not None else '?', formatSeconds(snapshot['seconds_since_progress']))
+        print "  %s workers, utilization %.1f%%" % (snapshot['workers'], 100 * snapshot['worker_utilization'])
+        busy_time = sum(snapshot['stage_seconds'].values())
+        for stage, seconds in sorted(snapshot['stage_seconds'].items(), key=lambda item: -item[1]):
+            print "  stage %s: %.1f s (%.1f%%)" % (stage, seconds, 100 * seconds / busy_time if busy_time else 0)
+        db_write = snapshot['db_write']
+        latency = db_write['latency_mean_seconds']
+        print "  db: %s lines in %s writes, mean latency %s, max %.3f s, %s retries, %s lines queued" % (
+            db_write['inserted'], db_write['writes'], "%.3f s" % latency if latency is not None else '-',
+            db_write['latency_max_seconds'], db_write['retries'], db_write['queued'])
+
+    def showProfile(self, simulation_no=None):
+        """Prints time and memory of stages of iterations of simulation run with --profile (or --profile-sample FRACTION)
+        and functions with most cumulative time of iterations profiled by cProfile, example: python mirr.py 1 SLOVENIA 100
+        --profile-sample 0.05, then: profile 12"""
+        if simulation_no is None:
+            simulation_no = self.getInputSimulation("profile ")
+        profile = self.db.getSimulationRecord(simulation_no).get('profile')
+        if profile is None:
+            print "Simulation %s has no profile - run simulation with --profile" % simulation_no
+            return
+        task_seconds = profile['task_seconds']
+        total = task_seconds.get('total', 0.0)
+        print "Simulation %s - %s iterations, %.1f s in workers (setup %.1f s, calculation %.1f s, results %.1f s)" % (
+            simulation_no, profile['iterations'], total, task_seconds.get('setup', 0), task_seconds.get('calculation', 0),
+            task_seconds.get('results', 0))
+        print "%-20s %8s %12s %12s %8s %12s %12s" % ('stage', 'calls', 'seconds', 'self seconds', 'self %', 'self MB', 'page faults')
+        stages = sorted(profile['stages'].items(), key=lambda item: -item[1]['self_seconds'])
+        for name, stage in stages:
+            print "%-20s %8d %12.3f %12.3f %8.1f %12.1f %12d" % (
+                name, stage['calls'], stage['seconds'], stage['self_seconds'], 100 * stage['self_seconds'] / total if total else 0,
+                stage['self_memory_kb'] / 1024.0, stage['self_page_faults'])
+        other = total - sum(stage['self_seconds'] for name, stage in stages)
+        print "%-20s %8s %12s %12.3f %8.1f" % ('other', '', '', other, 100 * other / total if total else 0)
+        db_write = profile['db_write']
+        print "db insert: %s lines in %s writes, %.3f s in background writer (%s retries)" % (
+            db_write['inserted'], db_write['writes'], db_write['write_time'], db_write['retries'])
+        if profile['cprofile'] and os.path.exists(profile['cprofile']):
+            print "cProfile of %.1f%% iterations (%s):" % (100 * profile['cprofile_fraction'], profile['cprofile'])
+            pstats.Stats(profile['cprofile']).sort_stats('cumulative').print_stats(PROFILE_PRINT_FUNCTIONS)
+
+    def runSimulationUntilConvergence(self, country=None, max_iterations=None, comment=None):
+        """Running simulation (vectorized engine) in waves until IRR stats are stable and saving results"""
+        country = self.getInputCountry(country)
+
+        default_tolerance = CONVERGENCE_TOLERANCES['irr_project_y']
+        tolerance = getInputFloat("Please input max half-width of 95%% CI of IRR mean and quantiles (or press Enter to use default %s) : "
+                                  % default_tolerance, default_tolerance)
+        tolerances = {'irr_project_y': tolerance, 'irr_project_before_tax_y': tolerance, 'irr_owners_y': 2 * tolerance}
+        if max_iterations is None:
+            max_iterations = getInputInt("Please select max number of iterations to run (or press Enter to use default %s) : "
+                                         % CONVERGENCE_MAX_ITERATIONS, CONVERGENCE_MAX_ITERATIONS)
+        if comment is None:
+            comment = getInputComment()  # get user comment
+
+        runAndSaveSimulationUntilConvergence(country, comment, tolerances, max_iterations, vectorized=True)
 
     def analyseSimulationResults(self, simulation_no=None):
         """
@@ -79,12 +340,16 @@ class Interface():
     def exportOneIteration(self):
         """Save main report for user defind simulation and iteration number"""
         params = self.getSimulationIterationNums("for getting ISBS excel report ")
+        if not self.checkSavedField(params[0], params[1], 'revenue'):
+            return
         ReportOutput(None).prepareReportISBSCFIRR(params, yearly=False)  #preparing monthly report
         ReportOutput(None).prepareReportISBSCFIRR(params, yearly=True)  #preparing yearly report
 
     def cashflowCharts(self):
         """Plots Revenue, Cost charts monthly and yearly for user definded simulation no"""
         simulation_no, iteration_no = self.getSimulationIterationNums("for plotting revenue-costs charts ")
+        if not self.checkSavedField(simulation_no, iteration_no, 'revenue'):
+            return
         country = self.db.getSimulationCountry(simulation_no, print_result=True)
         plotRevenueCostsChart(simulation_no, iteration_no, yearly=False, country=country)  #plot monthly chart
         plotRevenueCostsChart(simulation_no, iteration_no, yearly=True, country=country)  #plot yearly chart
@@ -92,11 +357,15 @@ class Interface():
     def printEquipment(self):
         """Prints equipment of user defined simulation no , used first iteration"""
         simulation_no = self.getInputSimulation("printing equipment ")
+        if not self.checkSavedField(simulation_no, 1, 'equipment_description'):
+            return
         print self.db.getIterationField(simulation_no, iteration_no=1, field='equipment_description')
 
     def outputPrimaryEnergy(self):
         """Plots solar insolations step chart for user definded simulation no, iteration no and data range"""
         simulation_no, iteration_no = self.getSimulationIterationNums("for printing chart with Primary Energy ")
+        if not self.checkSavedField(simulation_no, iteration_no, 'insolations_daily'):
+            return
         country = self.db.getSimulationCountry(simulation_no=simulation_no, print_result=True)
         start_date, end_date, resolution = self.getStartEndResolution(simulation_no, iteration_no)  #ask user start date, end, resolution
         plotStepChart(simulation_no, iteration_no, start_date, end_date, resolution, field='insolations_daily', country=country)
@@ -104,6 +373,8 @@ class Interface():
     def outputElectricityProduction(self):
         """Plots electricity production step chart for user definded simulation no, iteration no and data range"""
         simulation_no, iteration_no = self.getSimulationIterationNums("for printing chart with Electricity Production ")
+        if not self.checkSavedField(simulation_no, iteration_no, 'electricity_production_daily'):
+            return
         country = self.db.getSimulationCountry(simulation_no=simulation_no, print_result=True)
         start_date, end_date, resolution = self.getStartEndResolution(simulation_no, iteration_no)  #ask user start date, end, resolution
         plotStepChart(simulation_no, iteration_no, start_date, end_date, resolution, field='electricity_production_daily', country=country)
@@ -213,6 +484,8 @@ class Interface():
             head = ['simulation_number', 'country', 'iterations_number'] + nested + ['tax_rate'] + ['subsidy_duration']
             wr.writerow(head)
             for x in self.db.simulations.find():
+                if 'irr_stats' not in x:
+                    continue  # not finished simulation
                 simno = x['simulation']
                 result = self.db.getIterationValuesFromDb(simno,
                         ['ecm_configs.tax_rate', 'sm_configs.subsidy_duration'], '', iteration_no=1)
@@ -235,63 +508,49 @@ class Interface():
     def getAllDates(country):
         return MainConfig(country).getAllDates()
 
-    def runBatchOfSimulations(self):
-
-        number_of_simulations = 2
-        countries = [ 'FRANCE', 'FRANCE']
-        numbers_of_iterations = [ 10000, 10000]
-
-        conf_data = [
-            {
-                'taxrate': '30',
-                'duration': '180',
-                'mwhfit': '60',
-            },
-            {
-                'taxrate': '30',
-                'duration': '300',
-                'mwhfit': 70,
-            }
-        ]
-
-        #######################################
-        #######################################
-        #######################################
-
-        assert len(countries) == number_of_simulations
-        assert len(numbers_of_iterations) == number_of_simulations
-        assert len(conf_data) == number_of_simulations
-
-        import glob
-        from string import Template
-        import os
-
-        for it in range(number_of_simulations):
-            print "Iteration", it+1
-            print "Writing confs..."
-            for conf_template_name in glob.glob('config_templates/*.ini'):
-                with open(conf_template_name) as conf_template:
-                    template = Template(conf_template.read())
-                    conf = template.substitute(conf_data[it])
-                    bn = os.path.basename(conf_template_name)
-                    conf_to_write = os.path.join('configs', bn)
-                    print "writing", conf_to_write
-                    with open(conf_to_write, 'w') as g:
-                        g.write(conf)
-            print "Done!"
-            print "Running simulation:"
-            print "  country:", countries[it]
-            print "  iterations:", numbers_of_iterations[it]
-            print "  conf_data:", conf_data[it]
-
-            comment = "Simulation nr. {} in this batch. Parameters: ".format(it, conf_data[it])
-            runAndSaveSimulation(countries[it], numbers_of_iterations[it], comment)
-
-            print "Done!"
-            print "##################################"
-
-
-
+    def runBatchOfSimulations(self, spec_file=None):
+        """Runs simulations of scenarios from YAML file @spec_file (see simulations.runAndSaveScenarios) together in one pool
+        of workers, config overrides of scenarios are applied in memory, example: 20 scenarios.yaml
+        Without @spec_file runs example batch below."""
+        spec = {
+            'country': 'FRANCE',
+            'iterations': 10000,
+            'vectorized': False,
+            # common random numbers - all simulations of batch use the same master seed, so iterations with the same
+            # number get the same weather, prices, failures and config draws, and differences are calculated by pairs
+            # of iterations. Each component draws from own random stream (see annex.randomStream), so scenarios share
+            # random numbers of components they do not change (different project periods or equipment numbers
+            # share only part of weather, prices or failures)
+            'common_random_numbers': True,
+            'scenarios': [
+                {'TAXES.tax_rate': 30, 'SUBSIDY.subsidy_duration': 180, 'SUBSIDY.MWhFIT': 60},
+                {'TAXES.tax_rate': 30, 'SUBSIDY.subsidy_duration': 300, 'SUBSIDY.MWhFIT': 70},
+            ],
+            # 'grid': {'DEBT.interest_rate': [4, 6]},  # each scenario is run with each combination of grid values
+        }
+        if spec_file is not None:
+            with open(spec_file) as f:
+                spec = yaml.load(f)
+
+        vectorized = spec.get('vectorized', False)
+        master_seed = self.master_seed
+        if spec.get('common_random_numbers', True):
+            master_seed = self.master_seed if self.master_seed is not None else randint(0, MASTER_SEED_MAX)
+            print "Common random numbers, master seed:", master_seed
+        simulations_no = runAndSaveScenarios(spec, master_seed=master_seed, sampling=self.sampling, antithetic=self.antithetic,
+                                             importance_sampling=self.importance_sampling,
+                                             fine_iterations_number=self.fine_iterations_number, stage_cache=self.stage_cache,
+                                             persistence=self.persistence)
+        for simulation_no in simulations_no:
+            print "Simulation %s - %s" % (simulation_no, self.db.getSimulationRecord(simulation_no)["comment"])
+
+        if spec.get('common_random_numbers', True):
+            for simulation_no in simulations_no[1:]:
+                print "Paired differences of simulation %s from simulation %s:" % (simulation_no, simulations_no[0])
+                differences = comparePairedSimulations(simulations_no[0], simulation_no)
+                for field, result in differences.items():
+                    print "  %s: %.6f +/- %.6f (pairs %s, correlation %.3f)" % (
+                        field, result['mean'], result['ci'], result['pairs'], result['correlation'])
 
     ####################################################################################################################
 
@@ -318,6 +577,15 @@ class Interface():
         return getInputInt(
             "Please enter iteration of Simulation %s for %s from %s (or press Enter to use first): " % (simulation_no, text, iterations), 1)
 
+    def checkSavedField(self, simulation_no, iteration_no, field):
+        """return  True if @field of iteration is saved, otherwise prints persistence profile of simulation"""
+        if self.db.hasIterationField(simulation_no, iteration_no, field):
+            return True
+        record = self.db.getSimulationRecord(simulation_no)
+        print "Iteration %s of simulation %s has no %s - simulation saved %r fields of iterations (--persistence)" % (
+            iteration_no, simulation_no, field, record.get('persistence', PERSISTENCE_DEFAULT))
+        return False
+
     def getSimulationIterationNums(self, text):
         """User input for choosing simulation no and iteration no"""
         simulation_no = self.getInputSimulation(text)
@@ -382,7 +650,7 @@ class Interface():
         """Exits from menu"""
         raise KeyboardInterrupt("Exit command selected")
 
-    def noMethod(self):
+    def noMethod(self, *args):
         """Shows in case of error while choosing menu item"""
         print "No such function. Try again from allowed %s" % commands.values()
 
@@ -398,23 +666,73 @@ class Interface():
                 print "%s = %s" % (k, v)
 
 
+def parseLine(line):
+    """return  command and list of its arguments from user line, example 'resume 12' -> ('resume', [12])"""
+    words = line.split() or ['']
+    args = [int(word) if word.isdigit() else word for word in words[1:]]
+    return words[0], args
+
+
+def parseOptions(argv):
+    """return  dict with options (--shard i/N, --seed S, --sampling random|lhs|sobol|saltelli, --antithetic, --importance-sampling,
+    --multilevel N, --stage-cache, --persistence full|monthly|yearly|scalars|full_sampled, --profile, --profile-sample FRACTION)
+    and rest of command line @argv,
+    example: 21 1 10000 --shard 2/4 --seed 123 -> ({'shard': (2, 4), 'master_seed': 123}, ['21', '1', '10000'])"""
+    options = {}
+    words = []
+    argv = list(argv)
+    while argv:
+        word = argv.pop(0)
+        if word == '--shard':
+            shard_no, shards_number = map(int, argv.pop(0).split('/'))
+            if not 1 <= shard_no <= shards_number:
+                raise ValueError("Shard should be i/N where 1 <= i <= N")
+            options['shard'] = (shard_no, shards_number)
+        elif word == '--seed':
+            options['master_seed'] = int(argv.pop(0))
+        elif word == '--sampling':
+            options['sampling'] = argv.pop(0)
+        elif word == '--antithetic':
+            options['antithetic'] = True
+        elif word == '--importance-sampling':
+            options['importance_sampling'] = True
+        elif word == '--multilevel':
+            options['fine_iterations_number'] = int(argv.pop(0))
+        elif word == '--stage-cache':
+            options['stage_cache'] = True
+        elif word == '--persistence':
+            options['persistence'] = argv.pop(0)
+        elif word == '--profile':
+            options.setdefault('profiling', 0.0)
+        elif word == '--profile-sample':
+            options['profiling'] = float(argv.pop(0))
+        else:
+            words.append(word)
+    if 'shard' in options and 'master_seed' not in options:
+        raise ValueError("All shards of simulation should use the same --seed")
+    return options, words
+
+
 def printEntered(line):
     """print user choosed line"""
     print_separator()
-    if line in commands:
-        print "Entered %s - %s" % (line, commands[line])
+    command, args = parseLine(line)
+    if command in commands:
+        print "Entered %s - %s" % (line, commands[command])
     else:
         print "Entered %s " % (line, )
 
 
 def runMethod(obj, line):
-    """run method of Interface class, name of method is taken from GLOBAL dict commands"""
-    if line in commands:
-        method = getattr(obj, commands[line])
+    """run method of Interface class, name of method is taken from GLOBAL dict commands,
+    words after command are passed to method as arguments"""
+    command, args = parseLine(line)
+    if command in commands:
+        method = getattr(obj, commands[command])
     else:
-        method = getattr(obj, line, obj.noMethod)
+        method = getattr(obj, command, obj.noMethod)
     try:
-        method()
+        method(*args)
     except ValueError as e:
         print "-"*80
         print "Error: %r" %e
@@ -424,13 +742,19 @@ def runMethod(obj, line):
 if __name__ == '__main__':
     """This runs when this module executed"""
     try:
-        i = Interface()
-        i.help()
-        while True:
-            print_separator()
-            line = raw_input('Prompt command (For exit: 0 or stop; For help: help or h): ').strip()
+        options, argv = parseOptions(sys.argv[1:])
+        i = Interface(**options)
+        if argv:  # command from command line, example: python mirr.py resume 12 or python mirr.py 21 1 10000 --shard 2/4 --seed 123
+            line = " ".join(argv)
             printEntered(line)
             runMethod(i, line)
+        else:
+            i.help()
+            while True:
+                print_separator()
+                line = raw_input('Prompt command (For exit: 0 or stop; For help: help or h): ').strip()
+                printEntered(line)
+                runMethod(i, line)
     except KeyboardInterrupt:
         print sys.exc_info()[1]
     except:
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+"""Opt-in instrumentation of stages of iterations (config parsing, weather, plant, production, prices, report, IRR,
+serialization). Functions of stages are wrapped by @timed, which only checks a flag when profiling is off.
+When on (see setProfiling), each call adds its duration, growth of peak memory and minor page faults (allocation
+of new memory - Python 2 has no allocation tracing) to the stage, self values exclude nested stages.
+Workers return stages of tasks (see popStages), simulation sums them to its record (see mergeStages).
+Optionally a fraction of iterations is run under cProfile, stats are dumped per worker and merged per simulation."""
+
+import os
+import glob
+import time
+import pstats
+import cProfile
+import resource
+from functools import wraps
+from contextlib import contextmanager
+
+from annex import mkdir_p
+from constants import profile_directory
+
+STAGE_VALUES = ['calls', 'seconds', 'self_seconds', 'memory_kb', 'self_memory_kb', 'page_faults', 'self_page_faults']
+
+profiling = None  # option of process: None - off, 0.0 - stage timers, fraction > 0 - timers and cProfile of fraction of iterations
+enabled = False  # stage timers are on in current task
+stages = {}  # stages of current process - dict[name] = list of STAGE_VALUES
+stack = []  # running stages - [name, start time, peak memory, page faults, time, memory and page faults of nested stages]
+profiler = None  # cProfile of sampled iterations of profiler_simulation in current worker
+profiler_simulation = None
+
+
+def setProfiling(value):
+    """Sets profiling of simulations started later in this process (see Simulation.startSimulation),
+    @value - None (off), 0.0 (stage timers) or fraction of iterations profiled also by cProfile"""
+    global profiling
+    if value is not None and not 0 <= value <= 1:
+        raise ValueError("Fraction of profiled iterations should be between 0 and 1, not %r" % value)
+    profiling = value
+
+def getProfiling():
+    """return  profiling option of process (see setProfiling)"""
+    return profiling
+
+def enableTimers(value):
+    """Turns on stage timers in worker for task of simulation with profiling option @value"""
+    global enabled, stages
+    enabled = value is not None
+    stages = {}  # stages of failed task are not counted
+
+def getUsage():
+    """return  peak memory (kB) and minor page faults of process"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_maxrss, usage.ru_minflt
+
+@contextmanager
+def stage(name):
+    """Context of stage @name, measured only if timers are enabled and stage is not nested in itself"""
+    if not enabled or any(frame[0] == name for frame in stack):
+        yield
+        return
+    memory, faults = getUsage()
+    frame = [name, time.time(), memory, faults, 0.0, 0, 0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        memory, faults = getUsage()
+        seconds, memory, faults = time.time() - frame[1], memory - frame[2], faults - frame[3]
+        values = stages.setdefault(name, [0] * len(STAGE_VALUES))
+        for i, value in enumerate([1, seconds, seconds - frame[4], memory, memory - frame[5], faults, faults - frame[6]]):
+            values[i] += value
+        if stack:  # nested stage is excluded from self values of parent
+            stack[-1][4] += seconds
+            stack[-1][5] += memory
+            stack[-1][6] += faults
+
+def timed(name):
+    """Decorator measuring calls of function as stage @name"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def popStages():
+    """return  stages measured in current task and clears them, None if timers are off"""
+    global stages
+    if not enabled:
+        return None
+    result, stages = stages, {}
+    return result
+
+def mergeStages(total, part):
+    """return  @total stages with added stages @part (dicts[name] = list of STAGE_VALUES)"""
+    for name, values in part.items():
+        total[name] = [a + b for a, b in zip(total.get(name, [0] * len(STAGE_VALUES)), values)]
+    return total
+
+def isProfiledTask(first_iteration_no, number, value):
+    """return  True if task with @number iterations from @first_iteration_no contains iteration profiled by cProfile,
+    with profiling option @value each round(1 / value)-th iteration (1, 1 + step ...) is profiled"""
+    if not value:
+        return False
+    step = max(1, int(round(1 / value)))
+    first_profiled = -(-(first_iteration_no - 1) // step) * step + 1
+    return first_profiled < first_iteration_no + number
+
+@contextmanager
+def profileTask(simulation_no, profiled):
+    """Runs task of simulation @simulation_no under cProfile of worker if @profiled, stats of all profiled tasks
+    of worker are dumped after each task to file of worker (see mergeProfiles)"""
+    global profiler, profiler_simulation
+    if not profiled:
+        yield
+        return
+    if profiler_simulation != simulation_no:
+        profiler, profiler_simulation = cProfile.Profile(), simulation_no
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        mkdir_p(profile_directory)
+        profiler.dump_stats(getProfilePath(simulation_no, os.getpid()))
+
+def getProfilePath(simulation_no, pid=None):
+    """return  path of cProfile stats of simulation @simulation_no, of worker @pid or merged"""
+    if pid is None:
+        return os.path.join(profile_directory, 'simulation_%s.prof' % simulation_no)
+    return os.path.join(profile_directory, 'simulation_%s.%s.prof' % (simulation_no, pid))
+
+def mergeProfiles(simulation_no):
+    """Merges stats dumped by workers (and previously merged stats of resumed simulation) to one file,
+    return  its path or None if no iteration was profiled"""
+    path = getProfilePath(simulation_no)
+    worker_paths = glob.glob(getProfilePath(simulation_no, '*'))
+    paths = worker_paths + ([path] if os.path.exists(path) else [])
+    if not paths:
+        return None
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(path)
+    for worker_path in worker_paths:
+        os.remove(worker_path)
+    return path
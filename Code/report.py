@@ -14,6 +14,7 @@ from sm import SubsidyModule
 from ecm import EconomicModule
 from base_class import BaseClassConfig
 from config_readers import MainConfig
+from profiling import timed
 
 
 class Report(BaseClassConfig):
@@ -31,6 +32,7 @@ class Report(BaseClassConfig):
         self.subsidy_module = economic_module.subsidy_module #creating short link to SM
         self.energy_module = self.technology_module.energy_module #creating short link to EM
 
+    @timed('report')
     def calcReportValues(self):
         """Main function to cacl all values for reports"""
         self.initAttrs()  #creating main containers for values
@@ -54,6 +56,7 @@ class Report(BaseClassConfig):
         self.calcWACC()
         self.calcNPV()
         self.calcTEP()
+        self.calcControlVariates()
 
     def startProjectOrderedDict(self, name=PROJECT_START, value=""):
         """prepare OrderedDict"""
@@ -493,6 +496,12 @@ class Report(BaseClassConfig):
         self.electricity_production_2ndyear = sum(prod for date, prod in ep.items() if date.year == last_day.year +  1) / 1000.0 # [kWh] -> [MWh]
         self.total_power = self.technology_module.plant.getPlantPower()
 
+    def calcControlVariates(self):
+        """Takes random shocks of weather and prices with known mean (CONTROL_VARIATE_FIELDS) for control variates of stats"""
+        self.weather_shock = self.energy_module.weather_shock
+        self.price_shock = self.economic_module.price_shock
+        self.fit_shock = self.subsidy_module.MWhFIT / self.subsidy_module.getExpectedMWhFIT(self.economic_module.country) - 1
+
     def calcNPV(self):
         """Calculation of monthly and yearly NPV for owners and project"""
 
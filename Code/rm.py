@@ -1,13 +1,17 @@
 import os
 import csv
 import datetime
+import numpy
 from database import Database
-from numpy import std, mean, median, absolute, diff, var
+from numpy import std, mean, median, absolute, diff, var, sqrt, floor, ceil, percentile, log, sign, array
+from numpy.linalg import lstsq, pinv
 from scipy.stats import skew, kurtosis, normaltest
 from collections import OrderedDict
 from config_readers import RiskModuleConfigReader
 import scipy.stats as stat
-from constants import report_directory, CORRELLATION_FIELDS
+from constants import report_directory, CORRELLATION_FIELDS, CONVERGENCE_QUANTILES, CONVERGENCE_Z, STATS_PERCENTILES, \
+    STATS_VAR_LEVELS, STATS_SKETCH_POINTS, IMPORTANCE_SAMPLING_HURDLES, IMPORTANCE_SAMPLING_PERCENTILES, SENSITIVITY_BOOTSTRAP, \
+    SENSITIVITY_CONFIDENCE
 from annex import convert2excel, uniquifyFilename, getOnlyDigitsList, transponseCsv, addHeaderCsv, dot2comma
 from charts import plotIRRChart, plotHistogramsChart, plotElectricityChart, plotWeatherChart, \
     plotElectricityHistogram, plotTotalEnergyProducedChart
@@ -41,6 +45,20 @@ def calcStatistics(values):
         result['variance'] = var(values)
     return  result
 
+def calcRiskMeasures(values, percentiles=STATS_PERCENTILES, var_levels=STATS_VAR_LEVELS):
+    """input @list of values
+    output @dict with percentiles, VaR (quantile of lower tail) and CVaR (mean of lower tail) for @var_levels
+    """
+    result = OrderedDict()
+    result['percentiles'] = OrderedDict(('p%g' % p, percentile(values, p)) for p in percentiles)
+    result['VaR'] = OrderedDict()
+    result['CVaR'] = OrderedDict()
+    for level in var_levels:
+        value_at_risk = percentile(values, level * 100)
+        result['VaR']['p%g' % (level * 100)] = value_at_risk
+        result['CVaR']['p%g' % (level * 100)] = mean([v for v in values if v <= value_at_risk])
+    return result
+
 def calculateRequiredRateOfReturn(stdev, skewness, excess_kurtosis, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium):
     """Return riskFreeRate (config) + spreadCDS (config) + illiquidity premium + std(irr_values) * AdjustedSharpeRatio"""
     adjustedSR = benchmarkAdjustedSharpeRatio * (1 + skewness/6 * benchmarkAdjustedSharpeRatio - (excess_kurtosis - 3)/24 * benchmarkAdjustedSharpeRatio * benchmarkAdjustedSharpeRatio)
@@ -85,7 +103,7 @@ def normalityTest(values_orig, significance_levels=(0.05, 0.01, 0.001)):
     values = list(values_orig)
     values[0] += 1e-5
 
-    if len(values) < 3:
+    if len(values) < 8:  # normaltest is not valid with less than 8 samples
         stat_val, p_val = -1, 100
     else:
         stat_val, p_val = normaltest(values)
@@ -99,6 +117,39 @@ def normalityTest(values_orig, significance_levels=(0.05, 0.01, 0.001)):
             result[str_level] = True
     return result
 
+def normalityTestFromMoments(n, S, K, significance_levels=(0.05, 0.01, 0.001)):
+    """Performs D'Agostino-Pearson test (as scipy.stats.normaltest) using only number of values @n,
+    skewness @S and kurtosis @K (Fisher definition), returns the same dict as normalityTest"""
+    if n < 8 or S != S or K != K:
+        p_val = 100
+    else:
+        y = S * sqrt((n + 1.0) * (n + 3) / (6.0 * (n - 2)))  # skewtest
+        beta2 = 3.0 * (n * n + 27 * n - 70) * (n + 1) * (n + 3) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+        W2 = -1 + sqrt(2 * (beta2 - 1))
+        delta = 1 / sqrt(0.5 * log(W2))
+        alpha = sqrt(2.0 / (W2 - 1))
+        y = y if y != 0 else 1
+        Z_skew = delta * log(y / alpha + sqrt((y / alpha) ** 2 + 1))
+
+        E = 3.0 * (n - 1) / (n + 1)  # kurtosistest
+        varb2 = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+        x = (K + 3 - E) / sqrt(varb2)
+        sqrtbeta1 = 6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) * sqrt(6.0 * (n + 3) * (n + 5) / (n * (n - 2) * (n - 3)))
+        A = 6.0 + 8.0 / sqrtbeta1 * (2.0 / sqrtbeta1 + sqrt(1 + 4.0 / sqrtbeta1 ** 2))
+        denom = 1 + x * sqrt(2 / (A - 4.0))
+        if denom == 0:
+            p_val = 100
+        else:
+            term2 = sign(denom) * ((1 - 2.0 / A) / absolute(denom)) ** (1 / 3.0)
+            Z_kurtosis = (1 - 2 / (9.0 * A) - term2) / sqrt(2 / (9.0 * A))
+            p_val = stat.chi2.sf(Z_skew ** 2 + Z_kurtosis ** 2, 2)
+
+    result = OrderedDict()  # init result container
+    for significance in significance_levels:
+        str_level = "{0:.3f}".format(1 - significance).replace(".", ",") # format with comma for excel
+        result[str_level] = not p_val < significance
+    return result
+
 def printSimulationStats(irr_values_lst):
     """Prints statistics of irr values"""
     for dic in irr_values_lst:
@@ -362,9 +413,11 @@ def saveStochasticValuesSimulation(dic_values, simulation_no, country):
 
     print "Stochastic Report outputed to file %s" % (xls_output_filename)  #printing path to generated report
 
-def calcSimulationStatistics(field_names, irr_values, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium):
+def calcSimulationStatistics(field_names, irr_values, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium, controls=None):
     """
     inputs: @field_names - list of irr field names for @irr_values
+            @controls - dict[name] = (values of iterations, known mean) of control variates, with them
+            control variate estimate of mean is added (see calcControlVariateEstimate)
     output: list of dicts with irr statistics for each irr_type
     """
     results = []
@@ -381,11 +434,369 @@ def calcSimulationStatistics(field_names, irr_values, riskFreeRate, spreadCDS, b
         result['normaltest'] = normalityTest(digit_irr)
         result['required_rate_of_return'] = calculateRequiredRateOfReturn(
             result['std'], result['skew'], result['kurtosis'], riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium)
+        if digit_irr:
+            result.update(calcRiskMeasures(digit_irr))  # percentiles, VaR and CVaR
+        if controls:
+            result['control_variate'] = calcControlVariateEstimate(irr, controls)  # adjusted mean beside raw mean
 
         results.append(result)
 
     return results  # return list of dicts
 
+def calcControlVariateEstimate(values, controls, z=CONVERGENCE_Z):
+    """
+    inputs: @values - list of values of iterations (not digit values are skipped)
+            @controls - dict[name] = (values of iterations, known mean) of auxiliary values correlated with @values
+    output: dict with control variate estimate of mean - mean of @values minus regression on deviations of control means
+            from known means, its standart error and half-width of CI, regression coefficients, raw mean with its
+            standart error and variance_reduction (how many times is variance of estimate lower than of raw mean)
+    """
+    names = controls.keys()
+    rows = [[value] + [controls[name][0][i] for name in names] for i, value in enumerate(values)]
+    rows = array([row for row in rows if len(getOnlyDigitsList(row)) == len(row)], dtype=float)
+    result = OrderedDict()
+    n, p = len(rows), len(names)
+    if n <= p + 1:
+        result.update([('mean', float('nan')), ('se', float('nan')), ('ci', float('inf'))])
+        return result
+
+    y, x = rows[:, 0], rows[:, 1:]
+    x_mean = x.mean(axis=0)
+    x_centered = x - x_mean
+    beta = lstsq(x_centered, y - y.mean(), rcond=None)[0]
+    residuals = y - y.mean() - x_centered.dot(beta)
+    residual_variance = residuals.dot(residuals) / (n - p - 1)
+    deviation = x_mean - array([controls[name][1] for name in names])  # of control means from known means
+    se = sqrt(residual_variance * (1.0 / n + deviation.dot(pinv(x_centered.T.dot(x_centered))).dot(deviation)))
+    raw_se = std(y, ddof=1) / sqrt(n)
+
+    result['mean'] = y.mean() - deviation.dot(beta)
+    result['se'] = se
+    result['ci'] = z * se
+    result['coefficients'] = OrderedDict(zip(names, beta))
+    result['raw_mean'] = y.mean()
+    result['raw_se'] = raw_se
+    result['variance_reduction'] = raw_se ** 2 / se ** 2 if se > 0 else float('inf')
+    return result
+
+def calcAccumulatorsStatistics(field_names, accumulators, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium):
+    """
+    inputs: @field_names - list of irr field names for @accumulators (see stats_accumulator)
+    output: list of dicts with the same irr statistics as calcSimulationStatistics calculated from streamed stats,
+            values are replaced by STATS_SKETCH_POINTS quantiles (approximation for charts)
+    """
+    results = []
+    for field_name, accumulator in zip(field_names, accumulators):
+        result = {}  # init dict for saving stats
+        result['field'] = field_name  # what irr values was used (name of filed)
+        result['streamed'] = True  # stats are calculated from accumulator, values are approximated
+        result['count'] = accumulator.getCount()
+        result[field_name] = result['digit_values'] = accumulator.getQuantilePoints(STATS_SKETCH_POINTS) if result['count'] else []
+        result.update(accumulator.getStatistics())  # adding all statistics (stdevm min, max etc)
+        result['JBTest_value'] = result['count'] / 6.0 * (result['skew'] ** 2 + result['kurtosis'] ** 2 / 4.0)  # JB statistics value
+        result['JBTest'] = JarqueBeraTest(JB_stat_value=result['JBTest_value'])  # JB test result for different significance levels
+        result['normaltest'] = normalityTestFromMoments(result['count'], result['skew'], result['kurtosis'])
+        result['required_rate_of_return'] = calculateRequiredRateOfReturn(
+            result['std'], result['skew'], result['kurtosis'], riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium)
+        result.update(accumulator.getRiskMeasures())  # percentiles, VaR and CVaR
+
+        results.append(result)
+
+    return results  # return list of dicts
+
+def calcConvergence(values, quantiles=CONVERGENCE_QUANTILES, z=CONVERGENCE_Z):
+    """input @list of values (only digits)
+    output @dict with keys - metric name (mean, p5, p50 ...), value=dict with estimate, standart error and
+    half-width of confidence interval of estimate
+    CI of quantile is taken between order statistics n*p -+ z*sqrt(n*p*(1-p))
+    """
+    result = OrderedDict()
+    values = sorted(values)
+    n = len(values)
+    if n < 2:
+        for name in ['mean'] + ['p%g' % (q * 100) for q in quantiles]:
+            result[name] = {'value': float('nan'), 'se': float('nan'), 'ci': float('inf')}
+        return result
+
+    se = std(values, ddof=1) / sqrt(n)
+    result['mean'] = {'value': mean(values), 'se': se, 'ci': z * se}
+    for q in quantiles:
+        spread = z * sqrt(n * q * (1 - q))
+        low = max(int(floor(n * q - spread)), 0)
+        high = min(int(ceil(n * q + spread)), n - 1)
+        ci = (values[high] - values[low]) / 2.0
+        result['p%g' % (q * 100)] = {'value': percentile(values, q * 100), 'se': ci / z, 'ci': ci}
+    return result
+
+def calcSimulationConvergence(field_names, irr_values, tolerances):
+    """
+    inputs: @field_names - list of irr field names for @irr_values
+            @tolerances - dict with max CI half-width for each field name
+    output: dict[field_name] = convergence metrics (see calcConvergence) with flag 'converged' for each metric
+            and flag if all metrics of all fields are converged
+    """
+    results = OrderedDict()
+    converged = True
+    for field_name, irr in zip(field_names, irr_values):
+        metrics = calcConvergence(getOnlyDigitsList(irr))
+        for metric in metrics.values():
+            metric['converged'] = bool(metric['ci'] <= tolerances[field_name])
+            converged = converged and metric['converged']
+        results[field_name] = metrics
+    return results, converged
+
+def calcPairsCorrelation(a, b):
+    """return  correlation of paired values @a and @b, nan for less than 3 pairs (2 pairs are always exactly correlated)
+    or when it is not defined (constant values), floating point errors are not raised (see annex)"""
+    if len(a) < 3:
+        return float('nan')
+    with numpy.errstate(all='ignore'):
+        correlation = numpy.corrcoef(array(a, dtype=float), array(b, dtype=float))[0, 1]
+    return float(correlation) if numpy.isfinite(correlation) else float('nan')
+
+def calcAntitheticStatistics(field_names, values, pairs, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of field names for @values (lists of values of iterations)
+            @pairs - list of (index of original, index of mirrored iteration) in lists of @values
+    output: dict[field_name] = mean of pair averages with standart error and half-width of CI,
+            correlation of pairs and variance_reduction - how many times is variance of mean lower than
+            with the same number of independent iterations
+    """
+    results = OrderedDict()
+    for field_name, field_values in zip(field_names, values):
+        pair_values = [(field_values[i], field_values[j]) for i, j in pairs]
+        pair_values = [pair for pair in pair_values if len(getOnlyDigitsList(pair)) == 2]  # both irr are digits
+        result = {'pairs': len(pair_values)}
+        if len(pair_values) < 2:
+            result.update({'mean': float('nan'), 'se': float('nan'), 'ci': float('inf'),
+                           'correlation': float('nan'), 'variance_reduction': float('nan')})
+        else:
+            originals, mirrors = zip(*pair_values)
+            averages = [(a + b) / 2.0 for a, b in pair_values]
+            se = std(averages, ddof=1) / sqrt(len(averages))
+            variance = var(averages, ddof=1)
+            result['mean'] = mean(averages)
+            result['se'] = se
+            result['ci'] = z * se
+            result['correlation'] = calcPairsCorrelation(originals, mirrors)
+            result['variance_reduction'] = var(originals + mirrors, ddof=1) / (2 * variance) if variance > 0 else float('inf')
+        results[field_name] = result
+    return results
+
+def calcReplicatesStatistics(field_names, values, replicates, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of field names for @values (lists of values of iterations)
+            @replicates - list with number of replicate of each iteration (randomized QMC, see config_yaml_reader.SobolSampling)
+    output: dict[field_name] = mean of replicate means with standart error and half-width of CI estimated
+            from spread of replicate means (QMC error)
+    """
+    results = OrderedDict()
+    for field_name, field_values in zip(field_names, values):
+        replicate_values = OrderedDict()
+        for replicate, value in zip(replicates, field_values):
+            replicate_values.setdefault(replicate, []).append(value)
+        replicate_means = [mean(digit_values) for digit_values in map(getOnlyDigitsList, replicate_values.values()) if digit_values]
+        result = {'replicates': len(replicate_means), 'replicate_means': replicate_means}
+        if len(replicate_means) < 2:
+            result.update({'mean': mean(replicate_means) if replicate_means else float('nan'), 'se': float('nan'), 'ci': float('inf')})
+        else:
+            se = std(replicate_means, ddof=1) / sqrt(len(replicate_means))
+            result.update({'mean': mean(replicate_means), 'se': se, 'ci': z * se})
+        results[field_name] = result
+    return results
+
+def calcWeightedQuantile(values, weights, q):
+    """return  quantile @q (0..1) of @values with @weights - lowest value where normalized cumulative weight reaches @q"""
+    order = values.argsort(kind='mergesort')
+    cumulative = weights[order].cumsum() / weights.sum()
+    return values[order][min(cumulative.searchsorted(q), len(values) - 1)]
+
+def calcImportanceSamplingStatistics(field_names, values, weights, hurdles=IMPORTANCE_SAMPLING_HURDLES,
+                                     percentiles=IMPORTANCE_SAMPLING_PERCENTILES, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of field names for @values (lists of values of iterations drawn with tilted distributions)
+            @weights - likelihood ratio of each iteration (see annex.getLikelihoodRatio)
+    output: dict[field_name] = weighted (self-normalized) mean, probabilities of value below @hurdles with standart error
+            and half-width of CI, low @percentiles, effective sample size and mean weight (should be close to 1)
+    """
+    results = OrderedDict()
+    for field_name, field_values in zip(field_names, values):
+        pairs = [(value, weight) for value, weight in zip(field_values, weights) if len(getOnlyDigitsList([value, weight])) == 2]
+        result = {'iterations': len(pairs)}
+        if len(pairs) < 2:
+            result.update({'mean': float('nan'), 'probabilities': [], 'percentiles': OrderedDict(),
+                           'effective_sample_size': 0.0, 'mean_weight': float('nan')})
+        else:
+            field_array, weights_array = array(pairs, dtype=float).T
+            total = weights_array.sum()
+            result['mean'] = (weights_array * field_array).sum() / total
+            result['probabilities'] = []  # list, hurdles with dots can not be keys in db
+            for hurdle in hurdles:
+                below = (field_array < hurdle).astype(float)
+                probability = (weights_array * below).sum() / total
+                se = sqrt((weights_array ** 2 * (below - probability) ** 2).sum()) / total  # delta method
+                result['probabilities'].append({'hurdle': hurdle, 'probability': probability, 'se': se, 'ci': z * se})
+            result['percentiles'] = OrderedDict(('p%g' % p, calcWeightedQuantile(field_array, weights_array, p / 100.0))
+                                                for p in percentiles)
+            result['effective_sample_size'] = total ** 2 / (weights_array ** 2).sum()
+            result['mean_weight'] = weights_array.mean()
+        results[field_name] = result
+    return results
+
+def calcMultilevelStatistics(field_names, values, coarse_values, levels, costs, coarse_costs, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of field names for @values and @coarse_values (lists of values of iterations of daily
+            and coarse model, for level 0 iterations both are values of coarse model)
+            @levels - level of each iteration (0 - coarse model only, 1 - coupled daily and coarse model)
+            @costs - seconds of calculation of each iteration
+            @coarse_costs - seconds of calculation of coarse model (without stages shared with daily model) of each iteration
+    output: dict[field_name] = multilevel mean (mean of coarse model over level 0 iterations plus mean difference of
+            daily and coarse model over level 1 iterations), its standart error and half-width of CI, list of levels
+            with number of iterations, mean, variance and cost, optimal share of level 1 iterations (N_l ~ sqrt(V_l / C_l))
+            and estimated speedup against plain simulation with daily model with the same precision
+    """
+    results = OrderedDict()
+    for field_name, field_values, field_coarse_values in zip(field_names, values, coarse_values):
+        level_values = {0: [], 1: []}
+        level_costs = {0: [], 1: []}
+        fine_values, fine_costs = [], []
+        for value, coarse_value, level, cost, coarse_cost in zip(field_values, field_coarse_values, levels, costs, coarse_costs):
+            if level not in level_values or len(getOnlyDigitsList([value, coarse_value])) != 2:
+                continue
+            level_values[level].append(value - coarse_value if level else value)
+            if level:
+                fine_values.append(value)
+            if isinstance(cost, (int, float)):
+                level_costs[level].append(cost)
+                if level and isinstance(coarse_cost, (int, float)):
+                    fine_costs.append(cost - coarse_cost)  # daily model with shared stages
+
+        result = {'levels': []}
+        for level in [0, 1]:
+            level_array = array(level_values[level], dtype=float)
+            result['levels'].append({'level': level, 'iterations': len(level_array),
+                                     'mean': level_array.mean() if len(level_array) else float('nan'),
+                                     'variance': level_array.var(ddof=1) if len(level_array) > 1 else float('nan'),
+                                     'cost': mean(level_costs[level]) if level_costs[level] else float('nan')})
+        level0, level1 = result['levels']
+        result['mean'] = level0['mean'] + level1['mean']
+        result['se'] = sqrt(level0['variance'] / max(level0['iterations'], 1) + level1['variance'] / max(level1['iterations'], 1))
+        result['ci'] = z * result['se']
+
+        work0 = sqrt(level0['variance'] * level0['cost'])
+        work1 = sqrt(level1['variance'] * level1['cost'])
+        rate0 = sqrt(level0['variance'] / level0['cost']) if level0['cost'] > 0 else float('nan')
+        rate1 = sqrt(level1['variance'] / level1['cost']) if level1['cost'] > 0 else float('nan')
+        result['optimal_fine_share'] = rate1 / (rate0 + rate1) if rate0 + rate1 > 0 else float('nan')
+        fine_variance = var(fine_values, ddof=1) if len(fine_values) > 1 else float('nan')
+        fine_cost = mean(fine_costs) if fine_costs else float('nan')
+        result['speedup'] = fine_variance * fine_cost / (work0 + work1) ** 2 if work0 + work1 > 0 else float('nan')
+        results[field_name] = result
+    return results
+
+def estimateSobolIndices(f_a, f_b, f_ab):
+    """return  first order and total order Sobol indices of inputs from values of base rows in matrices A (@f_a), B (@f_b)
+    and AB_i (rows of @f_ab) - estimators of Saltelli 2010 (first order) and Jansen (total order)"""
+    variance = var(numpy.concatenate([f_a, f_b]))
+    if not variance > 0:
+        nan_values = numpy.full(len(f_ab), float('nan'))
+        return nan_values, nan_values
+    first_order = mean(f_b * (f_ab - f_a), axis=1) / variance
+    total_order = 0.5 * mean((f_a - f_ab) ** 2, axis=1) / variance
+    return first_order, total_order
+
+def calcSobolIndices(field_names, values, positions, inputs_number, bootstrap=SENSITIVITY_BOOTSTRAP,
+                     confidence=SENSITIVITY_CONFIDENCE, seed=1):
+    """
+    inputs: @field_names - list of field names for @values (lists of values of iterations of Saltelli design)
+            @positions - (base row, matrix) of each iteration, matrix 0 - A, 1 - B, 2 + i - AB_i (see SaltelliSampling)
+            @inputs_number - number of inputs (d), base row is used only when it has values in all d + 2 matrices
+            @bootstrap - number of resamples of base rows for percentile CI of indices with @confidence
+    output: dict[field_name] = first order and total order Sobol index of each input, their CI (list of [low, high]),
+            variance of field and number of base rows, all indices are estimated from the same evaluations
+    """
+    base_rows = max(row for row, matrix in positions) + 1
+    results = OrderedDict()
+    for field_name, field_values in zip(field_names, values):
+        matrices = numpy.full((inputs_number + 2, base_rows), float('nan'))
+        for value, (row, matrix) in zip(field_values, positions):
+            if isinstance(value, (int, float)):
+                matrices[matrix, row] = value
+        matrices = matrices[:, ~numpy.isnan(matrices).any(axis=0)]  # complete base rows
+        result = {'base_rows': matrices.shape[1]}
+        if matrices.shape[1] < 2:
+            nan_values = [float('nan')] * inputs_number
+            result.update({'first_order': nan_values, 'total_order': nan_values, 'variance': float('nan'),
+                           'first_order_ci': [[float('nan')] * 2] * inputs_number, 'total_order_ci': [[float('nan')] * 2] * inputs_number})
+            results[field_name] = result
+            continue
+        first_order, total_order = estimateSobolIndices(matrices[0], matrices[1], matrices[2:])
+        random_state = numpy.random.RandomState(seed)
+        resamples = []
+        for _ in range(bootstrap):  # evaluations are reused, only base rows are resampled
+            resampled = matrices[:, random_state.randint(0, matrices.shape[1], matrices.shape[1])]
+            resamples.append(estimateSobolIndices(resampled[0], resampled[1], resampled[2:]))
+        tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+        result['first_order'] = first_order.tolist()
+        result['total_order'] = total_order.tolist()
+        result['first_order_ci'] = numpy.nanpercentile([r[0] for r in resamples], tails, axis=0).T.tolist()
+        result['total_order_ci'] = numpy.nanpercentile([r[1] for r in resamples], tails, axis=0).T.tolist()
+        result['variance'] = var(numpy.concatenate([matrices[0], matrices[1]]))
+        results[field_name] = result
+    return results
+
+def calcPairedDifferences(field_names, base_values, values, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of compared fields
+            @base_values, @values - dict[iteration_no] = list of values of @field_names of two simulations run with
+            the same seeds of iterations (common random numbers)
+    output: dict[field_name] = mean difference (@values - @base_values) of iterations with the same number,
+            its standart error, half-width of CI, number of pairs and correlation of pairs
+    """
+    results = OrderedDict()
+    iterations = sorted(set(base_values) & set(values))
+    for i, field_name in enumerate(field_names):
+        pairs = [(base_values[iteration_no][i], values[iteration_no][i]) for iteration_no in iterations]
+        pairs = [pair for pair in pairs if len(getOnlyDigitsList(pair)) == 2]
+        result = {'pairs': len(pairs)}
+        if len(pairs) < 2:
+            result.update({'mean': float('nan'), 'se': float('nan'), 'ci': float('inf'), 'correlation': float('nan')})
+        else:
+            base, compared = array(pairs, dtype=float).T
+            differences = compared - base
+            se = std(differences, ddof=1) / sqrt(len(differences))
+            result['mean'] = differences.mean()
+            result['se'] = se
+            result['ci'] = z * se
+            result['correlation'] = calcPairsCorrelation(base, compared)
+        results[field_name] = result
+    return results
+
+def calcSweepSwings(field_names, base_values, perturbed_values, z=CONVERGENCE_Z):
+    """
+    inputs: @field_names - list of fields
+            @base_values - dict[iteration_no] = list of values of @field_names of baseline simulation
+            @perturbed_values - list of (low values, high values) of simulations with one parameter set to its low and high
+            value, run with the same seeds as first iterations of baseline (common random numbers)
+    output: dict[field_name] = dict with mean of baseline and list of swings of parameters - means of low and high
+            simulations estimated as mean of baseline + paired difference (see calcPairedDifferences), half-width of their CI,
+            swing (high - low) and half-width of its CI (paired difference of high and low simulation)
+    """
+    results = OrderedDict()
+    for i, field_name in enumerate(field_names):
+        base = getOnlyDigitsList([values[i] for values in base_values.values()])
+        results[field_name] = {'base': mean(base) if base else float('nan'), 'swings': []}
+    for low_values, high_values in perturbed_values:
+        low = calcPairedDifferences(field_names, base_values, low_values, z)
+        high = calcPairedDifferences(field_names, base_values, high_values, z)
+        swing = calcPairedDifferences(field_names, low_values, high_values, z)
+        for field_name, result in results.items():
+            result['swings'].append({'low': result['base'] + low[field_name]['mean'], 'low_ci': low[field_name]['ci'],
+                                     'high': result['base'] + high[field_name]['mean'], 'high_ci': high[field_name]['ci'],
+                                     'swing': swing[field_name]['mean'], 'swing_ci': swing[field_name]['ci'],
+                                     'pairs': swing[field_name]['pairs']})
+    return results
+
 def analyseSimulationResults(simulation_no, yearly=False):
     """
     1 Gets from DB yearly values of irr
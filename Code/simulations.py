@@ -1,73 +1,476 @@
+import atexit
 import datetime
 import multiprocessing
 import numpy
 import random
+import resource
 import sys
+import time
+import yaml
+from itertools import product
 
-from annex import convertValue, setupPrintProgress
-from collections import defaultdict
+from annex import convertValue, setupPrintProgress, setAntithetic, setImportanceSampling, getLikelihoodRatio, getListDates, \
+    getOnlyDigitsList, setRandomStreams, hashSeed
+from collections import defaultdict, OrderedDict
 from config_readers import RiskModuleConfigReader, MainConfig
-from constants import IRR_REPORT_FIELDS, TEP_REPORT_FIELDS
+from config_yaml_reader import setSampling, SobolSampling, setConfigOverrides, get_override_name, get_saltelli_position, \
+    get_saltelli_seed_iteration
+from constants import IRR_REPORT_FIELDS, TEP_REPORT_FIELDS, VECTORIZED_BLOCK_SIZE, WORKERS_NUMBER, \
+    ITERATIONS_CHUNK_SIZE, WORKER_MAX_TASKS, WORKER_MAX_MEMORY, CONVERGENCE_WAVE_SIZE, CONVERGENCE_MAX_ITERATIONS, \
+    CONVERGENCE_TOLERANCES, STATS_VALUES_MAX_ITERATIONS, RESULTS_FIELDS, RESULTS_BUFFER_MIN_ROWS, MASTER_SEED_MAX, \
+    RESULTS_NPV_FIELDS, CONTROL_VARIATE_FIELDS, CONTROL_VARIATE_MEANS, PAIRED_DIFFERENCE_FIELDS, IMPORTANCE_SAMPLING_FIELDS, \
+    SENSITIVITY_INPUTS, SENSITIVITY_FIELDS, SWEEP_FIELDS, SWEEP_ITERATIONS, PORTFOLIO_PLANT_FIELDS, PERSISTENCE_PROFILES, \
+    PERSISTENCE_SAMPLE_STEP, PERSISTENCE_DEFAULT
+import database
 from database import Database
-from rm import calcSimulationStatistics
+from rm import calcSimulationStatistics, calcSimulationConvergence, calcAccumulatorsStatistics, calcAntitheticStatistics, \
+    calcReplicatesStatistics, calcPairedDifferences, calcImportanceSamplingStatistics, calcMultilevelStatistics, calcSobolIndices, \
+    calcSweepSwings, calcStatistics
+from stats_accumulator import StatsAccumulator, accumulateResults, mergeAccumulators
 
 from config_readers import MainConfig
-from ecm import EconomicModule
+from ecm import EconomicModule, generateElectricityPrices
+from metrics import RunMetrics
+from profiling import timed, stage, getProfiling, enableTimers, popStages, mergeStages, isProfiledTask, profileTask, mergeProfiles, \
+    STAGE_VALUES
+from financial_analysis import CashFlows
 from em import EnergyModule
 from enm import EnvironmentalModule
 from report import Report
 from report_output import ReportOutput
 from sm import SubsidyModule
 from tm import TechnologyModule
+from vectorized_engine import VectorizedIterations
 
 
 class Simulation:
     """Class for preparing, runinning and saving simulations to Database"""
 
-    def __init__(self, country, comment=''):
+    def __init__(self, country, comment='', simulation_no=None, config_overrides=None, plants=None):
         """Initializes simulation class, preparing storage and db links.
         @country: the country to run the simulation for.
-        @comment: user comment for this simulation."""
+        @comment: user comment for this simulation.
+        @simulation_no: number of existing simulation (for resuming), by default new number is reserved
+        @config_overrides: dict[name] = raw value replacing value of config file in iterations of simulation
+        (see config_yaml_reader.setConfigOverrides), config files are not changed
+        @plants: list of (country, config overrides) of plants of portfolio simulation (see PortfolioIteration),
+        iterations have portfolio results, @country is used for record and risk configs"""
         self.db =  Database()  #connection to Db
         self.comment = comment  #user comment for current simulation
         self.country = country #country which data will be used in simulation
-        self.simulation_no = self.db.getNextSimulationNo()  #load last simulation no from db
+        if simulation_no is None:
+            simulation_no = self.db.getNextSimulationNo()  #load last simulation no from db
+        self.simulation_no = simulation_no
         self.rm_configs = RiskModuleConfigReader(self.country).getConfigsValues()
+        self.iterations_writer = self.db.getIterationsWriter()
+        self.accumulators = []  # streamed stats of irr and tep values (see stats_accumulator)
+        self.keep_values = True  # irr and tep values of all iterations are kept in memory for exact stats and charts
+        self.results_rows = 0  # number of rows of shared results buffer needed by simulation (max iteration number)
+        self.master_seed = None  # seeds of all iterations are derived from it (see getIterationSeed)
+        self.sampling = 'random'  # sampling of random config values: 'random' - independent draws, 'lhs' - latin hypercube, 'sobol' - QMC, 'saltelli' - sensitivity
+        self.antithetic = False  # iterations are run in pairs with mirrored random shocks (see runSimulation)
+        self.importance_sampling = False  # random values are tilted toward adverse outcomes, iterations have weights (see runSimulation)
+        self.fine_iterations_number = None  # number of first iterations run by coupled daily and monthly models in multilevel simulation
+        self.stage_cache = False  # vectorized engine loads unchanged stages from stage cache (see VectorizedIterations.runStage)
+        self.persistence = PERSISTENCE_DEFAULT  # profile of fields of iterations saved to db (see getPersistedLine)
+        self.profiling = None  # stage timers and fraction of iterations profiled by cProfile (see profiling.setProfiling)
+        self.stages = {}  # measured stages of iterations (see profiling.stage), dict[name] = list of STAGE_VALUES
+        self.task_seconds = defaultdict(float)  # seconds of setup, calculation and results of tasks in workers
+        self.config_overrides = dict(config_overrides or {})
+        self.plants = [(plant_country, dict(overrides)) for plant_country, overrides in plants] if plants else None
+        self.results_offset = 0  # first row of simulation in shared results buffer (simulations run together have own rows)
+        self.npvs = None  # npv values of iterations (RESULTS_NPV_FIELDS), None if iterations were saved without them
+        self.control_variates = None  # values of CONTROL_VARIATE_FIELDS of iterations for control variate estimates
+
+    def runSimulation(self, iterations_number, vectorized=False, master_seed=None, shard=None, sampling='random', antithetic=False,
+                      importance_sampling=False, fine_iterations_number=None, stage_cache=False, persistence=PERSISTENCE_DEFAULT):
+        """Run simulation with @iterations_number number of iterations.
+        @vectorized - if True iterations are calculated in blocks by vectorized engine
+        @master_seed - seed of simulation, the same seed gives the same iterations, by default random
+        @shard - (i, N) - only i-th of N disjoint parts of iterations is calculated (for running one simulation
+        on N machines with the same @master_seed, see mergeSimulations)
+        @sampling - 'random' or 'lhs' - random config values (delays, FIT, equipment parameters ...) are stratified
+        over all iterations by latin hypercube design, 'sobol' - main config values (QMC_VALUES) are driven by scrambled
+        Sobol sequences, QMC error of means is added (see addQmcStatsToSimulation), 'saltelli' - iterations evaluate
+        Saltelli sample matrices of SENSITIVITY_INPUTS (number of iterations is rounded up to whole groups of matrices),
+        Sobol sensitivity indices are added (see addSensitivityStatsToSimulation)
+        @antithetic - if True iterations are run in pairs, the second iteration of pair uses the same seed with mirrored
+        random shocks (prices, weather, failures), stats of pair averages are added (see addAntitheticStatsToSimulation)
+        @importance_sampling - if True delays, production corrections, price drift and failures are tilted toward adverse
+        outcomes (IMPORTANCE_SAMPLING_SHIFTS, IMPORTANCE_SAMPLING_FAILURE_RATES), each iteration gets likelihood ratio weight,
+        weighted tail stats of IRR are added (see addImportanceSamplingStatsToSimulation), other stats are not weighted
+        @fine_iterations_number - multilevel simulation (vectorized only): first @fine_iterations_number iterations are run
+        by daily model together with coupled monthly coarse model, the rest only by coarse model, multilevel estimates
+        are added (see addMultilevelStatsToSimulation), other stats mix values of both models
+        @stage_cache - (vectorized only) weather, price paths, plants and production of blocks are loaded from stage cache
+        if seeds and configs of these stages are the same as in previous simulation (the same @master_seed with changed
+        financial configs), results are the same as without cache
+        @persistence - profile of fields of iterations saved to db: 'full', 'monthly' (without daily series), 'yearly',
+        'scalars' (irr, npv, tep and configs) or 'full_sampled' (full only for each PERSISTENCE_SAMPLE_STEP-th iteration,
+        scalars for others), stats of simulation are the same with all profiles. Vectorized engine has no monthly and daily
+        series - 'full' and 'monthly' are saved as 'yearly' (see getEnginePersistence)"""
+        self.startSimulation(iterations_number, vectorized, master_seed, shard, sampling, antithetic, importance_sampling,
+                             fine_iterations_number, stage_cache, persistence)
+        result = self.runIterations(self.simulation_record["seeds"], vectorized)  # run all iterations with saving results
+        if self.keep_values:
+            self.setResults(result)
+        self.finishSimulation()
 
-    def runSimulation(self, iterations_number):
-        """Run simulation with @iterations_number number of iterations."""
+    def startSimulation(self, iterations_number, vectorized=False, master_seed=None, shard=None, sampling='random', antithetic=False,
+                        importance_sampling=False, fine_iterations_number=None, stage_cache=False, persistence=PERSISTENCE_DEFAULT):
+        """Prepares simulation record with seeds of iterations and saves it to db before iterations are run,
+        parameters - see runSimulation"""
+        if fine_iterations_number is not None:
+            if not vectorized or antithetic or importance_sampling:
+                raise ValueError("Multilevel simulation runs only with vectorized engine, without antithetic and importance sampling")
+            fine_iterations_number = min(-(-fine_iterations_number // VECTORIZED_BLOCK_SIZE) * VECTORIZED_BLOCK_SIZE, iterations_number)  # whole blocks
+        if sampling == 'saltelli':
+            if antithetic or importance_sampling or fine_iterations_number is not None:
+                raise ValueError("Saltelli sampling runs without antithetic, importance sampling and multilevel simulation")
+            group_size = (len(SENSITIVITY_INPUTS) + 2) * VECTORIZED_BLOCK_SIZE  # base rows of block in all matrices
+            if iterations_number % group_size:
+                iterations_number += group_size - iterations_number % group_size
+                print "Saltelli sample matrices are run in whole groups - number of iterations is increased to %s" % iterations_number
+        persistence = getEnginePersistence(persistence, vectorized)
+        if self.plants and (vectorized or sampling != 'random' or importance_sampling or self.config_overrides):
+            raise ValueError("Portfolio simulation runs only with classic engine, random sampling, without importance sampling "
+                             "and simulation config overrides (overrides are set for plants)")
+        if antithetic and iterations_number % 2:
+            iterations_number += 1
+            print "Antithetic iterations are run in pairs - number of iterations is increased to %s" % iterations_number
         self.initSimulationRecord(iterations_number)  # prepare atributes for saving simulation record
-        self.runIterations(iterations_number)  # run all iterations with saving results
+        self.setMasterSeed(master_seed)
+        self.sampling = self.simulation_record["sampling"] = sampling
+        self.antithetic = self.simulation_record["antithetic"] = antithetic
+        self.importance_sampling = self.simulation_record["importance_sampling"] = importance_sampling
+        self.fine_iterations_number = self.simulation_record["fine_iterations_number"] = fine_iterations_number
+        self.stage_cache = self.simulation_record["stage_cache"] = stage_cache
+        self.persistence = self.simulation_record["persistence"] = persistence
+        self.profiling = self.simulation_record["profiling"] = getProfiling()  # option of process, not of simulation
+        self.simulation_record["config_overrides"] = sorted(self.config_overrides.items())  # names contain dots - not mongo keys
+        if self.plants:
+            self.simulation_record["portfolio"] = {"plants": [[country, sorted(overrides.items())] for country, overrides in self.plants]}
+        seeds = self.prepareSeeds(iterations_number, vectorized, shard=shard)
+        if shard is not None:
+            self.simulation_record["shard"] = list(shard)
+            self.simulation_record["total_iterations_number"] = iterations_number
+            self.simulation_record["iterations_number"] = sum(number for first_iteration_no, number, seed in seeds)
+        self.simulation_record["vectorized"] = vectorized
+        self.simulation_record["seeds"] = seeds
+        self.simulation_record["status"] = "running"
+        self.keep_values = self.simulation_record["iterations_number"] <= STATS_VALUES_MAX_ITERATIONS
+        self.results_rows = iterations_number
+        self.db.insertSimulation(self.simulation_record)  # record with seeds is saved before run, for resuming
+
+    def runSimulationUntilConvergence(self, tolerances=None, max_iterations=CONVERGENCE_MAX_ITERATIONS,
+                                      wave_size=CONVERGENCE_WAVE_SIZE, vectorized=False):
+        """Run simulation in waves of @wave_size iterations until confidence intervals of mean and quantiles
+        of all IRR_REPORT_FIELDS are narrower than @tolerances (or @max_iterations are done).
+        @tolerances - dict with max CI half-width per field, missing fields use CONVERGENCE_TOLERANCES"""
+        tolerances = dict(CONVERGENCE_TOLERANCES, **(tolerances or {}))
+        self.initSimulationRecord(max_iterations)
+        self.setMasterSeed(None)
+        self.simulation_record["vectorized"] = vectorized
+        self.persistence = self.simulation_record["persistence"] = getEnginePersistence(self.persistence, vectorized)
+        self.simulation_record["seeds"] = []
+        self.simulation_record["tolerances"] = tolerances
+        self.simulation_record["status"] = "running"
+        self.db.insertSimulation(self.simulation_record)
+
+        self.keep_values = True  # values are needed for convergence of quantiles
+        self.results_rows = max_iterations  # results of all waves are kept in shared buffer
+        iterations_done = 0
+        converged = False
+        while iterations_done < max_iterations:
+            seeds = self.prepareSeeds(min(wave_size, max_iterations - iterations_done), vectorized, first_iteration_no=iterations_done + 1)
+            iterations_done += sum(number for first_iteration_no, number, seed in seeds)
+            self.simulation_record["seeds"] += seeds
+            self.simulation_record["iterations_number"] = iterations_done
+            self.db.updateSimulation(self.simulation_record)  # seeds of wave are saved before run, for resuming
+
+            self.runIterations(seeds, vectorized)
+            self.setResults(getResultsMatrix(0, iterations_done))  # results of all waves
+            convergence, converged = calcSimulationConvergence(IRR_REPORT_FIELDS, self.irrs, tolerances)
+            self.simulation_record["convergence"].append({"iterations": iterations_done, "converged": converged, "metrics": convergence})
+            self.printConvergence(convergence)
+            if converged:
+                break
+
+        self.simulation_record["converged"] = converged
+        self.finishSimulation()
+
+    def printConvergence(self, convergence):
+        """Prints CI half-width of not converged metrics after wave"""
+        not_converged = ["%s %s: %.5f" % (field, name, metric['ci'])
+                         for field, metrics in convergence.items() for name, metric in metrics.items() if not metric['converged']]
+        print "%s iterations done, not converged: %s\n" % (self.simulation_record["iterations_number"], ", ".join(not_converged) or "none")
+
+    def resumeSimulation(self):
+        """Runs iterations of interrupted simulation which are not saved in db (using the same seeds),
+        then calculates stats over all iterations of simulation"""
+        self.simulation_record = self.db.getSimulationRecord(self.simulation_no)
+        if self.simulation_record.get("status") == "finished":
+            print "Simulation %s is already finished" % self.simulation_no
+            return
+        if "seeds" not in self.simulation_record:
+            raise ValueError("Simulation %s can not be resumed - seeds of iterations were not saved" % self.simulation_no)
+
+        saved_iterations = set(self.db.getIterationsNumbers(self.simulation_no))
+        seeds = [(first_iteration_no, number, seed) for first_iteration_no, number, seed in self.simulation_record["seeds"]
+                 if not saved_iterations.issuperset(range(first_iteration_no, first_iteration_no + number))]
+        print "Resuming simulation %s - %s of %s iterations are saved\n" % (
+            self.simulation_no, len(saved_iterations), self.simulation_record["iterations_number"])
+
+        if seeds:
+            self.master_seed = self.simulation_record.get("master_seed")
+            self.sampling = self.simulation_record.get("sampling", "random")
+            self.antithetic = self.simulation_record.get("antithetic", False)
+            self.importance_sampling = self.simulation_record.get("importance_sampling", False)
+            self.fine_iterations_number = self.simulation_record.get("fine_iterations_number")
+            self.stage_cache = self.simulation_record.get("stage_cache", False)
+            self.persistence = self.simulation_record.get("persistence", PERSISTENCE_DEFAULT)
+            self.profiling = self.simulation_record.get("profiling")
+            if "profile" in self.simulation_record:  # measured stages of iterations run before interruption
+                profile = self.simulation_record["profile"]
+                self.stages = dict((name, [values[key] for key in STAGE_VALUES]) for name, values in profile["stages"].items())
+                self.task_seconds.update(profile["task_seconds"])
+            self.config_overrides = dict(self.simulation_record.get("config_overrides", []))
+            self.plants = getRecordPlants(self.simulation_record)
+            self.runIterations(seeds, self.simulation_record.get("vectorized", False), skip_iterations=saved_iterations)
+        self.iterations_writer.flush()
+        self.keep_values = self.simulation_record["iterations_number"] <= STATS_VALUES_MAX_ITERATIONS
+        self.loadResults()  # stats are calculated over all saved iterations
+        self.finishSimulation()
+
+    def finishSimulation(self):
+        """Saves rest of iterations and simulation record with stats"""
+        self.iterations_writer.close()  # drain background writer - all iterations are in db before stats
         self.addIrrStatsToSimulation()  # add IRR stats to simulation record for future speed access
         self.addTotalEnergyProducedStatsToSimulation()  # add TEP stats to simulation record for future speed access
-        self.db.insertSimulation(self.simulation_record)   # insert simulation record
+        self.addAntitheticStatsToSimulation()
+        self.addQmcStatsToSimulation()
+        self.addImportanceSamplingStatsToSimulation()
+        self.addMultilevelStatsToSimulation()
+        self.addSensitivityStatsToSimulation()
+        self.addPortfolioStatsToSimulation()
+        self.addProfileToSimulation()
+        self.simulation_record["accumulators"] = [accumulator.getState() for accumulator in self.accumulators]  # for merging
+        self.simulation_record["status"] = "finished"
+        self.db.updateSimulation(self.simulation_record)   # update simulation record
+
+    def setMasterSeed(self, master_seed):
+        """Sets seed of simulation (random if @master_seed is None) and saves it to simulation record"""
+        if master_seed is None:
+            master_seed = random.randint(0, MASTER_SEED_MAX)
+        self.master_seed = self.simulation_record["master_seed"] = master_seed
 
-    def runIterations(self, iterations_number):
-        """Run @iterations_number iterations in paralel."""
+    def getSampling(self):
+        """return  sampling parameters of iterations (see config_yaml_reader.setSampling) or None for independent draws"""
+        if self.sampling == 'random':
+            return None
+        iterations_number = self.simulation_record.get("total_iterations_number", self.simulation_record["iterations_number"])
+        return (self.sampling, self.master_seed, iterations_number)
+
+    def prepareSeeds(self, iterations_number, vectorized, first_iteration_no=1, shard=None):
+        """return  list of [first iteration no, number of iterations, seed] for each task of pool
+        (each iteration or each block of iterations for vectorized engine), seeds are derived from master seed
+        and first iteration no of task, with @shard (i, N) - only tasks of i-th shard (each N-th task).
+        In antithetic simulation each task is followed by its mirrored task with the same seed and number of iterations
+        (see isMirroredTask), shards get whole pairs of tasks"""
+        step = VECTORIZED_BLOCK_SIZE if vectorized else 1
+        if self.antithetic:
+            half = iterations_number // 2
+            seeds = []
+            for i in range(0, half, step):
+                number = min(step, half - i)
+                seed = getIterationSeed(self.master_seed, first_iteration_no + 2 * i)
+                seeds.append([first_iteration_no + 2 * i, number, seed])
+                seeds.append([first_iteration_no + 2 * i + number, number, seed])  # mirrored task
+        else:
+            seeds = [[first_iteration_no+i, min(step, iterations_number - i), getIterationSeed(self.master_seed, first_iteration_no+i)]
+                     for i in range(0, iterations_number, step)]
+        if self.sampling == 'saltelli':  # iterations of AB matrices use random numbers of iterations of A
+            seeds = [[first_iteration_no, number, getIterationSeed(self.master_seed, get_saltelli_seed_iteration(first_iteration_no))]
+                     for first_iteration_no, number, seed in seeds]
+        if shard is not None:
+            shard_no, shards_number = shard
+            pair = 2 if self.antithetic else 1
+            seeds = [task for i, task in enumerate(seeds) if (i // pair) % shards_number == shard_no - 1]
+        return seeds
+
+    def getTaskLevel(self, first_iteration_no):
+        """return  level of task starting with iteration @first_iteration_no in multilevel simulation (see VectorizedIterations),
+        None if simulation is not multilevel"""
+        if self.fine_iterations_number is None:
+            return None
+        return 1 if first_iteration_no <= self.fine_iterations_number else 0
+
+    def isMirroredTask(self, first_iteration_no, vectorized):
+        """return  True if task starting with iteration @first_iteration_no is mirrored task of antithetic pair
+        (originals start at multiples of two task sizes, see prepareSeeds)"""
+        step = VECTORIZED_BLOCK_SIZE if vectorized else 1
+        return self.antithetic and (first_iteration_no - 1) % (2 * step) != 0
+
+    def getResultsIterations(self):
+        """return  sorted numbers of iterations of simulation (rows of lists of values self.irrs, self.teps)"""
+        return sorted(sum([range(first_iteration_no, first_iteration_no + number)
+                           for first_iteration_no, number, seed in self.simulation_record["seeds"]], []))
+
+    def getAntitheticPairs(self):
+        """return  list of (row of original, row of mirrored iteration) in lists of values (self.irrs, self.teps)
+        of antithetic simulation"""
+        seeds = self.simulation_record["seeds"]
+        rows = dict((iteration_no, row) for row, iteration_no in enumerate(self.getResultsIterations()))
+        vectorized = self.simulation_record.get("vectorized", False)
+        return [(rows[iteration_no - number], rows[iteration_no])
+                for first_iteration_no, number, seed in seeds if self.isMirroredTask(first_iteration_no, vectorized)
+                for iteration_no in range(first_iteration_no, first_iteration_no + number)]
+
+    def runIterations(self, seeds, vectorized=False, skip_iterations=()):
+        """Run iterations in paralel.
+        @seeds - list of [first iteration no, number of iterations, seed] (see prepareSeeds)
+        @vectorized - if True each task of pool is a block of iterations (see VectorizedIterations)
+        @skip_iterations - numbers of iterations which are already saved to db
+        return  array with RESULTS_FIELDS values of iterations of @seeds (view of shared results buffer, valid until next run,
+        if iterations are contiguous), stats of irr and tep values are merged to self.accumulators"""
+        iterations_number = sum(number for first_iteration_no, number, seed in seeds)
+        last_row = max(first_iteration_no + number for first_iteration_no, number, seed in seeds) - 1
+        pool, progress_counter = getWorkerPool(self.results_offset + max(last_row, self.results_rows))
+        metrics = RunMetrics(progress_counter, iterations_number, getWorkersNumber(), [self.iterations_writer], [self.simulation_no]).start()
+
+        run_function, data = self.getTasks(seeds, vectorized)
+        try:
+            for result in pool.imap_unordered(run_function, data, getChunkSize(len(data))):
+                self.saveTaskResult(result, skip_iterations)
+                metrics.addTask(result[3])
+        finally:
+            metrics.stop()
+        return self.getRunResults(seeds)
+
+    def getTasks(self, seeds, vectorized):
+        """return  function run by workers and list of its arguments for each task of @seeds"""
+        if vectorized:
+            data = [[first_iteration_no, number, self.simulation_no, self.country, seed, self.getSampling(),
+                     self.isMirroredTask(first_iteration_no, vectorized), self.importance_sampling,
+                     self.getTaskLevel(first_iteration_no), self.stage_cache,
+                     self.config_overrides, self.persistence, self.profiling, self.results_offset]
+                    for first_iteration_no, number, seed in seeds]
+            return runIterationsBlock, data
+        if self.plants:
+            data = [[first_iteration_no, self.simulation_no, self.plants, seed, self.isMirroredTask(first_iteration_no, vectorized),
+                     self.persistence, self.profiling, self.results_offset]
+                    for first_iteration_no, number, seed in seeds]
+            return runPortfolioIteration, data
+        data = [[first_iteration_no, self.simulation_no, self.country, seed, self.getSampling(),
+                 self.isMirroredTask(first_iteration_no, vectorized), self.importance_sampling,
+                 self.config_overrides, self.persistence, self.profiling, self.results_offset]
+                for first_iteration_no, number, seed in seeds]
+        return runIteration, data
+
+    def saveTaskResult(self, result, skip_iterations=()):
+        """Saves iterations lines of task @result (see runIteration) not in @skip_iterations and merges its stats and timing"""
+        lines, accumulators, worker_memory, timing, stages = result
+        for name, seconds in timing.items():
+            self.task_seconds[name] += seconds
+        if stages is not None:
+            mergeStages(self.stages, stages)
+        self.accumulators = mergeAccumulators(self.accumulators, accumulators)  # values are written to shared buffer by workers
+        for line in lines:
+            if line["iteration"] not in skip_iterations:
+                self.iterations_writer.insert(line)  # saved to db in batches by background writer
+        if worker_memory > WORKER_MAX_MEMORY:
+            recycleWorkerPool()  # workers are replaced after current run
+
+    def getRunResults(self, seeds):
+        """return  array with RESULTS_FIELDS values of iterations of @seeds from shared results buffer"""
+        iterations_number = sum(number for first_iteration_no, number, seed in seeds)
+        first_row = self.results_offset + min(first_iteration_no for first_iteration_no, number, seed in seeds) - 1
+        last_row = self.results_offset + max(first_iteration_no + number for first_iteration_no, number, seed in seeds) - 1
+        if last_row - first_row == iterations_number:
+            return getResultsMatrix(first_row, last_row)
+        rows = numpy.concatenate([numpy.arange(first_iteration_no - 1, first_iteration_no - 1 + number) for first_iteration_no, number, seed in seeds])
+        return worker_pool_results[self.results_offset + numpy.sort(rows)]  # copy of rows of not contiguous iterations (shard)
+
+    def setResults(self, result):
+        """Accumulation of irr and tep values from all iterations,
+        @result - array (or list) with values of each iteration in columns of RESULTS_FIELDS
+        (or only irr and tep values - without npv values and control variates)"""
+        columns = numpy.asarray(result, dtype=float).T.tolist()  # transpose
+        columns = [[None if value != value else value for value in column] for column in columns]  # nan - not digit value
+        irrs_len = len(IRR_REPORT_FIELDS)
+        teps_end = irrs_len + len(TEP_REPORT_FIELDS)
+        self.irrs = columns[:irrs_len]
+        self.teps = columns[irrs_len:teps_end]
+        self.npvs = columns[teps_end:teps_end+len(RESULTS_NPV_FIELDS)] or None
+        self.control_variates = columns[teps_end+len(RESULTS_NPV_FIELDS):] or None
 
-        cpu_count = 3 * multiprocessing.cpu_count()
-        #cpu_count = 24
-        progress_counter = multiprocessing.Value('i', 0)
-        sys.stdout.write("\r{0}/{1} -- {2:.2f}% ".format(progress_counter.value, iterations_number, 100 * progress_counter.value / float(iterations_number)))
-        sys.stdout.flush()
+    def loadResults(self):
+        """Loads irr, tep and npv values and control variates of all saved iterations from db (sorted by iteration)"""
+        result = self.db.getIterationsResults(self.simulation_no)
+        self.accumulators = accumulateResults(result)
+        if self.keep_values:
+            self.setResults(result)
+            npvs = [[None if value != value else value for value in values] for values in self.db.getIterationsNpvs(self.simulation_no)]  # nan - not digit value
+            if npvs and all(any(value is not None for value in values) for values in npvs):  # lines of old simulations have no npv
+                self.npvs = map(list, zip(*npvs))
+            control_variates = self.db.getIterationsControlVariates(self.simulation_no)
+            if control_variates and all(values is not None for values in control_variates):
+                self.control_variates = map(list, zip(*control_variates))
 
-        data = [[i+1, self.simulation_no, self.country, random.randint(0, 10000000), iterations_number] for i in range(iterations_number)]
+    def getControlVariates(self):
+        """return  dict[name] = (values of iterations, known mean) of control variates for simulation stats,
+        None if control variates are not available"""
+        if self.control_variates is None:
+            return None
+        return OrderedDict(zip(CONTROL_VARIATE_FIELDS, zip(self.control_variates, CONTROL_VARIATE_MEANS)))
 
-        pool = multiprocessing.Pool(cpu_count, initializer=initIteration, initargs=(progress_counter,))
-        result = pool.map(runIteration, data)  # irr and tep data
-        pool.close()
-        pool.join()
+    def mergeSimulations(self, sources):
+        """Merges shards of one simulation (see runSimulation with shard) to this simulation - copies iterations
+        and calculates stats over all of them.
+        @sources - list of (Database, simulation_no) of all shards, shards can be saved in different databases"""
+        records = [source_db.getSimulationRecord(simulation_no) for source_db, simulation_no in sources]
+        checkShards(records)
+        self.initSimulationRecord(records[0]["total_iterations_number"])
+        self.simulation_record["vectorized"] = records[0]["vectorized"]
+        self.simulation_record["master_seed"] = self.master_seed = records[0]["master_seed"]
+        self.simulation_record["sampling"] = self.sampling = records[0].get("sampling", "random")
+        self.simulation_record["antithetic"] = self.antithetic = records[0].get("antithetic", False)
+        self.simulation_record["importance_sampling"] = self.importance_sampling = records[0].get("importance_sampling", False)
+        self.simulation_record["fine_iterations_number"] = self.fine_iterations_number = records[0].get("fine_iterations_number")
+        self.simulation_record["config_overrides"] = records[0].get("config_overrides", [])
+        self.config_overrides = dict(self.simulation_record["config_overrides"])
+        self.simulation_record["persistence"] = records[0].get("persistence", PERSISTENCE_DEFAULT)
+        if "portfolio" in records[0]:
+            self.simulation_record["portfolio"] = {"plants": records[0]["portfolio"]["plants"]}
+        self.plants = getRecordPlants(self.simulation_record)
+        self.simulation_record["seeds"] = sorted(sum([record["seeds"] for record in records], []))
+        self.simulation_record["merged_shards"] = [{"shard": record["shard"], "simulation": record["simulation"]} for record in records]
+        self.simulation_record["status"] = "running"
+        self.db.insertSimulation(self.simulation_record)
 
-#        initIteration(progress_counter)
-#        result = map(runIteration, data)
+        for (source_db, simulation_no), record in zip(sources, records):
+            for line in source_db.iterations.find({'simulation': simulation_no}):
+                del line['_id']
+                line['simulation'] = self.simulation_no
+                self.iterations_writer.insert(line)
+            print "Shard %s/%s - copied iterations of simulation %s" % (record["shard"][0], record["shard"][1], simulation_no)
+        self.iterations_writer.flush()
 
-        result = zip(*result)  # transpose
-        sys.stdout.write('\n')  # go to newline because of progress printer
+        self.keep_values = self.simulation_record["iterations_number"] <= STATS_VALUES_MAX_ITERATIONS
+        if self.keep_values:
+            self.loadResults()  # exact stats over all iterations
+        else:
+            self.accumulators = []  # streamed stats of shards are merged
+            for record in records:
+                self.accumulators = mergeAccumulators(self.accumulators, [StatsAccumulator().setState(state) for state in record["accumulators"]])
+        self.finishSimulation()
 
-        # accumulation of values from all iterations
+    def getCurrentStatistics(self):
+        """return  irr and tep stats (see calcAccumulatorsStatistics) of iterations calculated so far, available during run"""
         irrs_len = len(IRR_REPORT_FIELDS)
-        self.irrs = result[:irrs_len]
-        self.teps = result[irrs_len:irrs_len+len(TEP_REPORT_FIELDS)]
+        rm_args = self.rm_configs['riskFreeRate'], self.rm_configs['spreadCDS'], self.rm_configs['benchmarkAdjustedSharpeRatio'], self.rm_configs['illiquidityPremium']
+        return (calcAccumulatorsStatistics(IRR_REPORT_FIELDS, self.accumulators[:irrs_len], *rm_args),
+                calcAccumulatorsStatistics(TEP_REPORT_FIELDS, self.accumulators[irrs_len:], *rm_args))
 
     def initSimulationRecord(self, iterations_number):
         """Prepare atributes for saving simulation records"""
@@ -81,22 +484,128 @@ class Simulation:
 
     def addIrrStatsToSimulation(self):
         """Adding irr results to dict with simulation data"""
+        if not self.keep_values:
+            self.simulation_record['irr_stats'] = self.getCurrentStatistics()[0]  # streamed stats
+            return
         riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium = self.rm_configs['riskFreeRate'], self.rm_configs['spreadCDS'], self.rm_configs['benchmarkAdjustedSharpeRatio'], self.rm_configs['illiquidityPremium']
-        self.simulation_record['irr_stats'] = calcSimulationStatistics(IRR_REPORT_FIELDS, self.irrs, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium)  # calculating and adding IRR stats to simulation record
+        self.simulation_record['irr_stats'] = calcSimulationStatistics(IRR_REPORT_FIELDS, self.irrs, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium,
+                                                                       self.getControlVariates())  # calculating and adding IRR stats to simulation record
+        if self.npvs is not None:  # not available for iterations saved without npv values
+            self.simulation_record['npv_stats'] = calcSimulationStatistics(RESULTS_NPV_FIELDS, self.npvs, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium,
+                                                                           self.getControlVariates())
 
     def addTotalEnergyProducedStatsToSimulation(self):
         """Adding total energy produced results to dict with simulation data."""
+        if not self.keep_values:
+            self.simulation_record['total_energy_produced_stats'] = self.getCurrentStatistics()[1]  # streamed stats
+            return
         riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium = self.rm_configs['riskFreeRate'], self.rm_configs['spreadCDS'], self.rm_configs['benchmarkAdjustedSharpeRatio'], self.rm_configs['illiquidityPremium']
-        self.simulation_record['total_energy_produced_stats'] = calcSimulationStatistics(TEP_REPORT_FIELDS, self.teps, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium)
+        self.simulation_record['total_energy_produced_stats'] = calcSimulationStatistics(TEP_REPORT_FIELDS, self.teps, riskFreeRate, spreadCDS, benchmarkAdjustedSharpeRatio, illiquidityPremium,
+                                                                                         self.getControlVariates())
+
+    def addAntitheticStatsToSimulation(self):
+        """Adding mean of IRR and TEP estimated from averages of antithetic pairs (with its CI and variance reduction).
+        irr_stats are kept over all iterations - each iteration alone has the same distribution as in not antithetic run"""
+        if not self.antithetic or not self.keep_values:
+            return
+        pairs = self.getAntitheticPairs()
+        self.simulation_record['antithetic_irr_stats'] = calcAntitheticStatistics(IRR_REPORT_FIELDS, self.irrs, pairs)
+        self.simulation_record['antithetic_total_energy_produced_stats'] = calcAntitheticStatistics(TEP_REPORT_FIELDS, self.teps, pairs)
+
+    def addQmcStatsToSimulation(self):
+        """Adding mean of IRR and TEP with QMC error estimated from randomized replicates of Sobol sampling
+        (irr_stats over all iterations are kept, CI of their mean would overestimate error of QMC)"""
+        if self.sampling != 'sobol' or not self.keep_values:
+            return
+        sampling = SobolSampling(*self.getSampling()[1:])
+        replicates = [sampling.getReplicate(iteration_no) for iteration_no in self.getResultsIterations()]
+        self.simulation_record['qmc_irr_stats'] = calcReplicatesStatistics(IRR_REPORT_FIELDS, self.irrs, replicates)
+        self.simulation_record['qmc_total_energy_produced_stats'] = calcReplicatesStatistics(TEP_REPORT_FIELDS, self.teps, replicates)
+
+    def addImportanceSamplingStatsToSimulation(self):
+        """Adding weighted tail stats of IRR (P(IRR < hurdle), low percentiles) of importance sampling simulation,
+        weights of iterations (likelihood ratios) are loaded from saved iterations"""
+        if not self.importance_sampling or not self.keep_values:
+            return
+        weights = self.db.getIterationsFieldsValues(self.simulation_no, ['weight'])
+        weights = [weights[iteration_no][0] if iteration_no in weights else None for iteration_no in self.getResultsIterations()]
+        values = [self.irrs[IRR_REPORT_FIELDS.index(field)] for field in IMPORTANCE_SAMPLING_FIELDS]
+        self.simulation_record['importance_sampling_irr_stats'] = calcImportanceSamplingStatistics(IMPORTANCE_SAMPLING_FIELDS, values, weights)
+
+    def addSensitivityStatsToSimulation(self):
+        """Adding first and total order Sobol indices of SENSITIVITY_INPUTS for SENSITIVITY_FIELDS with bootstrap CI
+        (see rm.calcSobolIndices) of simulation with Saltelli sampling, values are loaded from saved iterations"""
+        if self.sampling != 'saltelli' or "shard" in self.simulation_record:  # shard has only part of sample matrices
+            return
+        lines = self.db.getIterationsFieldsValues(self.simulation_no, SENSITIVITY_FIELDS)
+        iterations = sorted(lines)
+        values = zip(*[lines[iteration_no] for iteration_no in iterations])
+        positions = [get_saltelli_position(iteration_no) for iteration_no in iterations]
+        self.simulation_record['sensitivity'] = {
+            'inputs': SENSITIVITY_INPUTS,  # names contain dots - indices are lists in order of inputs
+            'indices': calcSobolIndices(SENSITIVITY_FIELDS, values, positions, len(SENSITIVITY_INPUTS))}
+
+    def addPortfolioStatsToSimulation(self):
+        """Adding stats of PORTFOLIO_PLANT_FIELDS of each plant of portfolio simulation (irr_stats and npv_stats
+        of record are portfolio stats), values are loaded from saved iterations"""
+        if not self.plants:
+            return
+        lines = self.db.getIterationsFieldsValues(self.simulation_no, ['plants'])
+        plants_values = [line[0] for iteration_no, line in sorted(lines.items())]  # list of values of plants of each iteration
+        self.simulation_record["portfolio"]["plant_stats"] = [
+            OrderedDict((field, calcStatistics(getOnlyDigitsList([values[plant][i] for values in plants_values])))
+                        for i, field in enumerate(PORTFOLIO_PLANT_FIELDS))
+            for plant in range(len(self.plants))]
+
+    def addProfileToSimulation(self):
+        """Adding measured stages of iterations (summed over workers, see profiling.stage), seconds of tasks, db writes
+        and merged cProfile stats of sampled iterations of simulation run with profiling (see profiling.setProfiling)"""
+        if self.profiling is None:
+            return
+        self.simulation_record["profile"] = {
+            "iterations": self.simulation_record["iterations_number"],
+            "stages": dict((name, dict(zip(STAGE_VALUES, values))) for name, values in self.stages.items()),
+            "task_seconds": dict(self.task_seconds),
+            "db_write": self.iterations_writer.getStats(),  # of this run (not of iterations saved before resuming)
+            "cprofile_fraction": self.profiling,
+            "cprofile": mergeProfiles(self.simulation_no),
+        }
+
+    def addMultilevelStatsToSimulation(self):
+        """Adding multilevel estimates of means of IRR and TEP - mean of coarse model over coarse iterations plus mean
+        difference of daily and coarse model over coupled iterations, with costs and variances of levels
+        (levels, coarse values and costs are loaded from saved iterations)"""
+        if self.fine_iterations_number is None or not self.keep_values:
+            return
+        lines = self.db.getIterationsFieldsValues(self.simulation_no, ['level', 'coarse_results', 'calculation_time', 'coarse_calculation_time'])
+        lines = [lines.get(iteration_no, [None] * 4) for iteration_no in self.getResultsIterations()]
+        levels, coarse_results, costs, coarse_costs = zip(*lines)
+        coarse_values = zip(*[results or [None] * len(self.irrs + self.teps) for results in coarse_results])
+        irrs_len = len(IRR_REPORT_FIELDS)
+        self.simulation_record['multilevel_irr_stats'] = calcMultilevelStatistics(IRR_REPORT_FIELDS, self.irrs, coarse_values[:irrs_len], levels, costs, coarse_costs)
+        self.simulation_record['multilevel_total_energy_produced_stats'] = calcMultilevelStatistics(TEP_REPORT_FIELDS, self.teps, coarse_values[irrs_len:], levels, costs, coarse_costs)
 
 
 class Iteration:
     """Class for running a single iteration."""
 
-    def __init__(self, iteration_no, simulation_no, country, seed):
-        """Iteration number of this iteration and link to simulation module."""
-        random.seed(seed)
-        numpy.random.seed(seed)
+    def __init__(self, iteration_no, simulation_no, country, seed, sampling=None, antithetic=False, importance_sampling=False):
+        """Iteration number of this iteration and link to simulation module.
+        @sampling - (mode, master seed, iterations number of simulation) for sampling of config values
+        (see config_yaml_reader.setSampling), None - independent random draws
+        @antithetic - if True random shocks drawn from @seed are mirrored (see annex.setAntithetic)
+        @importance_sampling - if True random values are tilted (see annex.setImportanceSampling)
+        @seed - None for plants of portfolio iteration, which continue random numbers of portfolio (see PortfolioIteration)"""
+        if seed is not None:
+            random.seed(seed)
+            numpy.random.seed(seed)
+            setRandomStreams(seed)
+        setAntithetic(antithetic)
+        setImportanceSampling(importance_sampling)
+        if sampling is not None:
+            setSampling(*sampling, iteration_no=iteration_no)
+        else:
+            setSampling('random')
 
         self.iteration_no = iteration_no
         self.simulation_no = simulation_no
@@ -117,11 +626,15 @@ class Iteration:
         self.o = ReportOutput(self.r)
         self._prepareIterationResults()  # main func to prepare results in one dict
 
-    def saveAndReturn(self):
-        """Saves the data to simulation fields and database."""
-        self.db.insertIteration(self.line)  # save iteration to db
+    def getResults(self):
+        """Returns irr and tep results of iteration."""
         return self._getIrrValues() + self._getTepValues()
 
+    def getResultsRow(self):
+        """Returns values of RESULTS_FIELDS of iteration."""
+        return [getattr(self.r, field) for field in RESULTS_FIELDS]
+
+    @timed('serialization')
     def _prepareIterationResults(self):
         """Prepare iteration results before saving to database."""
         obj = self.r
@@ -136,6 +649,7 @@ class Iteration:
         line["sm_configs"] = self.sm.getConfigsValues()
         line["em_configs"] = self.em.getConfigsValues()
         line["enm_configs"] = self.enm.getConfigsValues()
+        line["price_drift"] = self.ecm.price_drift
 
         #####################################
 
@@ -236,6 +750,9 @@ class Iteration:
 
         line["wacc"] = obj.wacc
         line["wacc_y"] = obj.wacc
+        line["results"] = self.getResults()  # irr and tep values for simulation stats
+        line["control_variates"] = [getattr(obj, field) for field in CONTROL_VARIATE_FIELDS]
+        line["weight"] = getLikelihoodRatio()  # likelihood ratio of tilted draws, 1 without importance sampling
 
         #########################################
         line["project_days"] = self.ecm.electricity_prices.keys()  #list of all project days
@@ -280,27 +797,489 @@ class Iteration:
         """Returns total energy produced, system not working and electricity prod 2nd year attributes."""
         return [getattr(self.r, field) for field in TEP_REPORT_FIELDS]
 
-progress_counter = None  # global thread progress counter
-def initIteration(args):
-    """Function to initialize shared variables used by pool of workers."""
-    global progress_counter
-    progress_counter = args
+
+class PortfolioIteration:
+    """Class for running a single iteration of portfolio of plants in one worker. Price path of each country (and its
+    price configs) is generated once for dates of all its plants and shared by them, so plants of one country have
+    the same market prices. Portfolio IRR is calculated from summed cash flows of plants, NPV and TEP values are sums."""
+
+    def __init__(self, iteration_no, simulation_no, plants, seed, antithetic=False):
+        """@plants - list of (country, config overrides) of plants of portfolio (see Simulation)
+        @antithetic - if True random shocks drawn from @seed are mirrored (see annex.setAntithetic)"""
+        random.seed(seed)
+        numpy.random.seed(seed)
+        setRandomStreams(seed)  # streams are shared by plants
+        self.iteration_no = iteration_no
+        self.simulation_no = simulation_no
+        self.plants = plants
+        self.iterations = []  # iteration of each plant, configs of all plants are drawn before price paths
+        for country, overrides in plants:
+            setConfigOverrides(overrides)
+            self.iterations.append(Iteration(iteration_no, simulation_no, country, None, antithetic=antithetic))
+
+        prices = {}  # dict[price group] = shared prices, shock and drift
+        for (country, overrides), i in zip(plants, self.iterations):
+            group = getPriceGroup(country, overrides)
+            if group not in prices:
+                configs = [plant.config for plant in self.getGroupIterations(group)]
+                setConfigOverrides(dict(group[1]))
+                prices[group] = generateElectricityPrices(country, getListDates(min(config.getStartDate() for config in configs),
+                                                                                 max(config.getEndDate() for config in configs)))
+            i.ecm.setElectricityPrices(*prices[group])
+
+    def getGroupIterations(self, group):
+        """return  iterations of plants sharing prices of @group (see getPriceGroup)"""
+        return [i for (country, overrides), i in zip(self.plants, self.iterations) if getPriceGroup(country, overrides) == group]
+
+    def run(self):
+        """Runs iterations of all plants and calculates portfolio results."""
+        for (country, overrides), i in zip(self.plants, self.iterations):
+            setConfigOverrides(overrides)  # configs are read also during calculation
+            i.r.calcReportValues()
+        setConfigOverrides({})
+        reports = [i.r for i in self.iterations]
+
+        self.fcf = OrderedDict()  # summed monthly cash flows of plants
+        for name in ['fcf_project', 'fcf_owners', 'fcf_project_before_tax']:
+            summed = defaultdict(float)
+            for r in reports:
+                for date, value in getattr(r, name).items():
+                    if isinstance(value, (int, float)):  # without IRR label
+                        summed[date] += value
+            self.fcf[name] = [summed[date] for date in sorted(summed)]
+        for name, fcf in self.fcf.items():
+            irr = CashFlows(fcf, self.iteration_no, self.simulation_no).irr()
+            irr = irr if irr is not None else -1  # as in Report.calcIRR
+            setattr(self, name.replace('fcf', 'irr') + '_y', ((1 + irr) ** 12) - 1 if not numpy.isnan(irr) else float('nan'))
+        self.simple_payback_time = reports[0]._calcSimplePaybackTime(self.fcf['fcf_project'])
+        for field in TEP_REPORT_FIELDS + RESULTS_NPV_FIELDS:
+            setattr(self, field, sum(getattr(r, field) for r in reports))
+        for field in CONTROL_VARIATE_FIELDS:  # mean of shocks with zero mean
+            setattr(self, field, numpy.mean([getattr(r, field) for r in reports]))
+        self._prepareIterationResults()
+
+    def getResults(self):
+        """Returns portfolio irr and tep results of iteration."""
+        return [getattr(self, field) for field in IRR_REPORT_FIELDS + TEP_REPORT_FIELDS]
+
+    def getResultsRow(self):
+        """Returns portfolio values of RESULTS_FIELDS of iteration."""
+        return [getattr(self, field) for field in RESULTS_FIELDS]
+
+    @timed('serialization')
+    def _prepareIterationResults(self):
+        """Prepare portfolio results and results of plants (PORTFOLIO_PLANT_FIELDS) before saving to database."""
+        line = dict(self.fcf)
+        line["simulation"] = self.simulation_no
+        line["iteration"] = self.iteration_no
+        for field in IRR_REPORT_FIELDS + RESULTS_NPV_FIELDS:
+            line[field] = getattr(self, field)
+        line["results"] = self.getResults()
+        line["control_variates"] = [getattr(self, field) for field in CONTROL_VARIATE_FIELDS]
+        line["weight"] = getLikelihoodRatio()
+        line["plants"] = [[getattr(i.r, field) for field in PORTFOLIO_PLANT_FIELDS] for i in self.iterations]
+        self.line = convertValue(line)
+
+worker_pool = None  # persistent pool of workers, reused by all simulations of the process
+worker_pool_progress = None  # shared counter of iterations finished by workers of persistent pool (see metrics.RunMetrics)
+worker_pool_recycle = False  # pool should be replaced before next run (workers used too much memory)
+worker_pool_results = None  # shared results buffer of persistent pool, array[iteration_no - 1] = values of RESULTS_FIELDS
+worker_pool_results_array = None  # shared memory of results buffer, kept when workers are replaced
+
+def getWorkersNumber():
+    """return  number of processes in pool of workers"""
+    return WORKERS_NUMBER or 3 * multiprocessing.cpu_count()
+
+def getWorkerPool(results_rows=0):
+    """return  persistent pool of workers and its progress counter, creates pool on first use
+    (or when old one should be recycled or its results buffer has less than @results_rows rows),
+    workers are replaced after WORKER_MAX_TASKS tasks.
+    Results buffer is kept by new pool (previous waves of simulation are read from it), it is only enlarged with copied rows"""
+    global worker_pool, worker_pool_progress, worker_pool_results, worker_pool_results_array
+    too_small = worker_pool_results is None or len(worker_pool_results) < results_rows
+    if worker_pool is not None and (worker_pool_recycle or too_small):
+        closeWorkerPool()
+    if worker_pool is None:
+        if worker_pool_progress is None:
+            worker_pool_progress = multiprocessing.Value('i', 0)
+        if too_small:
+            previous_results = worker_pool_results
+            worker_pool_results_array = multiprocessing.RawArray('d', max(results_rows, RESULTS_BUFFER_MIN_ROWS) * len(RESULTS_FIELDS))
+            worker_pool_results = getResultsBuffer(worker_pool_results_array)
+            if previous_results is not None:
+                worker_pool_results[:len(previous_results)] = previous_results
+        worker_pool = multiprocessing.Pool(getWorkersNumber(), initializer=initIteration,
+                                           initargs=(worker_pool_progress, worker_pool_results_array), maxtasksperchild=WORKER_MAX_TASKS)
+    return worker_pool, worker_pool_progress
+
+def getResultsBuffer(results_array):
+    """return  numpy view (without copying) of shared @results_array, row for each iteration, columns - RESULTS_FIELDS"""
+    return numpy.frombuffer(results_array, dtype=float).reshape(-1, len(RESULTS_FIELDS))
+
+def getResultsMatrix(first_row, last_row):
+    """return  view of shared results buffer with values of iterations from @first_row + 1 to @last_row"""
+    return worker_pool_results[first_row:last_row]
+
+def recycleWorkerPool():
+    """Marks persistent pool to be replaced with new workers before next run"""
+    global worker_pool_recycle
+    worker_pool_recycle = True
+
+def closeWorkerPool():
+    """Closes persistent pool of workers"""
+    global worker_pool, worker_pool_recycle
+    if worker_pool is not None:
+        worker_pool.close()
+        worker_pool.join()
+    worker_pool = None
+    worker_pool_recycle = False
+
+atexit.register(closeWorkerPool)
+
+def getWorkerMemory():
+    """return  peak memory (MB) used by current worker process"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+progress_counter = None  # shared counter of finished iterations, main process prints progress
+results_buffer = None  # shared results buffer of worker (see getResultsBuffer)
+def initIteration(counter, results_array):
+    """Function to initialize shared variables used by pool of workers.
+    Each worker opens its own connection to db, config files are cached inside worker (see read_file)."""
+    global progress_counter, results_buffer
+    progress_counter = counter
+    results_buffer = getResultsBuffer(results_array)
+    database.reconnect()
+
+def getChunkSize(tasks_number):
+    """return  number of tasks sent to worker at once"""
+    return ITERATIONS_CHUNK_SIZE or max(1, tasks_number // (4 * getWorkersNumber()))
+
+def addProgress(iterations_number):
+    """Adds @iterations_number finished iterations to shared progress counter (with lock - workers add concurrently)"""
+    with progress_counter.get_lock():
+        progress_counter.value += iterations_number
 
 def runIteration(args):
-    """Function to run a single iteration, used for paralel running."""
-    global progress_counter
-    iterations_number = args.pop()
-    i = Iteration(*args)
-    i.run()
+    """Function to run a single iteration, used for paralel running.
+    Last arguments are config overrides of simulation, its persistence profile, profiling option and its first row in results buffer.
+    return  persisted lines, accumulators, worker memory, timing - dict[part of task] = seconds (see metrics.RunMetrics)
+    and measured stages (see profiling.popStages)"""
+    start_time = time.time()
+    results_offset = args.pop()
+    profiling = args.pop()
+    persistence = args.pop()
+    setConfigOverrides(args.pop())  # worker runs tasks of different simulations
+    enableTimers(profiling)
+    with profileTask(args[1], isProfiledTask(args[0], 1, profiling)):
+        i = Iteration(*args)
+        setup_time = time.time()
+        i.run()
+        run_time = time.time()
+
+    results_buffer[results_offset + args[0] - 1] = numpy.array(i.getResultsRow(), dtype=float)  # None - nan
+    lines, accumulators = [getPersistedLine(i.line, persistence)], accumulateResults([i.getResults()])
+    addProgress(1)
+    end_time = time.time()
+    timing = {'setup': setup_time - start_time, 'calculation': run_time - setup_time, 'results': end_time - run_time,
+              'total': end_time - start_time}
+    return lines, accumulators, getWorkerMemory(), timing, popStages()
+
+def runIterationsBlock(args):
+    """Function to run a block of iterations with vectorized engine, used for paralel running (arguments see runIteration)."""
+    start_time = time.time()
+    results_offset = args.pop()
+    profiling = args.pop()
+    persistence = args.pop()
+    setConfigOverrides(args.pop())
+    enableTimers(profiling)
+    with profileTask(args[2], isProfiledTask(args[0], args[1], profiling)):
+        v = VectorizedIterations(*args)
+        setup_time = time.time()
+        v.run()
+        run_time = time.time()
+
+    first_row = results_offset + v.first_iteration_no - 1
+    results_buffer[first_row:first_row + v.iterations_number] = v.getResultsMatrix()
+    lines = [getPersistedLine(line, persistence) for line in v.getIterationLines()]
+    accumulators = accumulateResults(v.getResults())
+    addProgress(v.iterations_number)
+    end_time = time.time()
+    timing = {'setup': setup_time - start_time, 'calculation': run_time - setup_time, 'results': end_time - run_time,
+              'total': end_time - start_time}
+    return lines, accumulators, getWorkerMemory(), timing, popStages()
+
+def runPortfolioIteration(args):
+    """Function to run a single iteration of portfolio (see PortfolioIteration), used for paralel running, last arguments
+    are persistence profile of simulation, profiling option and its first row in results buffer (return see runIteration)."""
+    start_time = time.time()
+    results_offset = args.pop()
+    profiling = args.pop()
+    persistence = args.pop()
+    enableTimers(profiling)
+    with profileTask(args[1], isProfiledTask(args[0], 1, profiling)):
+        i = PortfolioIteration(*args)
+        setup_time = time.time()
+        i.run()
+        run_time = time.time()
+
+    results_buffer[results_offset + args[0] - 1] = numpy.array(i.getResultsRow(), dtype=float)
+    lines, accumulators = [getPersistedLine(i.line, persistence)], accumulateResults([i.getResults()])
+    addProgress(1)
+    end_time = time.time()
+    timing = {'setup': setup_time - start_time, 'calculation': run_time - setup_time, 'results': end_time - run_time,
+              'total': end_time - start_time}
+    return lines, accumulators, getWorkerMemory(), timing, popStages()
+
+def getEnginePersistence(persistence, vectorized):
+    """return  persistence profile which is saved by engine for requested @persistence - lines of vectorized engine
+    have only yearly rows, so 'full' and 'monthly' are saved as 'yearly', 'full_sampled' is not supported"""
+    if persistence not in PERSISTENCE_PROFILES and persistence != 'full_sampled':
+        raise ValueError("Unknown persistence profile %r" % persistence)
+    if not vectorized or persistence in ['yearly', 'scalars']:
+        return persistence
+    if persistence == 'full_sampled':
+        raise ValueError("Vectorized engine saves only yearly rows of iterations, use persistence 'yearly' or 'scalars'")
+    print "Vectorized engine saves only yearly rows of iterations - persistence profile is 'yearly'"
+    return 'yearly'
+
+def getPersistedLine(line, persistence):
+    """return  iteration @line without fields not saved by @persistence profile (see PERSISTENCE_PROFILES),
+    'full_sampled' - full line of each PERSISTENCE_SAMPLE_STEP-th iteration (1, 1 + step ...), scalars of others"""
+    if persistence == 'full_sampled':
+        persistence = 'full' if (line["iteration"] - 1) % PERSISTENCE_SAMPLE_STEP == 0 else 'scalars'
+    for field in PERSISTENCE_PROFILES[persistence]:
+        line.pop(field, None)
+    return line
 
-    progress_counter.value += 1
-    sys.stdout.write("\r{0}/{1} -- {2:.2f}% ".format(progress_counter.value, iterations_number, 100 * progress_counter.value / float(iterations_number)))
-    sys.stdout.flush()
+def getPriceGroup(country, overrides):
+    """return  key of plants of portfolio sharing price path - @country and its @overrides of price configs"""
+    return country, tuple(sorted((name, value) for name, value in overrides.items() if '.ELECTRICITY_MARKET_PRICE_SIMULATION.' in name))
 
-    return i.saveAndReturn()
+def getRecordPlants(record):
+    """return  plants (list of (country, config overrides)) of portfolio simulation @record, None for other simulations"""
+    if "portfolio" not in record:
+        return None
+    return [(country, dict(overrides)) for country, overrides in record["portfolio"]["plants"]]
 
-def runAndSaveSimulation(country, iterations_no, comment):
-    """Runs multiple iterations @iterations_number with @comment and saves results to db."""
+def getIterationSeed(master_seed, iteration_no):
+    """return  seed of iteration @iteration_no of simulation with @master_seed (see annex.hashSeed),
+    for one master seed different iterations always get different seeds"""
+    return hashSeed(master_seed, iteration_no)
+
+def checkShards(records):
+    """Checks that simulation @records are all shards of one simulation (the same master seed and parameters)"""
+    for record in records:
+        if "shard" not in record or record.get("status") != "finished":
+            raise ValueError("Simulation %s is not finished shard" % record["simulation"])
+    for key in ["master_seed", "total_iterations_number", "vectorized", "country", "sampling", "antithetic", "importance_sampling",
+                "fine_iterations_number", "config_overrides", "portfolio"]:
+        if len(set(repr(record.get(key)) for record in records)) != 1:
+            raise ValueError("Shards have different %s" % key)
+    shards_number = records[0]["shard"][1]
+    if sorted(record["shard"][0] for record in records) != range(1, shards_number + 1) or \
+            any(record["shard"][1] != shards_number for record in records):
+        raise ValueError("Not all %s shards are selected (or selected more times)" % shards_number)
+
+def comparePairedSimulations(base_simulation_no, simulation_no):
+    """return  paired differences of PAIRED_DIFFERENCE_FIELDS of @simulation_no from @base_simulation_no
+    (see rm.calcPairedDifferences), simulations should be run with the same master seed (common random numbers)
+    and are saved to record of @simulation_no"""
+    db = Database()
+    base_record, record = db.getSimulationRecord(base_simulation_no), db.getSimulationRecord(simulation_no)
+    if base_record.get("master_seed") is None or base_record.get("master_seed") != record.get("master_seed"):
+        raise ValueError("Simulations %s and %s are not run with the same master seed" % (base_simulation_no, simulation_no))
+    differences = calcPairedDifferences(PAIRED_DIFFERENCE_FIELDS, db.getIterationsFieldsValues(base_simulation_no, PAIRED_DIFFERENCE_FIELDS),
+                                        db.getIterationsFieldsValues(simulation_no, PAIRED_DIFFERENCE_FIELDS))
+    db.updateSimulationField(simulation_no, "paired_differences", {"base_simulation": base_simulation_no, "differences": differences})
+    return differences
+
+def mergeSimulations(sources, comment):
+    """Merges shards of one simulation @sources - list of (mongo host or None for local db, simulation_no)
+    to new simulation in local db with @comment."""
+    sources = [(Database(host), simulation_no) for host, simulation_no in sources]
+    country = sources[0][0].getSimulationRecord(sources[0][1])["country"]
+    s = Simulation(country, comment=comment)
+    s.mergeSimulations(sources)
+    return s.simulation_no
+
+def runAndSaveSimulationUntilConvergence(country, comment, tolerances=None, max_iterations=CONVERGENCE_MAX_ITERATIONS, vectorized=False):
+    """Runs iterations in waves until IRR stats are converged within @tolerances (max @max_iterations)
+    with @comment and saves results to db."""
     s = Simulation(country, comment=comment)
-    s.runSimulation(iterations_no)
+    s.runSimulationUntilConvergence(tolerances, max_iterations, vectorized=vectorized)
+    return s.simulation_no
+
+def resumeSimulation(simulation_no):
+    """Runs not saved iterations of interrupted simulation @simulation_no and saves results to db."""
+    record = Database().getSimulationRecord(simulation_no)
+    s = Simulation(record["country"], comment=record["comment"], simulation_no=simulation_no)
+    s.resumeSimulation()
+    return s.simulation_no
+
+def runAndSaveSimulation(country, iterations_no, comment, vectorized=False, master_seed=None, shard=None, sampling='random', antithetic=False,
+                         importance_sampling=False, fine_iterations_number=None, stage_cache=False, persistence=PERSISTENCE_DEFAULT):
+    """Runs multiple iterations @iterations_number with @comment and saves results to db.
+    @vectorized - use vectorized engine, which calculates iterations in blocks
+    @master_seed, @shard, @sampling, @antithetic, @importance_sampling, @fine_iterations_number, @stage_cache,
+    @persistence - see Simulation.runSimulation"""
+    s = Simulation(country, comment=comment)
+    s.runSimulation(iterations_no, vectorized, master_seed, shard, sampling, antithetic, importance_sampling, fine_iterations_number,
+                    stage_cache, persistence)
+    return s.simulation_no
+
+def getScenarios(spec, country):
+    """return  list of config overrides (dict[name] = raw value) of scenarios of @spec - dict with 'scenarios' (list of
+    dicts[path] = value) and/or 'grid' (dict[path] = list of values, all combinations of them), each scenario is combined
+    with each point of grid, paths like DEBT.interest_rate are resolved in configs of @country (see get_override_name)"""
+    grid = spec.get('grid') or {}
+    paths = sorted(grid)
+    points = [dict(zip(paths, values)) for values in product(*[grid[path] for path in paths])]
+    scenarios = []
+    for scenario in spec.get('scenarios') or [{}]:
+        for point in points:
+            overrides = OrderedDict()
+            for path, value in sorted(scenario.items()) + sorted(point.items()):
+                overrides[get_override_name(path, country)] = value
+            scenarios.append(overrides)
+    return scenarios
+
+def runSimulationTask(task):
+    """Function to run task of one of simulations run together, return  index of simulation and result of task"""
+    index, run_function, args = task
+    return index, run_function(args)
+
+def runSimulationsTogether(simulations, vectorized=False):
+    """Runs iterations of started @simulations (see Simulation.startSimulation) in one pool of workers - tasks of all
+    simulations are scheduled together, so all workers are busy until the last task, then stats of simulations are saved"""
+    rows = 0
+    for s in simulations:
+        s.results_offset = rows  # each simulation has its own rows in shared results buffer
+        rows += s.results_rows
+    pool, progress_counter = getWorkerPool(rows)
+    iterations_number = sum(s.simulation_record["iterations_number"] for s in simulations)
+    metrics = RunMetrics(progress_counter, iterations_number, getWorkersNumber(), [s.iterations_writer for s in simulations],
+                         [s.simulation_no for s in simulations]).start()
+
+    tasks = []
+    for index, s in enumerate(simulations):
+        run_function, data = s.getTasks(s.simulation_record["seeds"], vectorized)
+        tasks += [(index, run_function, args) for args in data]
+    try:
+        for index, result in pool.imap_unordered(runSimulationTask, tasks, getChunkSize(len(tasks))):
+            simulations[index].saveTaskResult(result)
+            metrics.addTask(result[3])
+    finally:
+        metrics.stop()
+
+    for s in simulations:
+        result = s.getRunResults(s.simulation_record["seeds"])
+        if s.keep_values:
+            s.setResults(result)
+        s.finishSimulation()
+        s.results_offset = 0
+
+def runAndSaveScenarios(spec, comment='', master_seed=None, sampling='random', antithetic=False, importance_sampling=False,
+                        fine_iterations_number=None, stage_cache=False, persistence=PERSISTENCE_DEFAULT):
+    """Runs simulations of all scenarios of @spec together in one pool of workers and saves them to db.
+    @spec - dict or name of YAML file with 'country', 'iterations', optionally 'vectorized' (default False),
+    'common_random_numbers' (default True - all scenarios use the same master seed) and scenarios (see getScenarios),
+    config files are not changed - overrides of scenario are applied in memory of workers, example:
+        country: SLOVENIA
+        iterations: 1000
+        grid: {DEBT.interest_rate: [4, 6], SUBSIDY.MWhFIT: [60, 70]}
+    @master_seed, @sampling, @antithetic, @importance_sampling, @fine_iterations_number, @stage_cache, @persistence - see
+    Simulation.runSimulation (multilevel and stage cache only with vectorized engine)
+    return  list of numbers of simulations of scenarios"""
+    if isinstance(spec, basestring):
+        with open(spec) as f:
+            spec = yaml.load(f)
+    country, iterations_number = spec['country'], spec['iterations']
+    vectorized = spec.get('vectorized', False)
+    if spec.get('common_random_numbers', True) and master_seed is None:
+        master_seed = random.randint(0, MASTER_SEED_MAX)
+    scenarios = getScenarios(spec, country)
+
+    simulations = []
+    for i, overrides in enumerate(scenarios):
+        description = ", ".join("%s=%s" % item for item in overrides.items())
+        s = Simulation(country, comment="%sScenario %s/%s: %s" % (comment and comment + " ", i + 1, len(scenarios), description),
+                       config_overrides=overrides)
+        s.startSimulation(iterations_number, vectorized, master_seed, None, sampling, antithetic, importance_sampling,
+                          fine_iterations_number if vectorized else None, stage_cache and vectorized, persistence)
+        simulations.append(s)
+    runSimulationsTogether(simulations, vectorized)
+    return [s.simulation_no for s in simulations]
+
+def runAndSaveSweep(spec, comment='', master_seed=None, stage_cache=True, persistence=PERSISTENCE_DEFAULT):
+    """Runs one-at-a-time sensitivity sweep of @spec - baseline and simulations with one parameter set to its low and high
+    value are run together in one pool of workers with the same @master_seed (common random numbers), low/high simulations
+    run only first iterations of baseline and their means are estimated from paired differences (see rm.calcSweepSwings),
+    with vectorized engine and @stage_cache they load stages of baseline not affected by parameter (weather, prices,
+    plants and production are reused for financial parameters), so sweep of many parameters costs little more than baseline.
+    Random config values are pinned to low/high value (see config_yaml_reader.apply_overrides) - other values keep their draws.
+    @spec - dict or name of YAML file with 'country', 'iterations' of baseline, 'parameters' (dict[path] = [low, high], paths
+    are resolved as in getScenarios), optionally 'sweep_iterations' (default SWEEP_ITERATIONS) and 'vectorized' (default True),
+    example:
+        country: SLOVENIA
+        iterations: 1000
+        parameters: {DEBT.interest_rate: [2, 6], SUBSIDY.MWhFIT: [60, 80]}
+    @persistence - profile of saved iterations of baseline (see Simulation.runSimulation), low/high simulations save scalars
+    return  number of baseline simulation, swings of SWEEP_FIELDS are saved to its record ('sweep')"""
+    if isinstance(spec, basestring):
+        with open(spec) as f:
+            spec = yaml.load(f)
+    country, iterations_number = spec['country'], spec['iterations']
+    vectorized = spec.get('vectorized', True)
+    sweep_iterations = min(spec.get('sweep_iterations', SWEEP_ITERATIONS), iterations_number)
+    if vectorized:  # whole blocks - blocks of baseline with the same seeds (and stage cache keys)
+        sweep_iterations = min(-(-sweep_iterations // VECTORIZED_BLOCK_SIZE) * VECTORIZED_BLOCK_SIZE, iterations_number)
+    if master_seed is None:
+        master_seed = random.randint(0, MASTER_SEED_MAX)
+    names = [get_override_name(path, country) for path in sorted(spec['parameters'])]
+    values = [list(spec['parameters'][path]) for path in sorted(spec['parameters'])]
+    stage_cache = stage_cache and vectorized
+    prefix = comment and comment + " "
+
+    baseline = Simulation(country, comment="%sSweep baseline" % prefix)
+    baseline.startSimulation(iterations_number, vectorized, master_seed, stage_cache=stage_cache, persistence=persistence)
+    simulations = [baseline]  # baseline is scheduled first - its stages are cached before low/high blocks need them
+    for name, (low, high) in zip(names, values):
+        for value in (low, high):
+            s = Simulation(country, comment="%sSweep of simulation %s: %s=%s" % (prefix, baseline.simulation_no, name, value),
+                           config_overrides={name: value})
+            s.startSimulation(sweep_iterations, vectorized, master_seed, stage_cache=stage_cache, persistence='scalars')
+            simulations.append(s)
+    runSimulationsTogether(simulations, vectorized)
+
+    db = Database()
+    lines = [db.getIterationsFieldsValues(s.simulation_no, SWEEP_FIELDS) for s in simulations]
+    sweep = {'parameters': names, 'values': values, 'iterations': sweep_iterations,  # names contain dots - swings are lists in order of parameters
+             'simulations': [[s.simulation_no for s in simulations[i:i + 2]] for i in range(1, len(simulations), 2)],
+             'swings': calcSweepSwings(SWEEP_FIELDS, lines[0], zip(lines[1::2], lines[2::2]))}
+    db.updateSimulationField(baseline.simulation_no, "sweep", sweep)
+    return baseline.simulation_no
+
+def runAndSavePortfolio(spec, comment='', master_seed=None, antithetic=False, persistence=PERSISTENCE_DEFAULT):
+    """Runs portfolio simulation of plants of @spec and saves it to db - each iteration evaluates all plants in one worker,
+    price path of each country is generated once and shared by its plants (see PortfolioIteration), record has portfolio
+    stats (irr_stats, npv_stats) and stats of each plant ('portfolio')
+    @spec - dict or name of YAML file with 'iterations' and 'plants' - list of dicts with 'country' and optionally 'overrides'
+    (dict[path] = value, paths are resolved as in getScenarios), example:
+        iterations: 1000
+        plants:
+          - {country: SLOVENIA}
+          - {country: SLOVENIA, overrides: {SUBSIDY.MWhFIT: 70}}
+          - {country: FRANCE}
+    @master_seed, @antithetic, @persistence - see Simulation.runSimulation
+    return  number of simulation"""
+    if isinstance(spec, basestring):
+        with open(spec) as f:
+            spec = yaml.load(f)
+    plants = []
+    for plant in spec['plants']:
+        overrides = plant.get('overrides') or {}
+        plants.append((plant['country'], dict((get_override_name(path, plant['country']), value) for path, value in overrides.items())))
+    description = ", ".join(country + "".join(" %s=%s" % item for item in sorted(overrides.items())) for country, overrides in plants)
+    s = Simulation(plants[0][0], comment="%sPortfolio: %s" % (comment and comment + " ", description), plants=plants)
+    s.runSimulation(spec['iterations'], master_seed=master_seed, antithetic=antithetic, persistence=persistence)
     return s.simulation_no
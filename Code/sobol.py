@@ -0,0 +1,104 @@
+import numpy
+
+BITS = 32  # precision of points
+DIRECTION_NUMBERS_SEED = 1  # seed of initial direction numbers of dimensions
+
+
+def polynomialMulMod(a, b, p, degree):
+    """return  a * b modulo @p (polynomials over GF(2) as bits of int, @p has @degree)"""
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a >> degree & 1:
+            a ^= p
+    return result
+
+def polynomialPowMod(a, exponent, p, degree):
+    """return  a ** @exponent modulo @p (see polynomialMulMod)"""
+    result = 1
+    while exponent:
+        if exponent & 1:
+            result = polynomialMulMod(result, a, p, degree)
+        a = polynomialMulMod(a, a, p, degree)
+        exponent >>= 1
+    return result
+
+def primeFactors(n):
+    """return  list of distinct prime factors of @n"""
+    factors = []
+    factor = 2
+    while factor * factor <= n:
+        if n % factor == 0:
+            factors.append(factor)
+            while n % factor == 0:
+                n //= factor
+        factor += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+def isPrimitivePolynomial(p, degree):
+    """return  True if polynomial @p of @degree over GF(2) is primitive - x has order 2^degree - 1 modulo @p"""
+    order = 2 ** degree - 1
+    if degree == 1:
+        return p == 0b11
+    return polynomialPowMod(2, order, p, degree) == 1 and \
+        all(polynomialPowMod(2, order // q, p, degree) != 1 for q in primeFactors(order))
+
+def getPrimitivePolynomials(number):
+    """return  list of @number primitive polynomials (degree, polynomial) ordered by degree, as in tables of Sobol sequence"""
+    result = []
+    degree = 1
+    while len(result) < number:
+        for p in range(2 ** degree + 1, 2 ** (degree + 1), 2):  # leading and constant coefficients are 1
+            if isPrimitivePolynomial(p, degree):
+                result.append((degree, p))
+        degree += 1
+    return result[:number]
+
+
+class SobolSequence():
+    """Sobol low-discrepancy sequence in @dimensions_number dimensions.
+    Dimension 0 is van der Corput sequence, other dimensions use primitive polynomials of the lowest degrees
+    with fixed pseudo-random initial direction numbers. Points are scrambled by random linear scrambling with
+    digital shift (randomized QMC), so every scrambling gives unbiased estimates and their spread is QMC error."""
+
+    def __init__(self, dimensions_number):
+        self.dimensions_number = dimensions_number
+        self.directions = numpy.zeros((dimensions_number, BITS), dtype=numpy.int64)  # direction numbers v_k (k-th bit of index)
+        self.directions[0] = [1 << (BITS - 1 - k) for k in range(BITS)]
+        random_state = numpy.random.RandomState(DIRECTION_NUMBERS_SEED)
+        for dimension, (degree, p) in enumerate(getPrimitivePolynomials(dimensions_number - 1), 1):
+            m = [2 * random_state.randint(0, 2 ** i) + 1 for i in range(degree)]  # odd m_i < 2^i
+            for k in range(degree, BITS):
+                value = m[k - degree] ^ (m[k - degree] << degree)
+                for i in range(1, degree):
+                    if p >> (degree - i) & 1:
+                        value ^= m[k - i] << i
+                m.append(value)
+            self.directions[dimension] = [m[k] << (BITS - 1 - k) for k in range(BITS)]
+
+    def scrambleDirections(self, dimension, random_state):
+        """return  direction numbers of @dimension multiplied by random lower triangular binary matrix"""
+        positions = numpy.arange(BITS - 1, -1, -1)  # bit positions from most significant
+        bits = (self.directions[dimension][:, None] >> positions) & 1  # (k, bit)
+        matrix = numpy.tril(random_state.randint(0, 2, size=(BITS, BITS)), -1) + numpy.eye(BITS, dtype=int)
+        scrambled_bits = bits.dot(matrix.T) % 2
+        return (scrambled_bits << positions).sum(axis=1)
+
+    def getPoints(self, dimension, points_number, random_state=None):
+        """return  array with coordinate @dimension of first @points_number points, values are in (0, 1),
+        with @random_state points are scrambled (the same @random_state state gives the same scrambling)"""
+        if random_state is None:
+            directions, shift = self.directions[dimension], 0
+        else:
+            directions = self.scrambleDirections(dimension, random_state)
+            shift = random_state.randint(0, 2 ** BITS, dtype=numpy.int64)
+        indexes = numpy.arange(points_number)
+        points = numpy.zeros(points_number, dtype=numpy.int64)
+        for k in range(max(points_number - 1, 1).bit_length()):
+            points ^= numpy.where(indexes >> k & 1, directions[k], 0)
+        return ((points ^ shift) + 0.5) / 2.0 ** BITS
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+"""Content addressed cache of results of stages of vectorized engine (weather, price paths, plants, production).
+Stage is keyed by hash of seed of block, configs which the stage depends on and state of random generators
+at start of stage, so rerun with changed financial configs loads unchanged stages instead of calculating them.
+Results are pickled to files in stage_cache_directory, least recently used files are deleted above STAGE_CACHE_MAX_SIZE."""
+
+import os
+import sys
+import hashlib
+import cPickle
+import numpy
+
+from annex import mkdir_p, memoized
+from constants import stage_cache_directory, STAGE_CACHE_MAX_SIZE, STAGE_CACHE_MODULES
+
+
+def updateHash(hasher, value):
+    """Updates @hasher with canonical representation of @value - dicts by sorted keys, arrays by their bytes"""
+    if isinstance(value, dict):
+        hasher.update('{')
+        for key in sorted(value):
+            updateHash(hasher, key)
+            updateHash(hasher, value[key])
+        hasher.update('}')
+    elif isinstance(value, (list, tuple)):
+        hasher.update('[')
+        for item in value:
+            updateHash(hasher, item)
+        hasher.update(']')
+    elif isinstance(value, numpy.ndarray):
+        hasher.update('%s%s' % (value.dtype.str, value.shape))
+        hasher.update(numpy.ascontiguousarray(value).tostring())
+    else:
+        hasher.update('%s:%r;' % (type(value).__name__, value))
+
+def getKey(*parts):
+    """return  hex sha1 hash of @parts"""
+    hasher = hashlib.sha1()
+    updateHash(hasher, parts)
+    return hasher.hexdigest()
+
+@memoized
+def getSourceFingerprint():
+    """return  hash of source of STAGE_CACHE_MODULES, part of all keys - cached stages are not used after change of model"""
+    sources = []
+    for module_name in STAGE_CACHE_MODULES:
+        __import__(module_name)
+        with open(os.path.splitext(sys.modules[module_name].__file__)[0] + '.py') as f:
+            sources.append(f.read())
+    return getKey(sources)
+
+
+class StageCache():
+    """Cache of stages results on disk with size cap and LRU eviction (modification time of file is time of last use)"""
+
+    def __init__(self, directory=stage_cache_directory, max_size=STAGE_CACHE_MAX_SIZE):
+        """@max_size - MB"""
+        self.directory = directory
+        self.max_size = max_size * 1024 ** 2
+        self.hits = 0
+        self.misses = 0
+        mkdir_p(directory)
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def load(self, key):
+        """return  cached value of @key or None"""
+        path = self.getPath(key)
+        try:
+            with open(path, 'rb') as f:
+                value = cPickle.load(f)
+            os.utime(path, None)  # mark as recently used
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):  # not cached, evicted or partly written by other worker
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def save(self, key, value):
+        """Saves @value of @key (atomically - other workers can read cache), then evicts least recently used values"""
+        path = self.getPath(key)
+        temp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used values until size of cache is below self.max_size"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # deleted by other worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
@@ -0,0 +1,224 @@
+import math
+import numpy
+from collections import OrderedDict
+from numbers import Number
+from constants import STATS_SKETCH_COMPRESSION, STATS_PERCENTILES, STATS_VAR_LEVELS
+
+
+class StatsAccumulator():
+    """Mergeable streaming statistics of one simulation value (for example irr_project_y of all iterations).
+    Holds online central moments (count, mean, M2, M3, M4, min, max) and quantile sketch (merging t-digest -
+    sorted centroids with mean and weight), so memory does not depend on number of iterations.
+    Accumulators of different workers or shards can be merged (see merge)."""
+
+    def __init__(self, compression=STATS_SKETCH_COMPRESSION):
+        """@compression - accuracy of quantile sketch, number of centroids is about @compression"""
+        self.compression = compression
+        self.count = 0
+        self.m1 = 0.0  # mean
+        self.m2 = 0.0  # sums of powers of deviations from mean
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.centroids_means = numpy.array([])
+        self.centroids_weights = numpy.array([])
+        self.buffer = []  # values added after last flush
+
+    def add(self, value):
+        """Adds one value, not digit values (None irr) and nans are skipped"""
+        if isinstance(value, Number) and not math.isnan(value) and not math.isinf(value):
+            self.buffer.append(float(value))
+            if len(self.buffer) >= 5 * self.compression:
+                self.flush()
+
+    def addValues(self, values):
+        """Adds list of values"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Adds all values accumulated by @other accumulator"""
+        other.flush()
+        self.flush()
+        self.mergeMoments(other.count, other.m1, other.m2, other.m3, other.m4, other.min, other.max)
+        self.compress(other.centroids_means, other.centroids_weights)
+
+    def flush(self):
+        """Moves buffered values to moments and quantile sketch"""
+        if not self.buffer:
+            return
+        values = numpy.array(self.buffer)
+        self.buffer = []
+        deviations = values - values.mean()
+        self.mergeMoments(len(values), values.mean(), (deviations ** 2).sum(), (deviations ** 3).sum(), (deviations ** 4).sum(),
+                          values.min(), values.max())
+        self.compress(values, numpy.ones(len(values)))
+
+    def mergeMoments(self, count, m1, m2, m3, m4, min_value, max_value):
+        """Combines moments with moments of other set of values (pairwise formulas of Pebay)"""
+        if count == 0:
+            return
+        n_a, n_b = float(self.count), float(count)
+        n = n_a + n_b
+        delta = m1 - self.m1
+        self.m4 = (self.m4 + m4 + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+                   + 6 * delta ** 2 * (n_a ** 2 * m2 + n_b ** 2 * self.m2) / n ** 2 + 4 * delta * (n_a * m3 - n_b * self.m3) / n)
+        self.m3 = (self.m3 + m3 + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+                   + 3 * delta * (n_a * m2 - n_b * self.m2) / n)
+        self.m2 = self.m2 + m2 + delta ** 2 * n_a * n_b / n
+        self.m1 = self.m1 + delta * n_b / n
+        self.count += count
+        self.min = min(self.min, min_value)
+        self.max = max(self.max, max_value)
+
+    def compress(self, means, weights):
+        """Adds centroids (@means with @weights) to sketch and merges neighbour centroids
+        while they fit to size limit of scale function k(q) = compression / 2pi * asin(2q - 1)"""
+        means = numpy.concatenate([self.centroids_means, means])
+        weights = numpy.concatenate([self.centroids_weights, weights])
+        if len(means) == 0:
+            return
+        order = numpy.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        scale = lambda q: self.compression / (2 * math.pi) * math.asin(2 * min(q, 1.0) - 1)
+
+        result_means, result_weights = [], []
+        current_mean, current_weight = means[0], weights[0]
+        cumulative = 0.0  # weight of finished centroids
+        k_limit = scale(0.0) + 1
+        for mean, weight in zip(means[1:], weights[1:]):
+            if scale((cumulative + current_weight + weight) / total) <= k_limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                result_means.append(current_mean)
+                result_weights.append(current_weight)
+                cumulative += current_weight
+                k_limit = scale(cumulative / total) + 1
+                current_mean, current_weight = mean, weight
+        result_means.append(current_mean)
+        result_weights.append(current_weight)
+
+        self.centroids_means = numpy.array(result_means)
+        self.centroids_weights = numpy.array(result_weights)
+
+    def getCount(self):
+        """return  number of accumulated values"""
+        self.flush()
+        return self.count
+
+    def getMean(self):
+        self.flush()
+        return self.m1 if self.count else float('nan')
+
+    def getVariance(self, ddof=0):
+        """return  variance, biased estimator by default (as numpy.var)"""
+        self.flush()
+        return self.m2 / (self.count - ddof) if self.count > ddof else float('nan')
+
+    def getStd(self, ddof=0):
+        return math.sqrt(self.getVariance(ddof))
+
+    def getSkew(self):
+        """return  skewness -- biased estimator (as scipy.stats.skew)"""
+        self.flush()
+        if self.count < 2 or self.m2 == 0:
+            return float('nan')
+        return math.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+    def getKurtosis(self):
+        """return  kurtosis, Fisher (-3) definition -- biased estimator (as scipy.stats.kurtosis)"""
+        self.flush()
+        if self.count < 2 or self.m2 == 0:
+            return float('nan')
+        return self.count * self.m4 / self.m2 ** 2 - 3
+
+    def getQuantile(self, q):
+        """return  approximate quantile @q (0..1), interpolated between centres of centroids"""
+        self.flush()
+        if self.count == 0:
+            return float('nan')
+        cumulative = numpy.cumsum(self.centroids_weights)
+        centres = cumulative - self.centroids_weights / 2.0
+        positions = numpy.concatenate([[0], centres, [cumulative[-1]]])
+        values = numpy.concatenate([[self.min], self.centroids_means, [self.max]])
+        return float(numpy.interp(q * cumulative[-1], positions, values))
+
+    def getTailMean(self, q):
+        """return  mean of lower @q (0..1) part of values (for CVaR)"""
+        self.flush()
+        if self.count == 0:
+            return float('nan')
+        cutoff = q * self.count
+        if cutoff <= 0:
+            return self.min
+        total, cumulative = 0.0, 0.0
+        for mean, weight in zip(self.centroids_means, self.centroids_weights):
+            part = min(weight, cutoff - cumulative)
+            total += part * mean
+            cumulative += part
+            if cumulative >= cutoff:
+                break
+        return total / cumulative
+
+    def getQuantilePoints(self, points):
+        """return  list of @points evenly spaced quantiles - approximation of accumulated values for charts"""
+        return [self.getQuantile((i + 0.5) / points) for i in range(points)]
+
+    def getStatistics(self):
+        """return  dict with the same stats as rm.calcStatistics"""
+        result = OrderedDict()
+        result['std'] = self.getStd()
+        result['skew'] = self.getSkew()
+        result['kurtosis'] = self.getKurtosis()
+        result['mean'] = self.getMean()
+        result['min'] = self.min if self.count else float('nan')
+        result['max'] = self.max if self.count else float('nan')
+        result['median'] = self.getQuantile(0.5)
+        result['variance'] = self.getVariance()
+        return result
+
+    def getRiskMeasures(self, percentiles=STATS_PERCENTILES, var_levels=STATS_VAR_LEVELS):
+        """return  dict with percentiles, VaR and CVaR (lower tail) in the same format as rm.calcRiskMeasures"""
+        result = OrderedDict()
+        result['percentiles'] = OrderedDict(('p%g' % p, self.getQuantile(p / 100.0)) for p in percentiles)
+        result['VaR'] = OrderedDict(('p%g' % (level * 100), self.getQuantile(level)) for level in var_levels)
+        result['CVaR'] = OrderedDict(('p%g' % (level * 100), self.getTailMean(level)) for level in var_levels)
+        return result
+
+    def getState(self):
+        """return  dict with state of accumulator which can be saved to db (see setState)"""
+        self.flush()
+        return {'compression': self.compression, 'count': self.count, 'm1': self.m1, 'm2': self.m2, 'm3': self.m3,
+                'm4': self.m4, 'min': self.min, 'max': self.max,
+                'centroids_means': list(self.centroids_means), 'centroids_weights': list(self.centroids_weights)}
+
+    def setState(self, state):
+        """Restores accumulator from @state (see getState)"""
+        for key in ['compression', 'count', 'm1', 'm2', 'm3', 'm4', 'min', 'max']:
+            setattr(self, key, state[key])
+        self.centroids_means = numpy.array(state['centroids_means'], dtype=float)
+        self.centroids_weights = numpy.array(state['centroids_weights'], dtype=float)
+        self.buffer = []
+        return self
+
+
+def accumulateResults(rows):
+    """return  list of accumulators, one for each column of @rows (irr and tep values of iterations)"""
+    accumulators = []
+    for column in zip(*rows):
+        accumulator = StatsAccumulator()
+        accumulator.addValues(column)
+        accumulator.flush()  # buffer is not sent to other process
+        accumulators.append(accumulator)
+    return accumulators
+
+def mergeAccumulators(accumulators, others):
+    """Merges list of accumulators @others to @accumulators (the same columns) and returns merged list"""
+    if not accumulators:
+        return others
+    for accumulator, other in zip(accumulators, others):
+        accumulator.merge(other)
+    return accumulators
@@ -0,0 +1,238 @@
+import time
+import numpy
+from collections import OrderedDict, Counter
+from itertools import combinations_with_replacement
+from numpy.polynomial.hermite_e import hermeval
+from database import Database
+from config_yaml_reader import setConfigOverrides
+from vectorized_engine import VectorizedIterations
+from constants import SURROGATE_INPUTS, SURROGATE_FIELDS, SURROGATE_DEGREES, SURROGATE_RIDGES, SURROGATE_MIN_STD, \
+    SURROGATE_VALIDATION_SHARE, SURROGATE_SAMPLE_SIZE, SURROGATE_RESIDUAL_POINTS, SURROGATE_FALLBACK_ITERATIONS, \
+    STATS_PERCENTILES, VECTORIZED_BLOCK_SIZE, MASTER_SEED_MAX
+
+
+class SurrogateModel():
+    """Emulator of results of simulation (SURROGATE_FIELDS) - polynomial chaos on random config values (SURROGATE_INPUTS).
+    Results are regressed (ridge) on Hermite polynomials of standardized inputs (see SURROGATE_DEGREES),
+    part of results not explained by inputs (weather, prices, failures) is kept as quantiles of residuals.
+    Prediction for settings of some inputs evaluates model over saved sample of inputs with set values replaced
+    (other inputs keep their joint distribution) and adds residuals, so distribution of results takes milliseconds."""
+
+    def __init__(self, simulation_no=None, country=None):
+        self.simulation_no = simulation_no
+        self.country = country
+        self.iterations = 0  # number of iterations used for fitting
+        self.names = []  # inputs which varied in simulation (config file and path)
+        self.means = []  # means and stds of inputs for standardization
+        self.stds = []
+        self.mins = []  # domain of inputs
+        self.maxs = []
+        self.constants = {}  # inputs which did not vary - dict[name] = value
+        self.terms = []  # polynomial terms - tuples of indexes of inputs, () - constant term
+        self.coefficients = {}  # dict[field] = coefficients of terms
+        self.residuals = {}  # dict[field] = quantiles of residuals
+        self.validation = {}  # dict[field] = R2 on held out iterations
+        self.fitted = {}  # dict[field] = [degree, ridge] chosen by R2 on held out iterations
+        self.sample = []  # rows of inputs for predictions
+
+    def fit(self, inputs, outputs):
+        """Fits model to values of iterations
+        @inputs - rows of values of SURROGATE_INPUTS (config units), inputs missing in some iteration are not used
+        @outputs - dict[field] = values of field, not digit values are skipped"""
+        names = [name for name, field, scale in SURROGATE_INPUTS]
+        inputs = numpy.array(inputs, dtype=float)
+        saved = ~numpy.isnan(inputs).any(axis=0)
+        names = [name for name, is_saved in zip(names, saved) if is_saved]
+        inputs = inputs[:, saved]
+        means, stds = inputs.mean(axis=0), inputs.std(axis=0)
+        varying = stds > SURROGATE_MIN_STD * numpy.maximum(numpy.abs(means), 1)
+        self.names = [name for name, used in zip(names, varying) if used]
+        self.constants = dict((name, float(mean)) for name, mean, used in zip(names, means, varying) if not used)
+        inputs = inputs[:, varying]
+        self.means, self.stds = list(means[varying]), list(stds[varying])
+        self.mins, self.maxs = list(inputs.min(axis=0)), list(inputs.max(axis=0))
+        self.terms = getPolynomialTerms(len(self.names), max(SURROGATE_DEGREES))
+        self.iterations = len(inputs)
+
+        order = numpy.random.RandomState(0).permutation(len(inputs))  # held out iterations and sample are random
+        self.sample = inputs[order[:SURROGATE_SAMPLE_SIZE]].tolist()
+        design = self.getDesignMatrix(inputs)
+        for field, values in outputs.items():
+            values = numpy.array([value if isinstance(value, (int, float)) else numpy.nan for value in values], dtype=float)
+            rows = order[numpy.isfinite(values[order])]
+            if len(rows) < 2:
+                continue
+            held_out = int(len(rows) * SURROGATE_VALIDATION_SHARE)
+            test, train = rows[:held_out], rows[held_out:]
+            best = (float('nan'), min(SURROGATE_DEGREES), max(SURROGATE_RIDGES))  # (R2, degree, ridge)
+            if held_out > 1 and values[test].var() > 0:  # degree and ridge with best R2 on held out iterations
+                for degree in SURROGATE_DEGREES:
+                    columns = len(getPolynomialTerms(len(self.names), degree))  # terms are ordered by degree
+                    for ridge in SURROGATE_RIDGES:
+                        coefficients = solveRidge(design[train, :columns], values[train], ridge)
+                        errors = values[test] - design[test, :columns].dot(coefficients)
+                        r2 = 1 - errors.var() / values[test].var()
+                        if not r2 <= best[0]:
+                            best = (r2, degree, ridge)
+            self.validation[field], degree, ridge = best
+            self.fitted[field] = [degree, ridge]
+            columns = len(getPolynomialTerms(len(self.names), degree))
+            coefficients = numpy.zeros(len(self.terms))  # higher degree terms are not used
+            coefficients[:columns] = solveRidge(design[rows, :columns], values[rows], ridge)
+            residuals = values[rows] - design[rows].dot(coefficients)
+            self.coefficients[field] = list(coefficients)
+            self.residuals[field] = list(numpy.percentile(residuals, (numpy.arange(SURROGATE_RESIDUAL_POINTS) + 0.5) * 100.0 / SURROGATE_RESIDUAL_POINTS))
+        return self
+
+    def getDesignMatrix(self, inputs):
+        """return  matrix of polynomial terms (columns) of rows of @inputs"""
+        z = (numpy.asarray(inputs, dtype=float) - self.means) / self.stds
+        columns = []
+        for term in self.terms:
+            column = numpy.ones(len(z))
+            for index, degree in Counter(term).items():
+                column *= hermeval(z[:, index], [0] * degree + [1])
+            columns.append(column)
+        return numpy.array(columns).T
+
+    def getOutOfDomain(self, settings):
+        """return  list of names of @settings (dict[name] = value) which model can not predict -
+        inputs which did not vary in simulation or values outside of their range"""
+        result = []
+        for name, value in settings.items():
+            if name not in self.names:
+                result.append(name)
+                continue
+            index = self.names.index(name)
+            if not self.mins[index] <= value <= self.maxs[index]:
+                result.append(name)
+        return result
+
+    def predict(self, settings):
+        """return  dict[field] = distribution of field (see calcDistribution) with inputs set to @settings (dict[name] = value)"""
+        rows = numpy.array(self.sample, dtype=float)
+        for name, value in settings.items():
+            rows[:, self.names.index(name)] = value
+        design = self.getDesignMatrix(rows)
+        random_state = numpy.random.RandomState(0)
+        results = OrderedDict()
+        for field in SURROGATE_FIELDS:
+            if field not in self.coefficients:
+                continue
+            residuals = numpy.array(self.residuals[field])[random_state.randint(0, len(self.residuals[field]), size=len(rows))]
+            results[field] = calcDistribution(design.dot(self.coefficients[field]) + residuals)
+        return results
+
+    def getState(self):
+        """return  dict with state of model which can be saved to db (see setState)"""
+        state = dict((key, getattr(self, key)) for key in ['simulation_no', 'country', 'iterations', 'names', 'means', 'stds',
+                                                            'mins', 'maxs', 'coefficients', 'residuals', 'validation', 'fitted', 'sample'])
+        state['simulation'] = state.pop('simulation_no')
+        state['constants'] = [[name, value] for name, value in self.constants.items()]  # names with dots can not be keys in db
+        state['terms'] = [list(term) for term in self.terms]
+        return state
+
+    def setState(self, state):
+        """Restores model from @state (see getState)"""
+        for key in ['country', 'iterations', 'names', 'means', 'stds', 'mins', 'maxs', 'coefficients', 'residuals', 'validation', 'fitted', 'sample']:
+            setattr(self, key, state[key])
+        self.simulation_no = state['simulation']
+        self.constants = dict(state['constants'])
+        self.terms = [tuple(term) for term in state['terms']]
+        return self
+
+
+def getPolynomialTerms(inputs_number, degree):
+    """return  list of polynomial terms of @inputs_number inputs up to total @degree, term is tuple of indexes of inputs
+    (repeated index - higher degree of input), example for 2 inputs and degree 2: (), (0,), (1,), (0, 0), (0, 1), (1, 1)"""
+    terms = []
+    for term_degree in range(degree + 1):
+        terms.extend(combinations_with_replacement(range(inputs_number), term_degree))
+    return terms
+
+def solveRidge(design, values, ridge):
+    """return  coefficients of ridge regression of @values on columns of @design with penalty @ridge
+    (relative to number of values, first column - intercept is not penalized)"""
+    penalty = ridge * len(values) * numpy.eye(design.shape[1])
+    penalty[0, 0] = 0
+    return numpy.linalg.solve(design.T.dot(design) + penalty, design.T.dot(values))
+
+def calcDistribution(values):
+    """return  dict with mean, std, percentiles and probability of negative value of finite @values"""
+    values = numpy.asarray(values, dtype=float)
+    values = values[numpy.isfinite(values)]
+    result = OrderedDict()
+    result['iterations'] = len(values)
+    if not len(values):
+        return result
+    result['mean'] = values.mean()
+    result['std'] = values.std()
+    result['percentiles'] = OrderedDict(('p%g' % p, numpy.percentile(values, p)) for p in STATS_PERCENTILES)
+    result['probability_negative'] = (values < 0).mean()
+    return result
+
+def getConfigName(name):
+    """return  full name of input of surrogate model (config file and path) from @name or its end,
+    example: SUBSIDY.MWhFIT -> sm_config.ini.SUBSIDY.MWhFIT"""
+    names = [input_name for input_name, field, scale in SURROGATE_INPUTS if input_name == name or input_name.endswith('.' + name)]
+    if len(names) != 1:
+        raise ValueError("Unknown or ambiguous input %r, inputs are %s" % (name, ", ".join(input_name for input_name, field, scale in SURROGATE_INPUTS)))
+    return names[0]
+
+def parseSettings(words):
+    """return  dict[name] = value of inputs from @words like SUBSIDY.MWhFIT=70 (values in units of config files)"""
+    settings = OrderedDict()
+    for word in words:
+        name, sep, value = str(word).partition('=')
+        if not sep:
+            raise ValueError("Setting should be name=value, got %r" % word)
+        settings[getConfigName(name)] = float(value)
+    return settings
+
+def fitSurrogate(simulation_no):
+    """Fits surrogate model to saved iterations of @simulation_no, saves it to db and returns it"""
+    db = Database()
+    fields = [field for name, field, scale in SURROGATE_INPUTS]
+    lines = db.getIterationsFieldsValues(simulation_no, fields + SURROGATE_FIELDS)
+    if not lines:
+        raise ValueError("Simulation %r has no saved iterations" % simulation_no)
+    lines = [lines[iteration_no] for iteration_no in sorted(lines)]
+    scales = [scale for name, field, scale in SURROGATE_INPUTS]
+    inputs = [[value / scale if isinstance(value, (int, float)) else numpy.nan for value, scale in zip(line, scales)]
+              for line in lines]
+    outputs = OrderedDict((field, [line[len(fields) + i] for line in lines]) for i, field in enumerate(SURROGATE_FIELDS))
+
+    model = SurrogateModel(simulation_no, db.getSimulationRecord(simulation_no)['country'])
+    model.fit(inputs, outputs)
+    db.saveSurrogate(model.getState())
+    return model
+
+def loadSurrogate(simulation_no):
+    """return  surrogate model of @simulation_no saved in db"""
+    return SurrogateModel().setState(Database().getSurrogateRecord(simulation_no))
+
+def runFallbackIterations(model, settings, iterations_number=SURROGATE_FALLBACK_ITERATIONS):
+    """return  dict[field] = distribution of field (see calcDistribution) from @iterations_number new iterations
+    (vectorized engine, current process, not saved) of country of @model with config values fixed to @settings"""
+    values = dict((field, []) for field in SURROGATE_FIELDS)
+    setConfigOverrides(settings)
+    try:
+        for first_iteration_no in range(1, iterations_number + 1, VECTORIZED_BLOCK_SIZE):
+            number = min(VECTORIZED_BLOCK_SIZE, iterations_number - first_iteration_no + 1)
+            v = VectorizedIterations(first_iteration_no, number, model.simulation_no, model.country,
+                                     numpy.random.randint(0, MASTER_SEED_MAX))
+            v.run()
+            for field in SURROGATE_FIELDS:
+                values[field].extend(numpy.array(getattr(v, field), dtype=float))
+    finally:
+        setConfigOverrides({})
+    return OrderedDict((field, calcDistribution(values[field])) for field in SURROGATE_FIELDS)
+
+def predictResults(simulation_no, settings, fallback_iterations=SURROGATE_FALLBACK_ITERATIONS):
+    """return  (dict[field] = distribution of field with config values set to @settings, source of distribution, seconds),
+    source is 'surrogate' or 'simulation' - new iterations run when @settings are out of domain of surrogate model"""
+    start_time = time.time()
+    model = loadSurrogate(simulation_no)
+    if model.getOutOfDomain(settings):
+        return runFallbackIterations(model, settings, fallback_iterations), 'simulation', time.time() - start_time
+    return model.predict(settings), 'surrogate', time.time() - start_time
@@ -0,0 +1,28 @@
+import unittest
+import numpy
+from rm import calcAntitheticStatistics
+
+
+class TestCase(unittest.TestCase):
+
+    def test_statistics(self):
+        numpy.random.seed(1)
+        shocks = numpy.random.normal(0, 0.02, size=100)
+        values = list(0.08 + shocks) + list(0.08 - shocks + numpy.random.normal(0, 0.002, size=100))
+        result = calcAntitheticStatistics(['irr'], [values], [(i, i + 100) for i in range(100)])['irr']
+        self.assertEqual(result['pairs'], 100)
+        self.assertLess(result['correlation'], -0.9)
+        self.assertGreater(result['variance_reduction'], 10)
+
+    def test_two_pairs(self):
+        result = calcAntitheticStatistics(['irr'], [[0.05, 0.07, 0.09, 0.04]], [(0, 2), (1, 3)])['irr']
+        self.assertEqual(result['pairs'], 2)
+        self.assertAlmostEqual(result['mean'], 0.0625)
+        self.assertTrue(numpy.isnan(result['correlation']))
+
+    def test_exactly_correlated(self):
+        originals = [0.25, 0.5, 0.75, 1.0]
+        mirrors = [2 - 2 * value for value in originals]  # exact in floating point
+        result = calcAntitheticStatistics(['irr'], [originals + mirrors], [(i, i + 4) for i in range(4)])['irr']
+        self.assertAlmostEqual(result['mean'], 0.6875)
+        self.assertAlmostEqual(result['correlation'], -1)
@@ -0,0 +1,51 @@
+import unittest
+import pymongo
+from database import BufferedWriter, AsyncWriter
+
+
+class Collection():
+    """Collection failing first @failures inserts with lost connection"""
+
+    def __init__(self, failures=0, error=pymongo.errors.AutoReconnect):
+        self.docs = []
+        self.failures = failures
+        self.error = error
+
+    def with_options(self, write_concern):
+        return self
+
+    def insert_many(self, docs, ordered):
+        if self.failures:
+            self.failures -= 1
+            raise self.error("connection lost")
+        self.docs += docs
+
+
+class TestCase(unittest.TestCase):
+
+    def getWriter(self, collection, queue_size=5):
+        return AsyncWriter(BufferedWriter(collection, 3, 10, 1, retries=2, retry_delay=0.001), queue_size)
+
+    def test_drain(self):
+        collection = Collection()
+        writer = self.getWriter(collection)
+        for i in range(20):
+            writer.insert({'iteration': i})
+        writer.flush()
+        self.assertEqual([doc['iteration'] for doc in collection.docs], range(20))
+        writer.insert({'iteration': 20})
+        writer.close()
+        self.assertEqual((writer.inserted, writer.thread), (21, None))
+
+    def test_retry(self):
+        collection = Collection(failures=2)
+        writer = self.getWriter(collection)
+        for i in range(4):
+            writer.insert({'iteration': i})
+        writer.close()
+        self.assertEqual(len(collection.docs), 4)
+
+    def test_error(self):
+        writer = self.getWriter(Collection(failures=3))  # more than retries
+        writer.insert({'iteration': 1})
+        self.assertRaises(pymongo.errors.AutoReconnect, writer.close)
@@ -0,0 +1,24 @@
+import unittest
+import numpy
+from collections import OrderedDict
+from rm import calcControlVariateEstimate
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        self.control = numpy.random.normal(0, 1, size=500)
+        self.values = list(0.08 + 0.02 * self.control + numpy.random.normal(0, 0.005, size=500))
+
+    def test_variance_reduction(self):
+        result = calcControlVariateEstimate(self.values, OrderedDict([('shock', (list(self.control), 0.0))]))
+        self.assertAlmostEqual(result['raw_mean'], numpy.mean(self.values))
+        self.assertAlmostEqual(result['coefficients']['shock'], 0.02, places=3)
+        self.assertGreater(result['variance_reduction'], 10)
+        self.assertLess(abs(result['mean'] - 0.08), 3 * result['se'])
+
+    def test_not_digit_values(self):
+        values = [None] + self.values[1:]
+        result = calcControlVariateEstimate(values, OrderedDict([('shock', (list(self.control), 0.0))]))
+        self.assertAlmostEqual(result['raw_mean'], numpy.mean(self.values[1:]))
@@ -0,0 +1,30 @@
+import unittest
+import numpy
+from rm import calcConvergence, calcSimulationConvergence
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        self.values = list(numpy.random.normal(0.08, 0.02, size=2000))
+
+    def test_mean(self):
+        result = calcConvergence(self.values)
+        self.assertAlmostEqual(result['mean']['value'], numpy.mean(self.values))
+        self.assertAlmostEqual(result['mean']['se'], numpy.std(self.values, ddof=1) / numpy.sqrt(len(self.values)))
+
+    def test_ci_shrinks(self):
+        small = calcConvergence(self.values[:200])
+        large = calcConvergence(self.values)
+        for name in ['mean', 'p5', 'p50', 'p95']:
+            self.assertLess(large[name]['ci'], small[name]['ci'])
+
+    def test_converged(self):
+        values = [self.values, [v + 1 for v in self.values]]
+        result, converged = calcSimulationConvergence(['a', 'b'], values, {'a': 0.01, 'b': 0.01})
+        self.assertTrue(converged)
+        result, converged = calcSimulationConvergence(['a', 'b'], values, {'a': 0.01, 'b': 0.0001})
+        self.assertFalse(converged)
+        self.assertTrue(result['a']['mean']['converged'])
+        self.assertFalse(result['b']['mean']['converged'])
@@ -0,0 +1,60 @@
+import unittest
+import numpy
+import random
+from datetime import date
+from scipy.stats import norm
+from annex import setImportanceSampling, getLikelihoodRatio
+from config_yaml_reader import parse_list_and_get_random
+from rm import calcImportanceSamplingStatistics
+from tm_equipment import Equipment, EQ
+
+NAME = 'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y'  # tilted toward lower values
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        setImportanceSampling(False)
+
+    def test_tilted_config_value(self):
+        numpy.random.seed(1)
+        values, weights = [], []
+        for _ in range(5000):
+            setImportanceSampling(True)
+            values.append(parse_list_and_get_random('1, normal, 0.03, 0.02', float, name=NAME))
+            weights.append(getLikelihoodRatio())
+        self.assertLess(numpy.mean(values), 0.025)
+        result = calcImportanceSamplingStatistics(['y'], [values], weights, hurdles=[0.0])['y']
+        self.assertAlmostEqual(result['mean'], 0.03, delta=0.001)
+        probability = result['probabilities'][0]
+        self.assertLess(abs(probability['probability'] - norm.cdf(0, 0.03, 0.02)), 3 * probability['se'])
+        self.assertAlmostEqual(result['mean_weight'], 1, delta=0.05)
+
+    def test_not_tilted_value(self):
+        setImportanceSampling(True)
+        parse_list_and_get_random('1, normal, 0.03, 0.02', float, name='test.value')
+        self.assertEqual(getLikelihoodRatio(), 1)
+
+    def test_failures(self):
+        random.seed(1)
+        counts = {}
+        for importance_sampling in [False, True]:
+            counts[importance_sampling] = []
+            for _ in range(2000):
+                setImportanceSampling(importance_sampling)
+                inverter = Equipment(EQ.INVERTER, 1, 0, 2000, 10, date(2020, 1, 1), date(2030, 1, 1))
+                counts[importance_sampling].append((len(inverter.failure_intervals), getLikelihoodRatio()))
+        plain = numpy.array(counts[False], dtype=float)
+        tilted = numpy.array(counts[True], dtype=float)
+        self.assertTrue((plain[:, 1] == 1).all())
+        self.assertGreater(tilted[:, 0].mean(), plain[:, 0].mean())
+        weighted_mean = (tilted[:, 0] * tilted[:, 1]).mean()
+        self.assertAlmostEqual(weighted_mean, plain[:, 0].mean(), delta=0.15)
+
+    def test_unit_weights(self):
+        values = list(numpy.linspace(-0.1, 0.2, 301))
+        result = calcImportanceSamplingStatistics(['irr'], [values + [None]], [1.0] * 302, hurdles=[0.0], percentiles=[10])['irr']
+        self.assertEqual(result['iterations'], 301)
+        self.assertAlmostEqual(result['probabilities'][0]['probability'], 100 / 301.0)
+        self.assertAlmostEqual(result['percentiles']['p10'], -0.07, places=6)
+        self.assertAlmostEqual(result['effective_sample_size'], 301)
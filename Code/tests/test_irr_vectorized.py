@@ -0,0 +1,28 @@
+import unittest
+import numpy
+from financial_analysis import CashFlows, irrVectorized, npvVectorized
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        investments = -numpy.random.uniform(5000, 50000, size=(30, 1))
+        returns = numpy.random.normal(800, 600, size=(30, 120))
+        self.cashflows = numpy.hstack([investments, returns])
+
+    def test_irr(self):
+        expected = [CashFlows(list(row)).irr() for row in self.cashflows]
+        result = irrVectorized(self.cashflows)
+        for irr, expected_irr in zip(result, expected):
+            if expected_irr is None:
+                self.assertIsNone(irr)
+            else:
+                self.assertAlmostEqual(expected_irr, irr, places=10)
+
+    def test_npv(self):
+        rates = numpy.linspace(0.001, 0.01, len(self.cashflows))
+        expected = [CashFlows(list(row)).npv(rate) for rate, row in zip(rates, self.cashflows)]
+        result = npvVectorized(rates, self.cashflows)
+        for npv, expected_npv in zip(result, expected):
+            self.assertAlmostEqual(expected_npv, npv, places=6)
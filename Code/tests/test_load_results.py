@@ -0,0 +1,54 @@
+import unittest
+import new
+from constants import IRR_REPORT_FIELDS, TEP_REPORT_FIELDS, RESULTS_NPV_FIELDS
+from simulations import Simulation
+
+
+class Db():
+    """Saved iterations 3, 1, 2 (not in order) of resumed or merged simulation"""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def getIterationsResults(self, simulation_no):
+        return [self.lines[iteration_no]['results'] for iteration_no in sorted(self.lines)]
+
+    def getIterationsControlVariates(self, simulation_no):
+        return [None for iteration_no in sorted(self.lines)]
+
+    def getIterationsNpvs(self, simulation_no):
+        return [[self.lines[iteration_no].get(field) for field in RESULTS_NPV_FIELDS] for iteration_no in sorted(self.lines)]
+
+
+class TestCase(unittest.TestCase):
+
+    def getSimulation(self, lines):
+        s = new.instance(Simulation)  # without db connection of __init__
+        s.db = Db(lines)
+        s.simulation_no = 1
+        s.keep_values = True
+        s.npvs = None
+        s.control_variates = None
+        s.simulation_record = {}
+        s.rm_configs = {'riskFreeRate': 0.02, 'spreadCDS': 0.01, 'benchmarkAdjustedSharpeRatio': 0.2, 'illiquidityPremium': 0.01}
+        return s
+
+    def getLine(self, iteration_no, npv=True):
+        line = {'results': [0.01 * iteration_no] * (len(IRR_REPORT_FIELDS) + len(TEP_REPORT_FIELDS))}
+        if npv:
+            line.update((field, 1000.0 * iteration_no) for field in RESULTS_NPV_FIELDS)
+        return line
+
+    def test_npv_stats(self):
+        s = self.getSimulation(dict((iteration_no, self.getLine(iteration_no)) for iteration_no in [3, 1, 2]))
+        s.loadResults()
+        self.assertEqual(s.npvs, [[1000.0, 2000.0, 3000.0]] * len(RESULTS_NPV_FIELDS))
+        s.addIrrStatsToSimulation()
+        self.assertEqual([stats['field'] for stats in s.simulation_record['npv_stats']], RESULTS_NPV_FIELDS)
+
+    def test_without_npv(self):
+        s = self.getSimulation({1: self.getLine(1), 2: self.getLine(2, npv=False)})
+        s.loadResults()
+        self.assertEqual(s.npvs, None)
+        s.addIrrStatsToSimulation()
+        self.assertNotIn('npv_stats', s.simulation_record)
@@ -0,0 +1,47 @@
+import unittest
+import multiprocessing
+import shutil
+import tempfile
+from metrics import RunMetrics, readSnapshot
+
+
+class Writer():
+    def getStats(self):
+        return {'inserted': 100, 'writes': 2, 'write_time': 0.5, 'max_write_time': 0.4, 'retries': 1, 'queued': 3}
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.counter = multiprocessing.Value('i', 5)
+        self.metrics = RunMetrics(self.counter, 10, 2, [Writer()], [7], self.directory).start()
+
+    def tearDown(self):
+        self.metrics.stop()
+        shutil.rmtree(self.directory)
+
+    def test_snapshot(self):
+        self.assertEqual(self.counter.value, 0)  # reset by start
+        self.counter.value = 4
+        self.metrics.addTask({'setup': 1.0, 'calculation': 3.0, 'total': 4.5})
+        self.metrics.addTask({'setup': 1.0, 'total': 1.0})
+        snapshot = self.metrics.writeSnapshot()
+        self.assertEqual(snapshot['iterations_completed'], 4)
+        self.assertEqual(snapshot['tasks_completed'], 2)
+        self.assertEqual(snapshot['stage_seconds'], {'setup': 2.0, 'calculation': 3.0})
+        self.assertAlmostEqual(snapshot['worker_utilization'], 5.5 / (2 * snapshot['elapsed_seconds']))
+        self.assertAlmostEqual(snapshot['eta_seconds'], 6 / snapshot['iterations_per_second_recent'])
+        self.assertEqual(snapshot['status'], 'running')
+        self.assertEqual(snapshot['db_write']['latency_mean_seconds'], 0.25)
+        self.assertEqual(readSnapshot(self.directory)['iterations_completed'], 4)
+        with open(self.directory + '/metrics.prom') as f:
+            prometheus = f.read()
+        self.assertIn('mirr_iterations_completed{simulations="7"} 4.0\n', prometheus)
+        self.assertIn('mirr_stage_seconds_total{simulations="7",stage="setup"} 2.0\n', prometheus)
+
+    def test_finished(self):
+        self.counter.value = 10
+        self.metrics.stop()
+        snapshot = readSnapshot(self.directory)
+        self.assertEqual((snapshot['status'], snapshot['eta_seconds']), ('finished', 0.0))
@@ -0,0 +1,31 @@
+import unittest
+import numpy
+from rm import calcMultilevelStatistics
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        coarse = numpy.random.normal(0.08, 0.02, size=1000)
+        fine = coarse + 0.002 + numpy.random.normal(0, 0.0005, size=1000)
+        self.levels = [1] * 100 + [0] * 900
+        self.values = [list(fine[:100]) + list(coarse[100:])]  # level 0 iterations have only coarse values
+        self.coarse_values = [list(coarse)]
+        self.costs = [0.1] * 100 + [0.02] * 900  # shared stages 0.01, coarse model 0.01, daily model 0.08
+        self.coarse_costs = [0.01] * 1000
+
+    def test_multilevel_mean(self):
+        result = calcMultilevelStatistics(['irr'], self.values, self.coarse_values, self.levels, self.costs, self.coarse_costs)['irr']
+        level0, level1 = result['levels']
+        self.assertEqual((level0['iterations'], level1['iterations']), (900, 100))
+        self.assertLess(abs(level1['mean'] - 0.002), 3 * numpy.sqrt(level1['variance'] / 100))
+        self.assertLess(abs(result['mean'] - 0.082), 3 * result['se'])
+        self.assertLess(result['optimal_fine_share'], 0.1)
+        self.assertGreater(result['speedup'], 1)
+
+    def test_missing_values(self):
+        self.values[0][0] = None
+        self.coarse_values[0][500] = None
+        result = calcMultilevelStatistics(['irr'], self.values, self.coarse_values, self.levels, self.costs, self.coarse_costs)['irr']
+        self.assertEqual([level['iterations'] for level in result['levels']], [899, 99])
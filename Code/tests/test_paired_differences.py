@@ -0,0 +1,38 @@
+import unittest
+import numpy
+from rm import calcPairedDifferences
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        common = numpy.random.normal(0.08, 0.02, size=200)
+        self.base = dict((i, [value]) for i, value in enumerate(common, 1))
+        self.values = dict((i, [value - 0.003 + numpy.random.normal(0, 0.001)]) for i, value in enumerate(common, 1))
+
+    def test_paired_difference(self):
+        result = calcPairedDifferences(['irr'], self.base, self.values)['irr']
+        self.assertEqual(result['pairs'], 200)
+        self.assertLess(abs(result['mean'] + 0.003), 3 * result['se'])
+        self.assertLess(result['ci'], 0.0005)
+        self.assertGreater(result['correlation'], 0.99)
+
+    def test_missing_iterations(self):
+        del self.values[1]
+        self.base[2] = [None]
+        result = calcPairedDifferences(['irr'], self.base, self.values)['irr']
+        self.assertEqual(result['pairs'], 198)
+
+    def test_two_pairs(self):
+        result = calcPairedDifferences(['irr'], {1: [0.05], 2: [0.07]}, {1: [0.04], 2: [0.07]})['irr']
+        self.assertEqual(result['pairs'], 2)
+        self.assertAlmostEqual(result['mean'], -0.005)
+        self.assertTrue(numpy.isnan(result['correlation']))
+
+    def test_exactly_correlated(self):
+        base = {1: [0.25], 2: [0.5], 3: [0.75], 4: [1.0]}
+        values = dict((i, [2 * value[0] + 1]) for i, value in base.items())  # exact in floating point
+        result = calcPairedDifferences(['irr'], base, values)['irr']
+        self.assertAlmostEqual(result['mean'], 1.625)
+        self.assertAlmostEqual(result['correlation'], 1)
@@ -0,0 +1,29 @@
+import unittest
+from constants import PERSISTENCE_SAMPLE_STEP
+from simulations import getPersistedLine, getEnginePersistence
+
+
+class TestCase(unittest.TestCase):
+
+    def getLine(self, iteration_no):
+        return {'iteration': iteration_no, 'irr_project_y': 0.05, 'sm_configs': {'MWhFIT': 70}, 'revenue': [1, 2],
+                'revenue_y': [3], 'insolations_daily': [4, 5, 6]}
+
+    def test_profiles(self):
+        self.assertEqual(sorted(getPersistedLine(self.getLine(2), 'full')), sorted(self.getLine(2)))
+        self.assertEqual(sorted(getPersistedLine(self.getLine(2), 'monthly')), ['irr_project_y', 'iteration', 'revenue', 'revenue_y', 'sm_configs'])
+        self.assertEqual(sorted(getPersistedLine(self.getLine(2), 'yearly')), ['irr_project_y', 'iteration', 'revenue_y', 'sm_configs'])
+        self.assertEqual(sorted(getPersistedLine(self.getLine(2), 'scalars')), ['irr_project_y', 'iteration', 'sm_configs'])
+
+    def test_full_sampled(self):
+        self.assertIn('insolations_daily', getPersistedLine(self.getLine(1), 'full_sampled'))
+        self.assertIn('insolations_daily', getPersistedLine(self.getLine(1 + PERSISTENCE_SAMPLE_STEP), 'full_sampled'))
+        self.assertEqual(sorted(getPersistedLine(self.getLine(2), 'full_sampled')), ['irr_project_y', 'iteration', 'sm_configs'])
+
+    def test_vectorized(self):
+        self.assertEqual(getEnginePersistence('full', False), 'full')
+        self.assertEqual(getEnginePersistence('full', True), 'yearly')  # no monthly and daily series
+        self.assertEqual(getEnginePersistence('monthly', True), 'yearly')
+        self.assertEqual(getEnginePersistence('scalars', True), 'scalars')
+        self.assertRaises(ValueError, getEnginePersistence, 'full_sampled', True)
+        self.assertRaises(ValueError, getEnginePersistence, 'daily', False)
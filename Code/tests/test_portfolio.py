@@ -0,0 +1,24 @@
+import unittest
+from config_yaml_reader import setConfigOverrides
+from simulations import PortfolioIteration, getPriceGroup
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        setConfigOverrides({})
+
+    def test_price_group(self):
+        price = 'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y'
+        self.assertEqual(getPriceGroup('SLOVENIA', {'sm_config.ini.SUBSIDY.MWhFIT': 70}), ('SLOVENIA', ()))
+        self.assertEqual(getPriceGroup('SLOVENIA', {price: 0.05, 'ecm_config.ini.TAXES.tax_rate': 30}), ('SLOVENIA', ((price, 0.05),)))
+
+    def test_shared_prices(self):
+        plants = [('SLOVENIA', {}), ('SLOVENIA', {'sm_config.ini.SUBSIDY.MWhFIT': 70}),
+                  ('SLOVENIA', {'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y': 0.05})]
+        iterations = PortfolioIteration(1, 1, plants, 5).iterations
+        prices = [i.ecm.electricity_prices for i in iterations]
+        self.assertEqual(prices[0], prices[1])
+        self.assertNotEqual(prices[0], prices[2])  # plant with own price configs has own price path
+        self.assertEqual(iterations[0].ecm.price_shock, iterations[1].ecm.price_shock)
+        self.assertEqual(prices[0].keys(), iterations[0].config.getAllDates())
@@ -0,0 +1,50 @@
+import unittest
+import time
+import profiling
+from profiling import timed, stage, enableTimers, popStages, mergeStages, isProfiledTask, STAGE_VALUES
+
+
+@timed('outer')
+def outer():
+    time.sleep(0.02)
+    inner()
+    inner()
+
+@timed('inner')
+def inner():
+    time.sleep(0.01)
+    with stage('inner'):  # nested in itself - not measured again
+        pass
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        enableTimers(None)
+
+    def test_disabled(self):
+        enableTimers(None)
+        outer()
+        self.assertEqual(popStages(), None)
+        self.assertEqual(profiling.stages, {})
+
+    def test_stages(self):
+        enableTimers(0.0)
+        outer()
+        stages = dict((name, dict(zip(STAGE_VALUES, values))) for name, values in popStages().items())
+        self.assertEqual((stages['outer']['calls'], stages['inner']['calls']), (1, 2))
+        self.assertGreaterEqual(stages['inner']['seconds'], 0.02)
+        self.assertAlmostEqual(stages['outer']['self_seconds'], stages['outer']['seconds'] - stages['inner']['seconds'])
+        self.assertAlmostEqual(stages['outer']['self_seconds'], 0.02, delta=0.01)
+        self.assertEqual(popStages(), {})
+
+    def test_merge(self):
+        total = mergeStages({}, {'a': [1, 2.0, 1.0, 0, 0, 5, 5]})
+        mergeStages(total, {'a': [1, 1.0, 1.0, 0, 0, 1, 1], 'b': [1] * 7})
+        self.assertEqual(total, {'a': [2, 3.0, 2.0, 0, 0, 6, 6], 'b': [1] * 7})
+
+    def test_profiled_tasks(self):
+        profiled = [iteration_no for iteration_no in range(1, 101) if isProfiledTask(iteration_no, 1, 0.1)]
+        self.assertEqual(profiled, [1, 11, 21, 31, 41, 51, 61, 71, 81, 91])
+        self.assertEqual([isProfiledTask(first, 50, 0.01) for first in [1, 51, 101, 151]], [True, False, True, False])  # iterations 1, 101
+        self.assertFalse(isProfiledTask(1, 50, 0.0))
@@ -0,0 +1,49 @@
+import random
+import unittest
+import numpy
+from annex import setRandomStreams, randomStream
+
+
+def drawStreams(weather_draws):
+    """return  draws of prices after @weather_draws draws of weather in iteration with seed 7"""
+    setRandomStreams(7)
+    with randomStream('weather'):
+        numpy.random.normal(size=weather_draws)
+    with randomStream('prices'):
+        return list(numpy.random.normal(size=3)) + [random.random()]
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        setRandomStreams(None)
+
+    def test_independent_streams(self):
+        self.assertEqual(drawStreams(10), drawStreams(20))  # more draws of weather do not shift prices
+
+    def test_continued_stream(self):
+        setRandomStreams(7)
+        with randomStream('prices'):
+            first = numpy.random.normal()
+        numpy.random.seed(1)
+        with randomStream('prices'):
+            second = numpy.random.normal()
+        self.assertEqual(drawStreams(0)[:2], [first, second])
+
+    def test_outer_state(self):
+        numpy.random.seed(1)
+        expected = numpy.random.normal()
+        numpy.random.seed(1)
+        setRandomStreams(7)
+        with randomStream('weather'):
+            numpy.random.normal(size=5)
+        self.assertEqual(numpy.random.normal(), expected)
+
+    def test_no_streams(self):
+        setRandomStreams(None)
+        numpy.random.seed(1)
+        expected = numpy.random.normal(size=2).tolist()
+        numpy.random.seed(1)
+        with randomStream('weather'):
+            first = numpy.random.normal()
+        self.assertEqual([first, numpy.random.normal()], expected)
@@ -0,0 +1,52 @@
+import unittest
+import numpy
+from scipy.stats import norm, triang, weibull_min
+from annex import setAntithetic
+from config_yaml_reader import parse_list_and_get_random, setSampling
+
+
+class TestCase(unittest.TestCase):
+
+    def draw(self, values, iterations_number=100, draws=1):
+        """return  array (iterations x draws) of values sampled by latin hypercube"""
+        result = []
+        for iteration_no in range(1, iterations_number + 1):
+            setSampling('lhs', 7, iterations_number, iteration_no)
+            result.append([parse_list_and_get_random(values, float, name='test.value') for _ in range(draws)])
+        setSampling('random')
+        return numpy.array(result)
+
+    def assertStratified(self, quantiles):
+        self.assertEqual(sorted((quantiles * len(quantiles)).astype(int)), range(len(quantiles)))
+
+    def test_distributions(self):
+        self.assertStratified(self.draw('1, linear, 0.8, 1.2')[:, 0] / 0.4 - 2)
+        self.assertStratified(norm.cdf(self.draw('1, normal, 1, 0.09')[:, 0], 1, 0.09))
+        self.assertStratified(weibull_min.cdf(self.draw('1, weibull, 10')[:, 0], 10))
+        self.assertStratified(triang.cdf(self.draw('1, triangular, 0.8, 1.5, 1.1')[:, 0], 0.3 / 0.7, 0.8, 0.7))
+
+    def test_draws_are_independent(self):
+        values = self.draw('1, linear, 0, 1', draws=3)
+        for column in values.T:
+            self.assertStratified(column)
+        self.assertLess(abs(numpy.corrcoef(values.T)[0, 1]), 0.3)
+
+    def test_random_mode(self):
+        setSampling('random')
+        numpy.random.seed(1)
+        first = parse_list_and_get_random('1, linear, 0, 1', float, name='test.value')
+        numpy.random.seed(1)
+        self.assertEqual(first, numpy.random.uniform(0, 1))
+
+    def test_antithetic(self):
+        setSampling('random')
+        for values, cdf in [('1, normal, 1, 0.09', lambda x: norm.cdf(x, 1, 0.09)),
+                            ('1, weibull, 10', lambda x: weibull_min.cdf(x, 10)),
+                            ('1, triangular, 0.8, 1.5, 1.1', lambda x: triang.cdf(x, 0.3 / 0.7, 0.8, 0.7))]:
+            numpy.random.seed(3)
+            value = parse_list_and_get_random(values, float)
+            numpy.random.seed(3)
+            setAntithetic(True)
+            mirrored = parse_list_and_get_random(values, float)
+            setAntithetic(False)
+            self.assertAlmostEqual(cdf(value) + cdf(mirrored), 1, places=10)
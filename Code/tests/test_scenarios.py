@@ -0,0 +1,24 @@
+import unittest
+from config_yaml_reader import get_override_name
+from simulations import getScenarios
+
+
+class TestCase(unittest.TestCase):
+
+    def test_override_name(self):
+        self.assertEqual(get_override_name('DEBT.interest_rate', 'SLOVENIA'), 'ecm_config.ini.DEBT.interest_rate')
+        self.assertEqual(get_override_name('sm_config.ini.SUBSIDY.MWhFIT', 'SLOVENIA'), 'sm_config.ini.SUBSIDY.MWhFIT')
+        self.assertRaises(ValueError, get_override_name, 'DEBT.unknown', 'SLOVENIA')
+
+    def test_grid(self):
+        spec = {'grid': {'DEBT.interest_rate': [4, 6], 'SUBSIDY.MWhFIT': [60, 70, 80]}}
+        scenarios = getScenarios(spec, 'SLOVENIA')
+        self.assertEqual(len(scenarios), 6)
+        self.assertEqual(dict(scenarios[-1]), {'ecm_config.ini.DEBT.interest_rate': 6, 'sm_config.ini.SUBSIDY.MWhFIT': 80})
+
+    def test_scenarios_and_grid(self):
+        spec = {'scenarios': [{'TAXES.tax_rate': 20}, {'TAXES.tax_rate': 30}], 'grid': {'DEBT.interest_rate': [4, 6]}}
+        scenarios = getScenarios(spec, 'SLOVENIA')
+        self.assertEqual([(s['ecm_config.ini.TAXES.tax_rate'], s['ecm_config.ini.DEBT.interest_rate']) for s in scenarios],
+                         [(20, 4), (20, 6), (30, 4), (30, 6)])
+        self.assertEqual(getScenarios({}, 'SLOVENIA'), [{}])
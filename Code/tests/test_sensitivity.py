@@ -0,0 +1,35 @@
+import unittest
+import numpy
+from config_yaml_reader import get_saltelli_position, get_saltelli_seed_iteration
+from rm import calcSobolIndices
+
+
+class TestCase(unittest.TestCase):
+
+    def test_positions(self):
+        inputs_number, block_size = 2, 3  # groups of 12 iterations: A, B, AB_1, AB_2 of 3 base rows
+        positions = [get_saltelli_position(i, inputs_number, block_size) for i in range(1, 25)]
+        self.assertEqual(positions[:7], [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1), (0, 2)])
+        self.assertEqual(positions[12], (3, 0))
+        self.assertEqual([get_saltelli_seed_iteration(i, inputs_number, block_size) for i in [2, 5, 8, 11, 14, 17]],
+                         [2, 5, 2, 2, 14, 17])
+
+    def test_indices(self):
+        n, inputs_number = 4000, 3
+        random_state = numpy.random.RandomState(1)
+        a, b = random_state.uniform(-1, 1, (n, inputs_number)), random_state.uniform(-1, 1, (n, inputs_number))
+        model = lambda x: x[:, 0] + 2 * x[:, 1] + 3 * x[:, 0] * x[:, 2]  # V = 1/3 + 4/3 + 1 = 8/3
+        matrices = [a, b] + [numpy.where(numpy.arange(inputs_number) == i, b, a) for i in range(inputs_number)]
+        values, positions = [], []
+        for matrix_no, matrix in enumerate(matrices):
+            values += list(model(matrix))
+            positions += [(row, matrix_no) for row in range(n)]
+        values[0] = None  # base row 0 is not used
+        result = calcSobolIndices(['y'], [values], positions, inputs_number, bootstrap=100)['y']
+        self.assertEqual(result['base_rows'], n - 1)
+        for estimate, expected in zip(result['first_order'], [0.125, 0.5, 0.0]):
+            self.assertAlmostEqual(estimate, expected, delta=0.05)
+        for estimate, expected in zip(result['total_order'], [0.5, 0.5, 0.375]):
+            self.assertAlmostEqual(estimate, expected, delta=0.05)
+        for (low, high), estimate in zip(result['total_order_ci'], result['total_order']):
+            self.assertTrue(low <= estimate <= high)
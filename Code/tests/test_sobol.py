@@ -0,0 +1,36 @@
+import unittest
+import numpy
+from sobol import SobolSequence, getPrimitivePolynomials
+from config_yaml_reader import setSampling, parse_list_and_get_random
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sequence = SobolSequence(12)
+
+    def test_primitive_polynomials(self):
+        self.assertEqual(getPrimitivePolynomials(6), [(1, 3), (2, 7), (3, 11), (3, 13), (4, 19), (4, 25)])
+
+    def test_stratified(self):
+        for dimension in range(12):
+            for random_state in [None, numpy.random.RandomState(dimension)]:
+                points = self.sequence.getPoints(dimension, 64, random_state)
+                self.assertEqual(sorted((points * 64).astype(int)), range(64))
+
+    def test_two_dimensional_net(self):
+        x = self.sequence.getPoints(0, 64, numpy.random.RandomState(1))
+        y = self.sequence.getPoints(1, 64, numpy.random.RandomState(2))
+        self.assertEqual(len(set(zip((x * 8).astype(int), (y * 8).astype(int)))), 64)
+
+    def test_sampling(self):
+        values = []
+        for iteration_no in range(1, 33):
+            setSampling('sobol', 5, 32, iteration_no)
+            values.append([parse_list_and_get_random('1, linear, 0, 1', float, name='sm_config.ini.SUBSIDY.MWhFIT'),
+                           parse_list_and_get_random('1, linear, 0, 1', float, name='test.value')])
+        setSampling('random')
+        fit, other = numpy.array(values).T
+        for replicate in range(8):  # each replicate of 4 iterations is stratified
+            self.assertEqual(sorted((fit[replicate * 4:(replicate + 1) * 4] * 4).astype(int)), range(4))
+        self.assertNotEqual(sorted((other * 32).astype(int)), range(32))  # not QMC value is drawn randomly
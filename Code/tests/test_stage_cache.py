@@ -0,0 +1,37 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy
+from stage_cache import StageCache, getKey
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = StageCache(self.directory, max_size=1)  # MB
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        self.assertEqual(getKey({'a': 1, 'b': [numpy.arange(3)]}), getKey({'b': [numpy.arange(3)], 'a': 1}))
+        self.assertNotEqual(getKey(numpy.arange(3)), getKey(numpy.arange(3.0)))
+        self.assertNotEqual(getKey(1), getKey(1.0))
+
+    def test_load(self):
+        self.assertIsNone(self.cache.load('a'))
+        self.cache.save('a', {'values': numpy.ones(10)})
+        self.assertEqual(list(self.cache.load('a')['values']), [1.0] * 10)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_eviction(self):
+        value = numpy.zeros(40000)  # 320 kB
+        for key in ['a', 'b', 'c']:
+            self.cache.save(key, value)
+            time.sleep(0.01)
+        self.cache.load('a')  # 'b' is least recently used
+        self.cache.save('d', value)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.pkl', 'c.pkl', 'd.pkl'])
@@ -0,0 +1,46 @@
+import unittest
+import numpy
+from scipy.stats import skew, kurtosis
+from stats_accumulator import StatsAccumulator, accumulateResults, mergeAccumulators
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(1)
+        self.values = list(numpy.random.lognormal(0, 0.5, size=20000))
+
+    def test_moments(self):
+        accumulator = StatsAccumulator()
+        accumulator.addValues(self.values + [None, float('nan')])
+        self.assertEqual(accumulator.getCount(), len(self.values))
+        self.assertAlmostEqual(accumulator.getMean(), numpy.mean(self.values))
+        self.assertAlmostEqual(accumulator.getVariance(), numpy.var(self.values))
+        self.assertAlmostEqual(accumulator.getSkew(), skew(self.values))
+        self.assertAlmostEqual(accumulator.getKurtosis(), kurtosis(self.values))
+
+    def test_merge(self):
+        parts = [self.values[:7], self.values[7:5000], self.values[5000:]]
+        merged = []
+        for part in parts:
+            merged = mergeAccumulators(merged, accumulateResults([[v, -v] for v in part]))
+        self.assertAlmostEqual(merged[0].getMean(), numpy.mean(self.values))
+        self.assertAlmostEqual(merged[1].getSkew(), -skew(self.values))
+        self.assertAlmostEqual(merged[0].getKurtosis(), kurtosis(self.values))
+        self.assertEqual(merged[0].min, min(self.values))
+
+    def test_quantiles(self):
+        accumulator = StatsAccumulator()
+        accumulator.addValues(self.values)
+        for q in [0.01, 0.05, 0.5, 0.95, 0.99]:
+            rank = numpy.searchsorted(numpy.sort(self.values), accumulator.getQuantile(q)) / float(len(self.values))
+            self.assertAlmostEqual(rank, q, delta=0.002)
+        tail = numpy.sort(self.values)[:1000]
+        self.assertAlmostEqual(accumulator.getTailMean(0.05), tail.mean(), delta=0.002)
+
+    def test_state(self):
+        accumulator = StatsAccumulator()
+        accumulator.addValues(self.values)
+        restored = StatsAccumulator().setState(accumulator.getState())
+        self.assertEqual(restored.getQuantile(0.3), accumulator.getQuantile(0.3))
+        self.assertEqual(restored.getStatistics(), accumulator.getStatistics())
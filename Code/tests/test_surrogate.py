@@ -0,0 +1,54 @@
+import unittest
+import numpy
+from config_yaml_reader import setConfigOverrides, get_country_values, get_random_config_value
+from constants import SURROGATE_INPUTS
+from surrogate import SurrogateModel, getConfigName, parseSettings
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        random_state = numpy.random.RandomState(1)
+        n = 2000
+        self.inputs = numpy.tile([float(i + 1) for i in range(len(SURROGATE_INPUTS))], (n, 1))  # constant inputs
+        self.fit_index = [name for name, field, scale in SURROGATE_INPUTS].index('sm_config.ini.SUBSIDY.MWhFIT')
+        self.y_index = [name for name, field, scale in SURROGATE_INPUTS].index('ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y')
+        self.inputs[:, self.fit_index] = random_state.normal(60, 10, size=n)
+        self.inputs[:, self.y_index] = random_state.normal(0.03, 0.02, size=n)
+        irr = 0.001 * self.inputs[:, self.fit_index] + 0.5 * self.inputs[:, self.y_index] ** 2 + random_state.normal(0, 0.005, size=n)
+        self.model = SurrogateModel(1, 'SLOVENIA').fit(self.inputs, {'irr_project_y': list(irr)})
+
+    def tearDown(self):
+        setConfigOverrides({})
+
+    def test_fit(self):
+        self.assertEqual(self.model.names, ['sm_config.ini.SUBSIDY.MWhFIT', 'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y'])
+        self.assertGreater(self.model.validation['irr_project_y'], 0.75)  # noise is 20% of variance
+
+    def test_predict(self):
+        settings = {'sm_config.ini.SUBSIDY.MWhFIT': 70.0}
+        result = self.model.predict(settings)['irr_project_y']
+        expected = 0.07 + 0.5 * (0.03 ** 2 + 0.02 ** 2)
+        self.assertAlmostEqual(result['mean'], expected, delta=0.001)
+        self.assertAlmostEqual(result['std'], numpy.sqrt(0.005 ** 2 + 0.5 ** 2 * 2 * 0.02 ** 4 + 0.5 ** 2 * 4 * 0.03 ** 2 * 0.02 ** 2), delta=0.001)
+        self.assertEqual(self.model.getOutOfDomain(settings), [])
+
+    def test_out_of_domain(self):
+        settings = {'sm_config.ini.SUBSIDY.MWhFIT': 500.0, 'ecm_config.ini.TAXES.tax_rate': 30.0}
+        self.assertEqual(sorted(self.model.getOutOfDomain(settings)), sorted(settings))
+
+    def test_state(self):
+        model = SurrogateModel().setState(self.model.getState())
+        settings = {'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y': 0.0}
+        self.assertEqual(model.predict(settings), self.model.predict(settings))
+
+    def test_settings(self):
+        self.assertEqual(getConfigName('SUBSIDY.MWhFIT'), 'sm_config.ini.SUBSIDY.MWhFIT')
+        self.assertRaises(ValueError, getConfigName, 'price')  # module, inverter and grid price
+        self.assertEqual(parseSettings(['DEBT.interest_rate=4']), {'ecm_config.ini.DEBT.interest_rate': 4.0})
+
+    def test_config_overrides(self):
+        setConfigOverrides({'sm_config.ini.SUBSIDY.MWhFIT': 70})
+        self.assertEqual(get_random_config_value(get_country_values('sm_config.ini', 'SLOVENIA', True)['SUBSIDY']['MWhFIT']), 70)
+        setConfigOverrides({'sm_config.ini.SUBSIDY.unknown': 70})
+        self.assertRaises(ValueError, get_country_values, 'sm_config.ini', 'SLOVENIA', True)
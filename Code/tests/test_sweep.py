@@ -0,0 +1,39 @@
+import unittest
+import numpy
+from config_yaml_reader import setConfigOverrides, get_country_values, get_random_config_values, get_random_config_value_mean
+from rm import calcSweepSwings
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        setConfigOverrides({})
+
+    def drawValues(self):
+        numpy.random.seed(1)
+        config = get_country_values('ecm_config.ini', 'SLOVENIA', True)
+        y = get_random_config_values(config, 'ELECTRICITY_MARKET_PRICE_SIMULATION.y', 2, float)
+        return y, numpy.random.uniform()
+
+    def test_pinned_override(self):
+        y, next_value = self.drawValues()
+        setConfigOverrides({'ecm_config.ini.ELECTRICITY_MARKET_PRICE_SIMULATION.y': 0.05})
+        pinned_y, pinned_next_value = self.drawValues()
+        self.assertEqual(pinned_y, [0.05, 0.05])
+        self.assertEqual(pinned_next_value, next_value)  # random numbers of next values are not shifted
+        config = get_country_values('ecm_config.ini', 'SLOVENIA', True)
+        self.assertEqual(get_random_config_value_mean(config['ELECTRICITY_MARKET_PRICE_SIMULATION']['y']), 0.05)
+
+    def test_swings(self):
+        numpy.random.seed(1)
+        base = numpy.random.normal(0.08, 0.02, size=1000)
+        base_values = dict((i + 1, [value]) for i, value in enumerate(base))
+        low_values = dict((i + 1, [value - 0.01 + numpy.random.normal(0, 0.001)]) for i, value in enumerate(base[:100]))
+        high_values = dict((i + 1, [value + 0.02 + numpy.random.normal(0, 0.001)]) for i, value in enumerate(base[:100]))
+        result = calcSweepSwings(['irr'], base_values, [(low_values, high_values)])['irr']
+        swing = result['swings'][0]
+        self.assertAlmostEqual(result['base'], base.mean())
+        self.assertLess(abs(swing['low'] - (base.mean() - 0.01)), 3 * swing['low_ci'])
+        self.assertLess(abs(swing['swing'] - 0.03), swing['swing_ci'])
+        self.assertLess(swing['swing_ci'], 0.001)  # paired iterations - noise of base values cancels
+        self.assertEqual(swing['pairs'], 100)
@@ -0,0 +1,42 @@
+import unittest
+import simulations
+from constants import RESULTS_BUFFER_MIN_ROWS
+from simulations import getWorkerPool, getResultsMatrix, recycleWorkerPool, closeWorkerPool
+
+
+def writeRow(row):
+    """Writes values of iteration in worker (as runIteration)"""
+    simulations.results_buffer[row] = row + 1
+
+def readRow(row):
+    return list(simulations.results_buffer[row])
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workers_number = simulations.WORKERS_NUMBER
+        simulations.WORKERS_NUMBER = 1
+        closeWorkerPool()
+        simulations.worker_pool_results = simulations.worker_pool_results_array = None  # new buffer
+
+    def tearDown(self):
+        closeWorkerPool()
+        simulations.WORKERS_NUMBER = self.workers_number
+
+    def test_recycle(self):
+        pool, progress = getWorkerPool(10)
+        pool.map(writeRow, [0, 1])  # first wave
+        recycleWorkerPool()  # worker used too much memory
+        new_pool, new_progress = getWorkerPool(10)
+        self.assertIsNot(new_pool, pool)
+        self.assertEqual(new_pool.map(readRow, [0, 1]), [getResultsMatrix(0, 1)[0].tolist(), getResultsMatrix(1, 2)[0].tolist()])
+        self.assertEqual(getResultsMatrix(0, 2)[:, 0].tolist(), [1.0, 2.0])  # previous waves are kept
+
+    def test_enlarge(self):
+        pool, progress = getWorkerPool(10)
+        pool.map(writeRow, [0, 1])
+        new_pool, new_progress = getWorkerPool(RESULTS_BUFFER_MIN_ROWS + 10)
+        self.assertEqual(len(getResultsMatrix(0, RESULTS_BUFFER_MIN_ROWS + 10)), RESULTS_BUFFER_MIN_ROWS + 10)
+        self.assertEqual(getResultsMatrix(0, 3)[:, 0].tolist(), [1.0, 2.0, 0.0])
+        self.assertEqual(new_pool.map(readRow, [1])[0][0], 2.0)
@@ -6,8 +6,9 @@ from em import EnergyModule
 from datetime import timedelta
 from config_readers import MainConfig, TechnologyModuleConfigReader
 from base_class import BaseClassConfig
-from annex import daysBetween, getResolutionStartEnd, cached_property, get_list_dates
+from annex import daysBetween, getResolutionStartEnd, cached_property, get_list_dates, randomStreamed
 from tm_equipment import PlantEquipment
+from profiling import timed
 from collections import OrderedDict
 
 
@@ -31,6 +32,8 @@ class TechnologyModule(BaseClassConfig, TechnologyModuleConfigReader):
         self.total_nominal_power = self.groups_number * self.modules_in_group * self.module_nominal_power
 
 
+    @timed('plants')
+    @randomStreamed('plants')
     def assembleSystem(self):
         """generates objects for each solarmodule in plant"""
         self.buildPlant()  #create plant
@@ -128,6 +131,7 @@ class TechnologyModule(BaseClassConfig, TechnologyModuleConfigReader):
 
         return electricity_production
 
+    @timed('production')
     def generateElectricityProductionLifeTime(self):
         """Returns dict with electricity_production for every date of project lifetime."""
         return OrderedDict(
@@ -3,7 +3,10 @@
 
 import random
 import numpy
-from annex import lastDayMonth, memoized, daysBetween, OrderedDefaultdict
+import math
+import annex
+from annex import lastDayMonth, memoized, daysBetween, OrderedDefaultdict, expovariateShock, addLogLikelihoodRatio, randomStreamed
+from constants import IMPORTANCE_SAMPLING_FAILURE_RATES
 from collections import defaultdict
 from datetime import date, timedelta
 
@@ -60,19 +63,31 @@ class Equipment:
         return not any(f <= day < r for f, r in self.failure_intervals)
 
     def getFailureDate(self, day_of_repair):
-        """Returns next failure date from @day_of_repair."""
+        """Returns next failure date from @day_of_repair.
+        With importance sampling failures of IMPORTANCE_SAMPLING_FAILURE_RATES equipment types are more frequent."""
+        rate = tilted_rate = 1.0 / self.mtbde
+        if annex.importance_sampling:
+            tilted_rate = rate * IMPORTANCE_SAMPLING_FAILURE_RATES.get(self.eqtype, 1.0)
         try:
-            return day_of_repair + timedelta(days=int(random.expovariate(1.0 / self.mtbde)) + 1)
+            days = expovariateShock(tilted_rate)
+            if tilted_rate != rate:
+                horizon = max((self.end_date - day_of_repair).days - 1, 0)  # failures after it are not used
+                if days < horizon:  # ratio of densities
+                    addLogLikelihoodRatio('failures', math.log(rate / tilted_rate) + (tilted_rate - rate) * days)
+                else:  # ratio of probabilities of failure after horizon
+                    addLogLikelihoodRatio('failures', (tilted_rate - rate) * horizon)
+            return day_of_repair + timedelta(days=int(days) + 1)
         except OverflowError:  # if the failure is very far away make it
             return self.end_date + timedelta(days=1)  # fail after end of project
 
     def getRepairDate(self, day_of_failure):
         """Returns repair date from @day_of_failure."""
         try:
-            return day_of_failure + timedelta(days=int(random.expovariate(1.0 / self.mttr)) + 1)
+            return day_of_failure + timedelta(days=int(expovariateShock(1.0 / self.mttr)) + 1)
         except OverflowError:
             return self.end_date + timedelta(days=1)
 
+    @randomStreamed('failures')
     def generateFailureIntervals(self):
         """Generates list of [failure, repair) intervals till the end of project."""
         failure_date = self.getFailureDate(self.start_date)
@@ -0,0 +1,755 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+"""Vectorized engine - calculates a block of iterations at once.
+Instead of building MainConfig, EnergyModule, TechnologyModule, EconomicModule and Report objects
+for every iteration and walking all project days through dicts, all iterations of the block are
+held in numpy arrays (iterations x days) and (iterations x months) - from weather and price generation
+through electricity production, revenue, costs, balance sheet, FCF and IRR.
+The model is the same as in modules em, tm, ecm and report, only the calculation is organized by arrays
+and random numbers are drawn in different order (not random iterations of both engines are compared in tests/test_engine_parity.py).
+Coarse model of multilevel simulation calculates electricity production and revenues by months instead of days."""
+
+import random
+import time
+import datetime
+import numpy
+from math import log
+from scipy.signal import lfilter
+from dateutil.relativedelta import relativedelta
+
+import annex
+from annex import getDaysNoInMonth, isLastDayYear, getListDates, OrderedDefaultdict, monthsBetween, convertValue, \
+    normalShock, setAntithetic, setImportanceSampling, setLikelihoodRatios, getLikelihoodRatio, setRandomStreams, randomStream
+from base_class import BaseClassConfig
+from config_readers import MainConfig, SubsidyModuleConfigReader, TechnologyModuleConfigReader, \
+    EconomicModuleConfigReader, EnergyModuleConfigReader, EnviromentModuleConfigReader
+from config_yaml_reader import get_country_values, get_random_config_values, setSampling
+from constants import IRR_REPORT_FIELDS, TEP_REPORT_FIELDS, RESULTS_FIELDS, CONTROL_VARIATE_FIELDS
+from ecm import EconomicModule
+from financial_analysis import irrVectorized, npvVectorized
+from stage_cache import StageCache, getKey, getSourceFingerprint
+from profiling import timed, stage
+from tm_equipment import Equipment, EQ
+
+MIN_OST = 500  #minimal rest on bank account, the same as in Report.calcHelperValuesMonthly
+PRICE_CONFIGS = ['S0', 'theta_log', 'sigma_log', 'lambda_log', 'y_annual_mean', 'y_annual_std']  # ecm configs used by price path
+
+
+class FinancingSchedule(EconomicModule):
+    """Investments, paid-in capital and debt schedules of EconomicModule,
+    without daily production and prices machinery (and connection to DB)"""
+
+    def __init__(self, config_module, ecm_configs, investments):
+        BaseClassConfig.__init__(self, config_module)  #loading Main config
+        self.__dict__.update(ecm_configs)  #loading already generated Economic configs
+        self.investments_monthly = OrderedDefaultdict(int)
+        self.investments = investments
+        self.debt = self.debt_share * self.investments
+        self.capital = self.investments - self.debt
+        self.Depreciation_monthly = self.investments / self.Depreciation_duration
+        self.calcInvestmentAndFinancing()
+
+
+class VectorizedIterations():
+    """Class for running a block of iterations as arrays."""
+
+    def __init__(self, first_iteration_no, iterations_number, simulation_no, country, seed, sampling=None, antithetic=False,
+                 importance_sampling=False, level=None, stage_cache=False):
+        """@first_iteration_no - number of first iteration in block
+        @iterations_number - number of iterations in block (K)
+        @sampling - (mode, master seed, iterations number of simulation) for sampling of config values
+        (see config_yaml_reader.setSampling), None - independent random draws
+        @antithetic - random shocks are mirrored (block is pair of block with the same seed)
+        @importance_sampling - random values are tilted, likelihood ratios are collected for each iteration
+        @level - level of multilevel simulation: None - daily model, 0 - monthly coarse model,
+        1 - daily model and coupled coarse model (the same draws), coarse results are kept in self.coarse_results
+        @stage_cache - if True weather, price paths, plants and production are loaded from StageCache when
+        their configs and seed are unchanged (see runStage)"""
+        random.seed(seed)
+        self.seed = seed
+        numpy.random.seed(seed)
+        setRandomStreams(seed)  # iterations of block continue the same streams, each stage in own stream
+        setAntithetic(antithetic)
+        setImportanceSampling(importance_sampling)
+        self.sampling = sampling
+        self.importance_sampling = importance_sampling
+        self.log_likelihood_ratios = [{} for k in range(iterations_number)]  # of tilted draws of each iteration
+        self.level = level
+        self.coarse = False  # production and revenues are calculated monthly (see calcMonthlyElectricityProduction)
+        self.coarse_results = None
+        self.seconds_per_iteration = None  # seconds of calculation per iteration
+        self.coarse_seconds_per_iteration = None  # seconds of calculation of coarse model (not shared stages) per iteration
+        self.stage_cache = StageCache() if stage_cache else None
+        self.stage_keys = {}  # keys of stages in stage cache, part of keys of dependent stages
+
+        self.first_iteration_no = first_iteration_no
+        self.iterations_number = iterations_number
+        self.simulation_no = simulation_no
+        self.country = country
+
+        self.raw_tm_config = get_country_values('tm_config.ini', country, silent=True)  #not parsed configs for per equipment draws
+        self.raw_ecm_config = get_country_values('ecm_config.ini', country, silent=True)
+
+    def run(self):
+        """Runs all iterations of block."""
+        start_time = time.time()
+        self.prepareConfigs()
+        self.prepareCalendar()
+        self.runStage('weather', self.generateWeather, ['avg_production_day_per_kW', 'weather_shock'])
+        self.runStage('prices', self.generateElectricityPrices, ['electricity_market_prices', 'price_shock', 'price_drift'])
+        self.runStage('plants', self.assemblePlants, ['plants', 'investments'])
+        self.calcActualElectricityPrices()
+        if self.level is not None:
+            coarse_start_time = time.time()
+            random_state = numpy.random.get_state()  # fine model gets the same draws of repair costs
+            self.coarse = True
+            self.calcMonthlyElectricityProduction()
+            self.calcResults()
+            self.coarse_results = self.getResults()
+            self.coarse = False
+            numpy.random.set_state(random_state)
+            self.coarse_seconds_per_iteration = (time.time() - coarse_start_time) / self.iterations_number
+        if self.level != 0:
+            self.runStage('production', self.calcElectricityProduction, ['electricity_production'])
+            self.calcResults()
+        self.seconds_per_iteration = (time.time() - start_time) / self.iterations_number
+
+    def runStage(self, name, calculate, attributes):
+        """Runs stage @name - method @calculate which sets @attributes, or loads them from stage cache.
+        Key of stage is hash of seed and parameters of block, configs of stage (see getStageDependencies) and state of
+        random generators, loaded stage restores also random generators and likelihood ratios after stage,
+        so the next stages get the same draws as after calculation. Stage draws from own random stream (see annex.randomStream)"""
+        with stage(name), randomStream(name):  # loading from cache is measured too
+            if self.stage_cache is None:
+                calculate()
+                return
+            key = getKey(name, getSourceFingerprint(), self.seed, self.first_iteration_no, self.iterations_number, self.country,
+                         self.sampling, annex.antithetic, self.importance_sampling, self.getStageDependencies(name),
+                         numpy.random.get_state(), random.getstate(), self.log_likelihood_ratios)
+            values = self.stage_cache.load(key)
+            if values is None:
+                calculate()
+                values = dict((attr, getattr(self, attr)) for attr in attributes)
+                values['random_states'] = (numpy.random.get_state(), random.getstate())
+                values['log_likelihood_ratios'] = self.log_likelihood_ratios
+                self.stage_cache.save(key, values)
+            else:
+                for attr in attributes:
+                    setattr(self, attr, values[attr])
+                numpy.random.set_state(values['random_states'][0])
+                random.setstate(values['random_states'][1])
+                for log_likelihood_ratios, cached in zip(self.log_likelihood_ratios, values['log_likelihood_ratios']):
+                    log_likelihood_ratios.clear()  # dicts are updated in place, one of them is set by setLikelihoodRatios
+                    log_likelihood_ratios.update(cached)
+            self.stage_keys[name] = key
+
+    def getStageDependencies(self, name):
+        """return  configs (and keys of previous stages) which stage @name depends on"""
+        period = (self.start_date, self.end_date)
+        if name == 'weather':
+            return [period, get_country_values('em_config.ini', self.country, silent=True),
+                    [em.getConfigsValues() for em in self.em_configs]]
+        if name == 'prices':
+            return [period, self.raw_ecm_config['ELECTRICITY_MARKET_PRICE_SIMULATION'], self.sampled_y,
+                    [[getattr(ecm, attr) for attr in PRICE_CONFIGS] for ecm in self.ecm_configs]]
+        if name == 'plants':
+            return [[(main.getFirstDayProduction(), main.getEndDate()) for main in self.main_configs], self.raw_tm_config,
+                    [tm.getConfigsValues() for tm in self.tm_configs]]
+        if name == 'production':
+            return [period, self.stage_keys['weather'], self.stage_keys['plants'],
+                    [main.getFirstDayProduction() for main in self.main_configs]]
+        raise ValueError("Unknown stage %s" % name)
+
+    @timed('report')
+    def calcResults(self):
+        """Calculates revenues, costs, report values and results of all iterations from electricity production"""
+        self.calcMonthlyRevenuesAndCosts()
+        self.calcReportValues()
+        self.calcIRR()
+        self.calcNPV()
+        self.calcTEP()
+        self.calcControlVariates()
+        self.calcWeights()
+
+    ######################### CONFIGS ######################################
+
+    @timed('config')
+    def prepareConfigs(self):
+        """Generates configs for each iteration - the same draws as config modules in Iteration"""
+        self.main_configs = []
+        self.sm_configs = []
+        self.tm_configs = []
+        self.ecm_configs = []
+        self.em_configs = []
+        self.enm_configs = []
+        self.sampled_y = []  # price drift y of each iteration, when config values are sampled
+        for k in range(self.iterations_number):
+            if self.sampling is not None:
+                setSampling(*self.sampling, iteration_no=self.first_iteration_no + k)
+            setLikelihoodRatios(self.log_likelihood_ratios[k])
+            main = MainConfig(self.country)
+            self.main_configs.append(main)
+            self.sm_configs.append(SubsidyModuleConfigReader(self.country, main.last_day_construction))
+            self.tm_configs.append(TechnologyModuleConfigReader(self.country))
+            self.ecm_configs.append(EconomicModuleConfigReader(self.country))
+            self.em_configs.append(EnergyModuleConfigReader(self.country))
+            self.enm_configs.append(EnviromentModuleConfigReader(self.country))
+            if self.sampling is not None or self.importance_sampling:  # drawn by ElectricityMarketPriceSimulation in Iteration
+                with randomStream('prices'):
+                    self.sampled_y.append(get_random_config_values(self.raw_ecm_config, 'ELECTRICITY_MARKET_PRICE_SIMULATION.y', 1, float, name='ecm_config.ini')[0])
+        setSampling('random')  # equipment of plants is drawn independently
+
+        self.start_date = self.main_configs[0].getStartDate()
+        self.end_date = self.main_configs[0].getEndDate()
+        for main in self.main_configs:
+            assert (main.getStartDate(), main.getEndDate()) == (self.start_date, self.end_date), \
+                "All iterations in block should have the same project period"
+
+    def prepareCalendar(self):
+        """Prepares arrays with days and months of project, common for all iterations"""
+        self.dates = getListDates(self.start_date, self.end_date)
+        self.days_number = len(self.dates)
+        self.days = numpy.arange(self.days_number)
+        self.day_year = numpy.array([d.year - self.start_date.year for d in self.dates])
+        self.day_month = numpy.array([d.month for d in self.dates])
+        self.days_in_month = numpy.array([getDaysNoInMonth(d) for d in self.dates], dtype=float)
+        self.weekday = numpy.array([d.weekday() < 5 for d in self.dates])
+        self.years_number = self.day_year[-1] + 1
+
+        report_dates = self.main_configs[0].getReportDates()
+        self.month_start_days = numpy.array([max(0, (d - self.start_date).days) for d in report_dates.keys()])
+        self.month_end_dates = report_dates.values()
+        self.months_number = len(self.month_end_dates)
+        self.day_month_no = numpy.searchsorted(self.month_start_days, self.days, side='right') - 1  #month number of each day
+        self.december = numpy.array([isLastDayYear(d) for d in self.month_end_dates])
+
+    def dayNo(self, date):
+        """return  number of @date since start of project"""
+        return (date - self.start_date).days
+
+    def monthlySum(self, daily_values):
+        """return  (iterations x months) sums of (iterations x days) array"""
+        return numpy.add.reduceat(daily_values, self.month_start_days, axis=1)
+
+    def iterationsColumn(self, configs, attr):
+        """return  column array with attribute @attr of config of each iteration"""
+        return numpy.array([getattr(c, attr) for c in configs], dtype=float)[:, None]
+
+    ######################### WEATHER AND PRICES ######################################
+
+    def generateWeather(self):
+        """Generates average daily production per kW (iterations x days), same as WeatherSimulation"""
+        avg_production = []
+        weather_shock = []  # relative deviation of corrections of production from expected, same as WeatherSimulation.calcWeatherShock
+        for k, em in enumerate(self.em_configs):
+            setLikelihoodRatios(self.log_likelihood_ratios[k])
+            if self.sampling is not None:  # sampled corrections of production are the same as sampled em configs of iteration
+                setSampling(*self.sampling, iteration_no=self.first_iteration_no + k)
+            em.randomizeAvgProductionCorrections(self.country)
+            month_production = numpy.array([0] + [em.getAvProductionDayPerKw(m) for m in range(1, 13)])
+            interannual_variability = normalShock(0, em.interannual_variability_std, self.years_number)
+            dust_uncertainty = normalShock(0, em.dust_uncertainty_std, self.years_number)
+            snow_uncertainty = normalShock(0, em.snow_uncertainty_std, self.years_number)
+            correction = ((1 + em.data_uncertainty) * (1 + em.transposition_model_uncertainty) *
+                          (1 + em.long_term_irradiation_uncertainty))
+            yearly_correction = (1 + interannual_variability) * (1 + dust_uncertainty) * (1 + snow_uncertainty)
+            avg_production.append(month_production[self.day_month] * correction * yearly_correction[self.day_year])
+            weather_shock.append(correction * yearly_correction[self.day_year].mean() / em.getExpectedAvgProductionCorrection(self.country) - 1)
+        setSampling('random')
+        self.avg_production_day_per_kW = numpy.array(avg_production)
+        self.weather_shock = numpy.array(weather_shock)
+
+    def generateElectricityPrices(self):
+        """Generates market electricity prices (iterations x days), same model as
+        ElectricityMarketPriceSimulation.calcPriceWholePeriod"""
+        K, N = self.iterations_number, self.days_number
+        S0 = self.iterationsColumn(self.ecm_configs, 'S0')
+        theta_log = self.iterationsColumn(self.ecm_configs, 'theta_log')
+        sigma_log = self.iterationsColumn(self.ecm_configs, 'sigma_log')
+        lambda_log = self.iterationsColumn(self.ecm_configs, 'lambda_log')
+
+        if self.sampling is not None or self.importance_sampling:
+            y = numpy.array(self.sampled_y)
+        else:
+            y = numpy.array(get_random_config_values(self.raw_ecm_config, 'ELECTRICITY_MARKET_PRICE_SIMULATION.y', K, float))
+        self.price_drift = y  # drift of prices of iterations (saved with iteration)
+        y_annual = numpy.array([normalShock(c.y_annual_mean, c.y_annual_std, self.years_number) for c in self.ecm_configs])
+        theta_delta = numpy.log1p(y[:, None] * y_annual[:, self.day_year] / 260)
+        theta = theta_log + numpy.cumsum(theta_delta, axis=1) - theta_delta  #theta used at each day
+
+        noise = normalShock(loc=0, scale=1, size=(K, N))
+        prices_log = numpy.log(S0) * numpy.ones((K, N))
+        business_days = numpy.flatnonzero(self.weekday)
+        self.price_shock = numpy.zeros(K)  # average part of log price made by shocks, same as ElectricityMarketPriceSimulation
+        for k in range(K):  #on business days: price_log = (1 - lambda) * prev_price_log + lambda * theta + sigma * Z
+            a = 1 - lambda_log[k, 0]
+            x = lambda_log[k, 0] * theta[k, business_days] + sigma_log[k, 0] * noise[k, business_days]
+            prices_log[k, business_days] = lfilter([1], [1, -a], x, zi=[a * log(S0[k, 0])])[0]
+            self.price_shock[k] = lfilter([1], [1, -a], sigma_log[k, 0] * noise[k, business_days]).mean()
+        last_business_day = numpy.maximum.accumulate(numpy.where(self.weekday, self.days, 0))
+        self.electricity_market_prices = numpy.exp(prices_log[:, last_business_day])  #price is not changing in weekends
+
+    ######################### TECHNOLOGY ######################################
+
+    def assemblePlants(self):
+        """Draws equipment of plant for each iteration, same as TechnologyModule.assembleSystem"""
+        self.plants = []
+        for k in range(self.iterations_number):
+            setLikelihoodRatios(self.log_likelihood_ratios[k])
+            self.plants.append(self.assemblePlant(self.main_configs[k], self.tm_configs[k]))
+        self.investments = numpy.array([p['investments'] for p in self.plants])
+
+    def assemblePlant(self, main, tm):
+        """return  dict with equipment of one plant"""
+        start, end = main.getFirstDayProduction(), main.getEndDate()
+        groups, modules = tm.groups_number, tm.modules_in_group
+        count = groups * modules
+        raw = self.raw_tm_config
+
+        degradation = numpy.array(get_random_config_values(raw, 'SOLAR_MODULE.PV_degradation_rate', count, 'float_percent'))
+        power = numpy.array(get_random_config_values(raw, 'SOLAR_MODULE.power', count, float))
+        albedo_error = numpy.array(get_random_config_values(raw, 'SYSTEM.albedo_error', count, float))
+        efficiency = tm.module_power_efficiency * (1 + tm.modelling_error) * (1 + albedo_error)
+        inverter_efficiency = 1 - numpy.array(get_random_config_values(raw, 'INVERTER.power_losses', groups, 'float_percent'))
+
+        solar_modules = [Equipment(EQ.SOLAR_MODULE, efficiency[i], tm.module_price, tm.module_mtbde, tm.module_mttr, start, end)
+                         for i in range(count)]
+        inverters = [Equipment(EQ.INVERTER, inverter_efficiency[g], tm.inverter_price, tm.inverter_mtbde, tm.inverter_mttr, start, end)
+                     for g in range(groups)]
+        grid = Equipment(EQ.GRID_CONNECTION, tm.grid_power_efficiency, tm.grid_price, tm.grid_mtbde, tm.grid_mttr, start, end)
+        transformer = None
+        if tm.transformer_present:
+            transformer = Equipment(EQ.TRANSFORMER, tm.transformer_power_efficiency, tm.transformer_price,
+                                    tm.transformer_mtbde, tm.transformer_mttr, start, end)
+
+        investments = (tm.module_price * count + tm.inverter_price * groups + grid.getInvestmentCost() +
+                       (transformer.getInvestmentCost() if transformer is not None else 0) +
+                       tm.documentation_price + tm.other_investment_costs)
+
+        return {'groups': groups, 'modules_in_group': modules,
+                'degradation': degradation, 'power': power, 'efficiency': efficiency,
+                'solar_modules': solar_modules, 'inverters': inverters, 'grid': grid, 'transformer': transformer,
+                'investments': investments, 'total_nominal_power': count * tm.module_nominal_power}
+
+    def notWorkingDays(self, equipment):
+        """return  bool array of days when @equipment is in one of its failure intervals"""
+        delta = numpy.zeros(self.days_number + 1)
+        for failure, repair in equipment.failure_intervals:
+            delta[min(max(self.dayNo(failure), 0), self.days_number)] += 1
+            delta[min(max(self.dayNo(repair), 0), self.days_number)] -= 1
+        return numpy.cumsum(delta[:-1]) > 0
+
+    def calcPlantProduction(self, k):
+        """return  electricity production of plant for all days of iteration @k, same as
+        PlantEquipment.getElectricityProduction1Day for each day"""
+        plant = self.plants[k]
+        first_day_production = self.dayNo(self.main_configs[k].getFirstDayProduction())
+        days_since_start = self.days - first_day_production
+        modules = plant['modules_in_group']
+
+        groups_production = numpy.zeros(self.days_number)
+        for g, inverter in enumerate(plant['inverters']):
+            group = slice(g * modules, (g + 1) * modules)
+            degradation = plant['degradation'][group]
+            conservation = numpy.maximum(0, 1 - numpy.outer(degradation / 365.0, days_since_start))
+            for i, solar_module in enumerate(plant['solar_modules'][group]):
+                if solar_module.failure_intervals:
+                    conservation[i, self.notWorkingDays(solar_module)] = 0
+            module_production = (plant['power'][group] * plant['efficiency'][group]).dot(conservation)
+            inverter_working = ~self.notWorkingDays(inverter)
+            groups_production += module_production * inverter.efficiency * inverter_working
+
+        ac_working = ~self.notWorkingDays(plant['grid'])
+        ac_efficiency = plant['grid'].efficiency
+        if plant['transformer'] is not None:
+            ac_working &= ~self.notWorkingDays(plant['transformer'])
+            ac_efficiency *= plant['transformer'].efficiency
+
+        production = self.avg_production_day_per_kW[k] * groups_production * ac_efficiency * ac_working
+        production[:first_day_production] = 0
+        return production
+
+    def calcElectricityProduction(self):
+        """Calculates electricity production (iterations x days)"""
+        self.electricity_production = numpy.array([self.calcPlantProduction(k) for k in range(self.iterations_number)])
+
+    def calcPlantMonthlyProduction(self, k):
+        """return  electricity production and number of days when AC transmission is not working in each month of
+        iteration @k, coarse model of calcPlantProduction - degradation of modules is taken in the middle of production days
+        of month, failures of equipment reduce production by their share of production days of month"""
+        plant = self.plants[k]
+        first_day_production = self.dayNo(self.main_configs[k].getFirstDayProduction())
+        producing = self.days >= first_day_production
+        days_number = numpy.add.reduceat(producing, self.month_start_days).astype(float)
+        days_divider = numpy.maximum(days_number, 1)
+        days_since_start = numpy.add.reduceat(numpy.where(producing, self.days, 0), self.month_start_days) / days_divider - first_day_production
+        not_working_share = lambda not_working: numpy.add.reduceat(not_working & producing, self.month_start_days) / days_divider
+        modules = plant['modules_in_group']
+
+        groups_production = numpy.zeros(self.months_number)
+        for g, inverter in enumerate(plant['inverters']):
+            group = slice(g * modules, (g + 1) * modules)
+            degradation = plant['degradation'][group]
+            conservation = numpy.maximum(0, 1 - numpy.outer(degradation / 365.0, days_since_start))
+            for i, solar_module in enumerate(plant['solar_modules'][group]):
+                if solar_module.failure_intervals:
+                    conservation[i] *= 1 - not_working_share(self.notWorkingDays(solar_module))
+            module_production = (plant['power'][group] * plant['efficiency'][group]).dot(conservation)
+            groups_production += module_production * inverter.efficiency * (1 - not_working_share(self.notWorkingDays(inverter)))
+
+        ac_not_working = self.notWorkingDays(plant['grid'])
+        ac_efficiency = plant['grid'].efficiency
+        if plant['transformer'] is not None:
+            ac_not_working |= self.notWorkingDays(plant['transformer'])
+            ac_efficiency *= plant['transformer'].efficiency
+        ac_not_working_days = not_working_share(ac_not_working) * days_number
+
+        avg_production_day_per_kW = self.avg_production_day_per_kW[k, self.month_start_days]  # the same in all days of month
+        production = avg_production_day_per_kW * groups_production * ac_efficiency * (days_number - ac_not_working_days)
+        return production, ac_not_working_days
+
+    @timed('coarse_production')
+    def calcMonthlyElectricityProduction(self):
+        """Calculates electricity production and days of not working AC transmission (iterations x months) by coarse
+        monthly model (see calcPlantMonthlyProduction), cost of daily production loop is avoided"""
+        production, not_working_days = zip(*[self.calcPlantMonthlyProduction(k) for k in range(self.iterations_number)])
+        self.monthly_electricity_production = numpy.array(production)
+        self.monthly_not_working_days = numpy.array(not_working_days)
+
+    ######################### ECONOMIC ######################################
+
+    @timed('prices')
+    def calcActualElectricityPrices(self):
+        """Calculates prices of sold electricity (iterations x days), same as EconomicModule.actual_electricity_prices:
+        before subsidy - market price at first day of construction, during subsidy - FIT,
+        after subsidy - yearly contract price (market price at the day of signing contract)"""
+        prices = numpy.empty((self.iterations_number, self.days_number))
+        for k in range(self.iterations_number):
+            market = self.electricity_market_prices[k]
+            sm = self.sm_configs[k]
+            subsidy_start, subsidy_end = self.dayNo(sm.first_day_subsidy), self.dayNo(sm.last_day_subsidy)
+            first_day_construction = self.dayNo(self.main_configs[k].getFirstDayConstruction())
+
+            contract_start_dates = []
+            new_price_start_date = sm.last_day_subsidy + relativedelta(days=1)
+            while new_price_start_date <= self.end_date:
+                contract_start_dates.append(self.dayNo(new_price_start_date))
+                next_year = new_price_start_date.year + 1
+                try:
+                    new_price_start_date = new_price_start_date.replace(year=next_year)
+                except ValueError:
+                    new_price_start_date = new_price_start_date.replace(year=next_year, day=new_price_start_date.day - 1)
+            contract_start_days = numpy.array(contract_start_dates, dtype=int)
+
+            prices[k] = market[first_day_construction]
+            prices[k, max(subsidy_start, 0):subsidy_end + 1] = sm.MWhFIT
+            if len(contract_start_days):
+                after_subsidy = self.days[max(contract_start_days[0], subsidy_start):]
+                contract_no = numpy.searchsorted(contract_start_days, after_subsidy, side='right') - 1
+                prices[k, after_subsidy] = market[contract_start_days[contract_no] - 1]
+        self.actual_electricity_prices = prices
+
+    def calcMonthlyRevenuesAndCosts(self):
+        """Calculates monthly revenues and costs (iterations x months) that do not depend on previous months"""
+        K, N = self.iterations_number, self.days_number
+        days = self.days[None, :]
+        last_day_permit = numpy.array([self.dayNo(m.getLastDayPermitProcurement()) for m in self.main_configs])[:, None]
+        last_day_construction = numpy.array([self.dayNo(m.getLastDayConstruction()) for m in self.main_configs])[:, None]
+        production_started = days > last_day_construction
+
+        if self.coarse:  # monthly production is sold by average price of production days of month
+            first_day_production = last_day_construction + 1
+            production_days = self.monthlySum(numpy.ones((K, 1)) * (days >= first_day_production))
+            prices = self.monthlySum(numpy.where(days >= first_day_production, self.actual_electricity_prices, 0))
+            self.revenue_electricity = self.monthly_electricity_production * prices / numpy.maximum(production_days, 1) / 1000.0
+        else:
+            self.revenue_electricity = self.monthlySum(self.electricity_production * self.actual_electricity_prices / 1000.0)
+        self.revenue_subsidy = numpy.zeros((K, self.months_number))
+        self.revenue = self.revenue_electricity + self.revenue_subsidy
+
+        dev_permit = self.iterationsColumn(self.ecm_configs, 'developmentCostDuringPermitProcurement')
+        dev_construction = self.iterationsColumn(self.ecm_configs, 'developmentCostDuringConstruction')
+        construction = (days > last_day_permit) & ~production_started
+        self.development_cost = self.monthlySum(
+            numpy.where(construction, dev_construction, numpy.where(production_started, 0, dev_permit)) / self.days_in_month)
+
+        insurance_end = numpy.array([self.dayNo(m.getLastDayConstruction() + relativedelta(years=c.insuranceDurationEquipment))
+                                     for m, c in zip(self.main_configs, self.ecm_configs)])[:, None]
+        insurance_fee = self.iterationsColumn(self.ecm_configs, 'insuranceFeeEquipment') * self.investments[:, None] / 365
+        self.insurance_cost = self.monthlySum(
+            numpy.where((days >= last_day_construction) & (days <= insurance_end), insurance_fee, 0))
+
+        admin_costs = self.iterationsColumn(self.ecm_configs, 'administrativeCosts')
+        admin_growth = self.iterationsColumn(self.ecm_configs, 'administrativeCostsGrowth_rate')
+        disposal = numpy.array([c.pvequipment_disposal * p['total_nominal_power'] for c, p in zip(self.enm_configs, self.plants)])
+        operational = admin_costs * (1 + admin_growth) ** self.day_year / self.days_in_month
+        operational[:, -1] += disposal  # at the last day of operation add costs for equimpent disposal
+        self.operational_cost = self.monthlySum(numpy.where(production_started, operational, 0))
+
+        self.repair_costs_modules = numpy.zeros((K, self.months_number))
+        self.inverter_repairs = [[] for m in range(self.months_number)]  #(day, iteration, inverter) events by months
+        for k in range(K):
+            self.prepareRepairs(k)
+
+        self.depreciation = numpy.zeros((K, self.months_number))
+        self.interest_paid = numpy.zeros((K, self.months_number))
+        self.investment = numpy.zeros((K, self.months_number))
+        self.paid_in_monthly = numpy.zeros((K, self.months_number))
+        self.long_term_loan = numpy.zeros((K, self.months_number))
+        self.initial_paid_in_capital = self.iterationsColumn(self.ecm_configs, 'initial_paid_in_capital')[:, 0]
+        for k in range(K):
+            financing = FinancingSchedule(self.main_configs[k], self.ecm_configs[k].getConfigsValues(), self.investments[k])
+            first_day_production = financing.last_day_construction + datetime.timedelta(days=1)
+            for m, end_day in enumerate(self.month_end_dates):
+                cur_month = monthsBetween(first_day_production, end_day)
+                if cur_month > 0 and cur_month <= financing.Depreciation_duration:
+                    self.depreciation[k, m] = financing.Depreciation_monthly
+                self.interest_paid[k, m] = financing.debt_percents.get(end_day, 0)
+                self.investment[k, m] = financing.investments_monthly.get(end_day, 0)
+                self.paid_in_monthly[k, m] = financing.paid_in_monthly.get(end_day, 0)
+                self.long_term_loan[k, m] = financing.debt_rest_payments_principal.get(end_day, 0)
+
+    def prepareRepairs(self, k):
+        """Calculates repair costs of solar modules and prepares inverter repairs of iteration @k,
+        same as TechnologyModule.getRepairCostsModules and getRepairCostsInverters"""
+        tm = self.tm_configs[k]
+        raw = self.raw_tm_config
+        first_day_construction = self.dayNo(self.main_configs[k].getFirstDayConstruction())
+        for solar_module in self.plants[k]['solar_modules']:
+            for failure, repair in solar_module.failure_intervals:
+                repair_day = self.dayNo(repair)
+                repair_costs = get_random_config_values(raw, 'SOLAR_MODULE.repair_costs', 1, float)[0]
+                if repair_day - first_day_construction > 365 * tm.module_guarantee_length:  # not in guarantee period
+                    repair_costs += tm.module_price
+                self.repair_costs_modules[k, self.day_month_no[repair_day]] += repair_costs
+
+        for inverter_no, inverter in enumerate(self.plants[k]['inverters']):
+            for failure, repair in inverter.failure_intervals:
+                repair_day = self.dayNo(repair)
+                self.inverter_repairs[self.day_month_no[repair_day]].append((repair_day, k, inverter_no))
+
+    def calcRepairCostsInverters(self, month_no, prev_year_ebitda, abandoned):
+        """return  array with repair costs of inverters in month @month_no for all iterations.
+        If repair is too expensive comparing to previous year ebitda - inverter is abandoned till end of project
+        (the same rule as in TechnologyModule.getRepairCostsInverters)"""
+        repair_costs = numpy.zeros(self.iterations_number)
+        start_year = self.start_date.year
+        events = self.inverter_repairs[month_no]
+        events.sort()
+        for repair_day, k, inverter_no in events:  # events added to the last month while iterating are also checked
+            if abandoned.get((k, inverter_no), repair_day) != repair_day:
+                continue
+            tm = self.tm_configs[k]
+            date = self.dates[repair_day]
+            inverter_repair_costs = get_random_config_values(self.raw_tm_config, 'INVERTER.repair_costs', 1, float)[0]
+            years_till_end = self.end_date.year - date.year
+            if ((date.year - start_year >= 5) and
+                    (inverter_repair_costs > prev_year_ebitda[k] * 0.3 * years_till_end)):
+                last_day_event = (self.days_number - 1, k, inverter_no)
+                abandoned[(k, inverter_no)] = self.days_number - 1  # only one more repair check at the end of project
+                if last_day_event not in self.inverter_repairs[-1]:
+                    self.inverter_repairs[-1].append(last_day_event)
+            else:
+                repair_costs[k] += inverter_repair_costs
+                first_day_construction = self.dayNo(self.main_configs[k].getFirstDayConstruction())
+                if repair_day - first_day_construction > 365 * tm.inverter_guarantee_length:  # not in guarantee period
+                    repair_costs[k] += tm.inverter_price
+        return repair_costs
+
+    def calcReportValues(self):
+        """Calculates monthly balance sheet and FCF for all iterations, month by month, same as Report.calcReportValues"""
+        K, M = self.iterations_number, self.months_number
+        tax_rate = self.iterationsColumn(self.ecm_configs, 'tax_rate')[:, 0]
+        capital = self.initial_paid_in_capital
+
+        self.repair_costs_inverters = numpy.zeros((K, M))
+        self.cost = numpy.zeros((K, M))
+        self.ebitda = numpy.zeros((K, M))
+        self.ebit = numpy.zeros((K, M))
+        self.tax = numpy.zeros((K, M))
+        self.net_earning = numpy.zeros((K, M))
+        self.fcf_project = numpy.zeros((K, M))
+        self.fcf_project_before_tax = numpy.zeros((K, M))
+        self.fcf_owners = numpy.zeros((K, M))
+        self.fcf_project_y, self.fcf_owners_y, self.ebitda_y = [], [], []
+
+        zeros = numpy.zeros(K)
+        prev = dict(fixed_asset=zeros, operating_receivable=zeros, short_term_debt_suppliers=zeros, revenue=zeros,
+                    cost=zeros, paid_in_capital=capital, asset_bank_account=capital, short_term_loan=zeros,
+                    unallocated_earning=zeros, net_earning=zeros)
+        prev_year_ebitda = zeros
+        year_ebitda, year_ebt, year_fcf_project, year_fcf_owners = zeros, zeros, zeros, zeros
+        abandoned_inverters = {}
+
+        for m in range(M):
+            self.repair_costs_inverters[:, m] = self.calcRepairCostsInverters(m, prev_year_ebitda, abandoned_inverters)
+            cost = (self.insurance_cost[:, m] + self.development_cost[:, m] + self.operational_cost[:, m] +
+                    self.repair_costs_modules[:, m] + self.repair_costs_inverters[:, m])
+            revenue = self.revenue[:, m]
+            ebitda = revenue - cost
+            ebit = ebitda - self.depreciation[:, m]
+            ebt = ebit - self.interest_paid[:, m]
+            year_ebitda, year_ebt = year_ebitda + ebitda, year_ebt + ebt
+
+            tax = tax_rate * year_ebt if self.december[m] else zeros
+            net_earning = ebt - tax
+            fixed_asset = prev['fixed_asset'] + self.investment[:, m] - self.depreciation[:, m]
+            operating_receivable = revenue + prev['revenue']
+            paid_in_capital = prev['paid_in_capital'] + self.paid_in_monthly[:, m]
+            unallocated_earning = prev['unallocated_earning'] + prev['net_earning']
+            equity = paid_in_capital + net_earning + unallocated_earning
+            short_term_debt_suppliers = cost + prev['cost']
+
+            help = (fixed_asset + operating_receivable - equity - self.long_term_loan[:, m] - short_term_debt_suppliers +
+                    prev['asset_bank_account'] - prev['short_term_loan'])
+            decr_bank_assets_pos = numpy.minimum(help, prev['asset_bank_account'] - MIN_OST)
+            decr_st_loans_pos = numpy.minimum(prev['short_term_loan'], -help + numpy.maximum(decr_bank_assets_pos, 0))
+            decr_st_loans_neg = numpy.minimum(prev['short_term_loan'], -help)
+            decr_st_loans = numpy.where(help > 0, decr_st_loans_pos, decr_st_loans_neg)
+            decr_bank_assets = numpy.where(help > 0, decr_bank_assets_pos, help + decr_st_loans_neg)
+            short_term_loan = prev['short_term_loan'] - decr_st_loans
+            asset_bank_account = prev['asset_bank_account'] - decr_bank_assets
+
+            delta_assets = ((fixed_asset - prev['fixed_asset']) + (operating_receivable - prev['operating_receivable']) -
+                            (short_term_debt_suppliers - prev['short_term_debt_suppliers']))
+            self.fcf_project[:, m] = net_earning - delta_assets + self.interest_paid[:, m]
+            self.fcf_project_before_tax[:, m] = ebit - delta_assets
+            if m == 0:
+                self.fcf_owners[:, m] = - paid_in_capital
+            else:
+                self.fcf_owners[:, m] = (- (paid_in_capital - prev['paid_in_capital']) +
+                                         (asset_bank_account - prev['asset_bank_account']))
+
+            self.cost[:, m], self.ebitda[:, m], self.ebit[:, m] = cost, ebitda, ebit
+            self.tax[:, m], self.net_earning[:, m] = tax, net_earning
+            year_fcf_project = year_fcf_project + self.fcf_project[:, m]
+            year_fcf_owners = year_fcf_owners + self.fcf_owners[:, m]
+            if self.december[m]:
+                self.ebitda_y.append(year_ebitda)
+                self.fcf_project_y.append(year_fcf_project)
+                self.fcf_owners_y.append(year_fcf_owners)
+                prev_year_ebitda = year_ebitda
+                year_ebitda, year_ebt, year_fcf_project, year_fcf_owners = zeros, zeros, zeros, zeros
+
+            prev = dict(fixed_asset=fixed_asset, operating_receivable=operating_receivable,
+                        short_term_debt_suppliers=short_term_debt_suppliers, revenue=revenue, cost=cost,
+                        paid_in_capital=paid_in_capital, asset_bank_account=asset_bank_account,
+                        short_term_loan=short_term_loan, unallocated_earning=unallocated_earning, net_earning=net_earning)
+
+        self.ebitda_y = numpy.array(self.ebitda_y).T
+        self.fcf_project_y = numpy.array(self.fcf_project_y).T
+        self.fcf_owners_y = numpy.array(self.fcf_owners_y).T
+
+    ######################### IRR, NPV, TEP ######################################
+
+    def yearlyIrr(self, irrs):
+        """Converts monthly irrs (None replaced with -1) to yearly, same as Report.calcIRR"""
+        irrs = numpy.array([irr if irr is not None else -1 for irr in irrs], dtype=float)
+        with numpy.errstate(all='ignore'):
+            return irrs, ((1 + irrs) ** 12) - 1
+
+    @timed('irr')
+    def calcIRR(self):
+        """Calculates IRR for project and owners for all iterations"""
+        self.irr_owners, self.irr_owners_y = self.yearlyIrr(irrVectorized(self.fcf_owners))
+        self.irr_project, self.irr_project_y = self.yearlyIrr(irrVectorized(self.fcf_project))
+        self.irr_project_before_tax, self.irr_project_before_tax_y = self.yearlyIrr(irrVectorized(self.fcf_project_before_tax))
+
+        paid_back = numpy.cumsum(self.fcf_project, axis=1) > 0
+        self.simple_payback_time = numpy.where(paid_back.any(axis=1), paid_back.argmax(axis=1) / 12.0, -1.0)
+
+    def calcNPV(self):
+        """Calculates WACC and NPV for project and owners for all iterations, same as Report.calcWACC and calcNPV"""
+        share_debt = self.iterationsColumn(self.ecm_configs, 'debt_share')[:, 0]
+        cost_debt = self.iterationsColumn(self.ecm_configs, 'debt_rate')[:, 0]
+        tax_rate = self.iterationsColumn(self.ecm_configs, 'tax_rate')[:, 0]
+
+        self.wacc_y = share_debt * cost_debt * (1 - tax_rate)
+        self.wacc = (1 + self.wacc_y) ** (1 / 12.0) - 1
+
+        self.npv_owners = npvVectorized(self.wacc, self.fcf_owners)
+        self.npv_project = npvVectorized(self.wacc, self.fcf_project)
+        self.npv_owners_y = npvVectorized(self.wacc_y, self.fcf_owners_y)
+        self.npv_project_y = npvVectorized(self.wacc_y, self.fcf_project_y)
+
+    def calcTEP(self):
+        """Calculates total energy production and days of system not working, same as Report.calcTEP"""
+        last_day_construction = numpy.array([self.dayNo(m.getLastDayConstruction()) for m in self.main_configs])[:, None]
+        second_year = numpy.array([m.getLastDayConstruction().year + 1 - self.start_date.year for m in self.main_configs])[:, None]
+
+        if self.coarse:  # only days of not working AC transmission are counted
+            production = self.monthly_electricity_production
+            self.system_not_working = self.monthly_not_working_days.sum(axis=1)
+            production_year = self.day_year[self.month_start_days]
+        else:
+            production = self.electricity_production
+            self.system_not_working = ((self.days > last_day_construction) & (production < 1e-9)).sum(axis=1)
+            production_year = self.day_year
+        self.total_energy_produced = production.sum(axis=1) / 1000  # [kWh] -> [MWh]
+        self.electricity_production_2ndyear = numpy.where(production_year == second_year, production, 0).sum(axis=1) / 1000.0
+        self.total_power = numpy.array([p['power'].sum() for p in self.plants])
+
+    def calcControlVariates(self):
+        """Calculates relative deviation of FIT from its expected value, same as Report.calcControlVariates
+        (weather_shock and price_shock are calculated with weather and prices)"""
+        self.fit_shock = numpy.array([sm.MWhFIT / sm.getExpectedMWhFIT(self.country) - 1 for sm in self.sm_configs])
+
+    def calcWeights(self):
+        """Calculates likelihood ratio of tilted draws of each iteration (1 without importance sampling)"""
+        self.weight = numpy.array([getLikelihoodRatio(ratios) for ratios in self.log_likelihood_ratios])
+
+    ######################### RESULTS ######################################
+
+    def getResults(self):
+        """return  list with irr and tep values of each iteration, in the same order as Iteration.getResults"""
+        columns = [getattr(self, field) for field in IRR_REPORT_FIELDS + TEP_REPORT_FIELDS]
+        return [[float(c[k]) for c in columns] for k in range(self.iterations_number)]
+
+    def getResultsMatrix(self):
+        """return  array with values of RESULTS_FIELDS, row for each iteration"""
+        return numpy.array([getattr(self, field) for field in RESULTS_FIELDS], dtype=float).T
+
+    @timed('serialization')
+    def getIterationLines(self):
+        """return  list with iteration results prepared for saving to database - configs, irr, npv and tep values"""
+        lines = []
+        results = self.getResults()
+        for k in range(self.iterations_number):
+            plant = self.plants[k]
+            line = dict()
+            line["simulation"] = self.simulation_no
+            line["iteration"] = self.first_iteration_no + k
+            line["engine"] = "vectorized"
+
+            line["main_configs"] = self.main_configs[k].getConfigsValues()
+            line["ecm_configs"] = self.ecm_configs[k].getConfigsValues()
+            line["tm_configs"] = self.tm_configs[k].getConfigsValues()
+            line["sm_configs"] = self.sm_configs[k].getConfigsValues()
+            line["em_configs"] = self.em_configs[k].getConfigsValues()
+            line["enm_configs"] = self.enm_configs[k].getConfigsValues()
+            line["price_drift"] = float(self.price_drift[k])  # y of ecm_configs is not used for prices
+
+            for field in ['irr_project', 'irr_project_before_tax', 'irr_owners', 'irr_project_y', 'irr_project_before_tax_y',
+                          'irr_owners_y', 'npv_project', 'npv_owners', 'npv_project_y', 'npv_owners_y', 'wacc',
+                          'wacc_y', 'simple_payback_time'] + TEP_REPORT_FIELDS:
+                line[field] = float(getattr(self, field)[k])
+
+            line["results"] = results[k]  # irr and tep values for simulation stats
+            line["control_variates"] = [float(getattr(self, field)[k]) for field in CONTROL_VARIATE_FIELDS]
+            line["weight"] = float(self.weight[k])
+            line["calculation_time"] = self.seconds_per_iteration
+            if self.level is not None:
+                line["level"] = self.level
+                line["coarse_results"] = self.coarse_results[k]  # irr and tep values of coarse model
+                line["coarse_calculation_time"] = self.coarse_seconds_per_iteration
+
+            line["average_degradation_rate"] = float(numpy.average(plant['degradation']))
+            line["average_power_ratio"] = float(numpy.average(plant['power']) / self.tm_configs[k].module_nominal_power)
+            line["total_investment_cost"] = float(plant['investments'])
+            line["pvequipment_disposal"] = float(self.enm_configs[k].pvequipment_disposal * plant['total_nominal_power'])
+
+            line["fcf_project_y"] = self.fcf_project_y[k].tolist()
+            line["fcf_owners_y"] = self.fcf_owners_y[k].tolist()
+            line["ebitda_y"] = self.ebitda_y[k].tolist()
+            lines.append(convertValue(line))
+        return lines